@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+配置处理性能测试工具
+生成模拟的Clash订阅配置，对比纯Python、libyaml和流式加载的耗时与内存峰值，
+并分阶段测试配置生成流程（加载、节点规范化、规则编译、生成、写出），结果可保存为JSON用于版本间对比
+"""
+
+import io
+import os
+import sys
+import copy
+import json
+import time
+import platform
+import argparse
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+import yaml
+from yaml_io import LIBYAML, YamlLoader, YamlDumper, load_yaml_streaming
+
+# 分阶段测试的默认节点规模
+PIPELINE_SIZES = [100, 1000, 10000, 100000]
+
+def make_synthetic_config(proxy_count, rules_per_proxy=5, duplicate_every=0):
+    """生成模拟配置：proxy_count 个节点、按比例的代理组和规则
+
+    duplicate_every 大于0时，每隔该数量的节点有一个与前一节点服务器相同的重复节点（模拟合并的订阅）。
+    """
+    proxies = []
+    for i in range(proxy_count):
+        source = i - 1 if duplicate_every and i % duplicate_every == duplicate_every - 1 else i
+        proxies.append({
+            'name': f"🇭🇰 节点-{i:06d}",
+            'type': ('ss', 'vmess', 'trojan')[source % 3],
+            'server': f"node{source}.example.com",
+            'port': 10000 + source % 50000,
+            'cipher': 'aes-256-gcm',
+            'password': f"pass-{source:08x}",
+            'udp': True
+        })
+    names = [p['name'] for p in proxies]
+    group_size = 50
+    groups = [{'name': 'Proxy', 'type': 'select', 'proxies': ['Auto - UrlTest'] + names}]
+    groups.append({'name': 'Auto - UrlTest', 'type': 'url-test', 'proxies': names,
+                   'url': 'http://www.gstatic.com/generate_204', 'interval': 300})
+    groups += [
+        {'name': f"Region-{g}", 'type': 'select', 'proxies': names[g:g + group_size]}
+        for g in range(0, proxy_count, group_size)
+    ]
+    rules = [
+        f"DOMAIN-SUFFIX,site{i}.example.{('com', 'net', 'org')[i % 3]},{'Proxy' if i % 2 else 'DIRECT'}"
+        for i in range(proxy_count * rules_per_proxy)
+    ] + ['GEOIP,CN,DIRECT', 'MATCH,Proxy']
+    return {
+        'port': 7890,
+        'mode': 'Rule',
+        'proxies': proxies,
+        'proxy-groups': groups,
+        'rules': rules
+    }
+
+def measure(func, repeat=1, setup=None):
+    """执行函数，返回 (结果, 最短耗时秒, tracemalloc内存峰值字节)
+
+    指定 setup 时每次执行前调用它准备参数（不计入耗时和内存），并以其返回值调用 func。
+    """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        args = (setup(),) if setup else ()
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    args = (setup(),) if setup else ()
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, best, peak
+
+def bench_yaml(proxy_count, repeat=1):
+    """对比不同YAML加载/输出方式"""
+    config = make_synthetic_config(proxy_count)
+    text = yaml.dump(config, Dumper=YamlDumper, allow_unicode=True, sort_keys=False)
+    print(f"📄 模拟配置: {proxy_count} 个节点, {len(config['rules'])} 条规则, {len(text) / 1024 / 1024:.1f}MB")
+
+    cases = [('load 纯Python SafeLoader', lambda: yaml.load(text, Loader=yaml.SafeLoader))]
+    if LIBYAML:
+        cases.append(('load libyaml CSafeLoader', lambda: yaml.load(text, Loader=YamlLoader)))
+    cases.append(('load 流式(跳过rules)', lambda: load_yaml_streaming(io.StringIO(text))))
+    cases.append(('dump 纯Python SafeDumper',
+                  lambda: yaml.dump(config, Dumper=yaml.SafeDumper, allow_unicode=True, sort_keys=False)))
+    if LIBYAML:
+        cases.append(('dump libyaml CSafeDumper',
+                      lambda: yaml.dump(config, Dumper=YamlDumper, allow_unicode=True, sort_keys=False)))
+
+    results = {}
+    for name, func in cases:
+        _, seconds, peak = measure(func, repeat)
+        results[name] = (seconds, peak)
+        print(f"   {name:<28} {seconds * 1000:>9.0f}ms   峰值内存 {peak / 1024 / 1024:>7.1f}MB")
+
+    baseline = results['load 纯Python SafeLoader'][0]
+    for name in ('load libyaml CSafeLoader', 'load 流式(跳过rules)'):
+        if name in results:
+            print(f"   {name} 相对纯Python加速: {baseline / results[name][0]:.1f}x")
+    return results
+
+def bench_pipeline(proxy_count, repeat=1):
+    """分阶段测试配置生成流程，返回 [{'proxies', 'stage', 'seconds', 'peak_bytes'}]
+
+    在临时目录中运行，不会读写当前目录下的密钥、规则命中统计和生成的配置。
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            return run_pipeline_stages(make_synthetic_config(proxy_count, duplicate_every=10), repeat)
+        finally:
+            os.chdir(cwd)
+
+def run_pipeline_stages(config, repeat=1):
+    """在当前目录中逐个阶段测试
+
+    generate 保留源配置的规则（与 --rule-providers 相同的路径），规则编译的耗时随规模计入；
+    load-stream 跳过 rules 段，工作量少于 load，两者的差异不只是加载方式。
+    """
+    import start_clash_docker as scd
+    from proxy_normalizer import normalize_proxies
+    from rule_compiler import compile_rules
+
+    source = os.path.abspath("source.yaml")
+    with open(source, 'w', encoding='utf-8') as f:
+        yaml.dump(config, f, Dumper=YamlDumper, allow_unicode=True, sort_keys=False)
+    with open(scd.SECRET_FILE, 'w') as f:
+        f.write("benchmark")
+    proxy_count = len(config['proxies'])
+    print(f"📄 模拟配置: {proxy_count} 个节点, {len(config['proxy-groups'])} 个代理组, "
+          f"{len(config['rules'])} 条规则, {os.path.getsize(source) / 1024 / 1024:.1f}MB")
+
+    # 各阶段的状态输出不计入结果
+    with contextlib.redirect_stdout(io.StringIO()):
+        generated = scd.create_docker_config(copy.deepcopy(config), rule_providers=True)
+    stages = [
+        ('load', lambda: scd.load_config(source, streaming=False), None),
+        ('load-stream', lambda: scd.load_config(source, streaming=True), None),
+        ('normalize', normalize_proxies, lambda: copy.deepcopy(config)),
+        ('compile-rules', lambda: compile_rules(config['rules']), None),
+        ('generate', lambda c: scd.create_docker_config(c, rule_providers=True), lambda: copy.deepcopy(config)),
+        ('write', lambda: scd.save_config(generated, scd.OUTPUT_CONFIG), None)
+    ]
+    results = []
+    for stage, func, setup in stages:
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, seconds, peak = measure(func, repeat, setup)
+        results.append({'proxies': proxy_count, 'stage': stage, 'seconds': round(seconds, 6), 'peak_bytes': peak})
+        print(f"   {stage:<16} {seconds * 1000:>9.0f}ms   峰值内存 {peak / 1024 / 1024:>7.1f}MB")
+    print(f"   注: load-stream 跳过 rules 段（{len(config['rules'])} 条），不与 load 做同等的工作")
+    return results
+
+def git_revision():
+    """当前代码版本，非git目录时返回None"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_results(results, baseline_path):
+    """与之前保存的结果对比，打印每个阶段的耗时和内存变化"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {(r['proxies'], r['stage']): r for r in baseline.get('results', [])}
+    print(f"📊 与 {baseline.get('revision') or baseline_path} 对比:")
+    for r in results:
+        old = previous.get((r['proxies'], r['stage']))
+        if not old or not old['seconds']:
+            continue
+        time_change = (r['seconds'] / old['seconds'] - 1) * 100
+        memory_change = (r['peak_bytes'] / old['peak_bytes'] - 1) * 100 if old['peak_bytes'] else 0
+        print(f"   {r['proxies']:>7} {r['stage']:<16} 耗时 {time_change:>+7.1f}%   峰值内存 {memory_change:>+7.1f}%")
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="配置处理性能测试")
+    parser.add_argument("--proxies", type=int, nargs="+", help="模拟节点数量（默认: yaml为1000 10000，pipeline为100到100000）")
+    parser.add_argument("--repeat", type=int, default=1, help="每项重复次数（取最短耗时）")
+    parser.add_argument("--suite", choices=["yaml", "pipeline"], default="yaml",
+                        help="yaml: 对比YAML实现; pipeline: 分阶段测试配置生成流程")
+    parser.add_argument("--json", dest="json_path", help="将pipeline结果写入JSON文件")
+    parser.add_argument("--compare", help="与之前保存的pipeline JSON结果对比")
+    args = parser.parse_args()
+
+    if args.suite == "yaml":
+        print("⏱️  YAML 加载/输出性能对比")
+        print("=" * 60)
+        if not LIBYAML:
+            print("⚠️  未检测到libyaml，仅测试纯Python实现")
+        for count in args.proxies or [1000, 10000]:
+            bench_yaml(count, args.repeat)
+            print()
+        return
+
+    print("⏱️  配置生成流程分阶段测试")
+    print("=" * 60)
+    results = []
+    for count in args.proxies or PIPELINE_SIZES:
+        results += bench_pipeline(count, args.repeat)
+        print()
+    if args.compare:
+        compare_results(results, args.compare)
+    if args.json_path:
+        report = {
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'libyaml': LIBYAML,
+            'repeat': args.repeat,
+            'results': results
+        }
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存到: {args.json_path}")
+
+if __name__ == "__main__":
+    sys.exit(main())
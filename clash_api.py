@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Clash API 客户端
+共享的连接池、只读取一次的密钥、统一的超时和重试策略
+"""
+
+import os
+import json
+from urllib.parse import quote
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Clash API地址
+CLASH_API = "http://127.0.0.1:9090"
+# 密钥文件及读取失败时的默认密钥
+SECRET_FILE = "clash_secret.txt"
+DEFAULT_SECRET = "dler"
+# 节点延迟测试默认地址
+DELAY_TEST_URL = "http://www.gstatic.com/generate_204"
+# 代理组及内置出站类型，不属于实际节点
+NON_NODE_TYPES = {
+    'Selector', 'URLTest', 'Fallback', 'LoadBalance', 'Relay',
+    'Direct', 'Reject', 'Compatible', 'Pass'
+}
+# 默认请求超时（秒）
+DEFAULT_TIMEOUT = 5
+# 多实例部署时由 start_clash_docker.py 写入的实例列表
+INSTANCES_FILE = "config/instances.json"
+
+def load_secret(path=SECRET_FILE, default=DEFAULT_SECRET):
+    """从本地文件读取密钥，读取失败时返回默认值"""
+    try:
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return f.read().strip() or default
+    except OSError:
+        pass
+    return default
+
+def load_instances(path=INSTANCES_FILE):
+    """返回部署的Clash实例列表 [{'name', 'controller', 'mixed_port', 'socks_port', 'config_dir'}]
+
+    单实例部署（没有实例列表文件）时返回默认的clash容器。
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            instances = json.load(f)
+        if isinstance(instances, list) and instances:
+            return instances
+    except (OSError, ValueError):
+        pass
+    return [{'name': 'clash', 'controller': CLASH_API, 'mixed_port': 7890, 'socks_port': 7891,
+             'config_dir': 'config'}]
+
+class ClashAPI:
+    """Clash外部控制器客户端，所有请求复用同一个keep-alive连接池"""
+
+    def __init__(self, base_url=CLASH_API, secret=None, pool_size=10, timeout=DEFAULT_TIMEOUT, retries=2):
+        self.base_url = base_url.rstrip('/')
+        self.secret = load_secret() if secret is None else secret
+        self.timeout = timeout
+        self.session = requests.Session()
+        # 只对连接失败和网关错误重试，读超时不重试（延迟测试本身可能较慢）
+        retry = Retry(total=retries, connect=retries, read=0, backoff_factor=0.2,
+                      status_forcelist=(502, 503), allowed_methods=('GET', 'PUT'))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # API在本机，不走系统代理
+        self.session.trust_env = False
+        if self.secret:
+            self.session.headers["Authorization"] = f"Bearer {self.secret}"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def request(self, method, path, timeout=None, **kwargs):
+        """发送请求，非2xx响应抛出 requests.HTTPError"""
+        response = self.session.request(method, f"{self.base_url}{path}",
+                                        timeout=timeout or self.timeout, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def version(self):
+        return self.request('GET', '/version', timeout=1).json()
+
+    def proxies(self):
+        """返回 {名称: 代理信息}"""
+        return self.request('GET', '/proxies').json().get('proxies', {})
+
+    def node_names(self):
+        """返回所有实际代理节点名称（排除代理组和内置出站）"""
+        return [name for name, info in self.proxies().items() if info.get('type') not in NON_NODE_TYPES]
+
+    def proxy(self, name):
+        return self.request('GET', f"/proxies/{quote(name, safe='')}").json()
+
+    def delay(self, name, url=DELAY_TEST_URL, timeout_ms=5000):
+        """测试节点延迟，返回毫秒数，超时或失败返回None"""
+        try:
+            response = self.session.get(
+                f"{self.base_url}/proxies/{quote(name, safe='')}/delay",
+                params={'url': url, 'timeout': timeout_ms},
+                timeout=timeout_ms / 1000 + 2
+            )
+            if response.status_code == 200:
+                return response.json().get('delay')
+        except requests.exceptions.RequestException:
+            pass
+        return None
+
+    def select(self, group, name):
+        """切换Selector组的当前节点"""
+        try:
+            self.request('PUT', f"/proxies/{quote(group, safe='')}", json={'name': name})
+            return True
+        except requests.exceptions.RequestException:
+            return False
+
+    def connections(self):
+        """返回当前连接快照 {'downloadTotal', 'uploadTotal', 'connections': [...]}"""
+        data = self.request('GET', '/connections').json()
+        data['connections'] = data.get('connections') or []
+        return data
+
+    def close_connection(self, conn_id):
+        self.request('DELETE', f"/connections/{quote(conn_id, safe='')}")
+
+    def configs(self):
+        return self.request('GET', '/configs').json()
+
+    def reload_config(self, path, force=True):
+        """按容器内路径重新加载配置文件"""
+        self.request('PUT', '/configs', params={'force': 'true' if force else 'false'},
+                     json={'path': path}, timeout=10)
+
+    def stream(self, path, params=None):
+        """跟随流式接口，逐条产出JSON对象"""
+        with self.session.get(f"{self.base_url}{path}", params=params, stream=True,
+                              timeout=(self.timeout, None)) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    def traffic(self):
+        """实时流量，每秒一条 {'up', 'down'}（字节/秒）"""
+        return self.stream('/traffic')
+
+    def logs(self, level='info'):
+        """实时日志 {'type', 'payload'}"""
+        return self.stream('/logs', {'level': level})
+
+def follow_stream(stream_factory, handle, stop, initial_delay=0.5, max_delay=10, on_disconnect=None):
+    """跟随流式接口并逐条交给 handle 处理，断开后指数退避重连，直到 stop 被设置
+
+    每次重连只接收新数据，不会重新读取历史；每次断开（或连接失败）后调用 on_disconnect。
+    """
+    delay = initial_delay
+    while not stop.is_set():
+        try:
+            for item in stream_factory():
+                handle(item)
+                delay = initial_delay
+                if stop.is_set():
+                    return
+        except Exception:
+            pass
+        if on_disconnect and not stop.is_set():
+            on_disconnect()
+        stop.wait(delay)
+        delay = min(max_delay, delay * 2)
+
+# 按控制器地址共享的客户端
+_clients = {}
+
+def get_client(controller=CLASH_API):
+    """返回该控制器的共享客户端，同一进程内的一次性请求复用连接池和已读取的密钥
+
+    共享客户端不需要也不应由调用方关闭；需要独立连接池大小、重试策略或长时间占用连接的
+    流式读取仍应自行创建 ClashAPI。
+    """
+    client = _clients.get(controller)
+    if client is None:
+        client = _clients[controller] = ClashAPI(controller)
+    return client
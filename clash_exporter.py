@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Clash Prometheus 指标导出工具
+后台线程跟随 /traffic、定时采样 /connections 并测试节点延迟，
+/metrics 只读取内存中的快照，抓取不会阻塞在Clash API上；
+多实例部署时每个实例各有一份快照，指标带 clash_instance 标签
+"""
+
+import sys
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from clash_api import ClashAPI, DELAY_TEST_URL, follow_stream, load_instances
+
+def print_status(message, status="INFO"):
+    """打印状态信息"""
+    emoji_map = {
+        "INFO": "ℹ️",
+        "SUCCESS": "✅",
+        "ERROR": "❌",
+        "WARNING": "⚠️",
+        "PROCESSING": "🔄"
+    }
+    emoji = emoji_map.get(status, "ℹ️")
+    print(f"{emoji} {message}")
+
+# 每个实例的内存快照，由后台线程更新，/metrics 只读
+snapshots = {}
+snapshot_lock = threading.Lock()
+
+def new_snapshot():
+    return {
+        'traffic': {'up': 0, 'down': 0},
+        'totals': {'upload': 0, 'download': 0},
+        'connections': {},    # (rule, chain) -> 活跃连接数
+        'delays': {},         # 节点 -> 延迟毫秒（None表示超时）
+        'updated': {},        # 数据源 -> 最后更新时间戳
+        'controller_up': 0
+    }
+
+def update_snapshot(instance, **values):
+    """原子地更新实例快照中的若干项"""
+    with snapshot_lock:
+        snapshots.setdefault(instance, new_snapshot()).update(values)
+
+def mark_updated(instance, source):
+    with snapshot_lock:
+        snapshots.setdefault(instance, new_snapshot())['updated'][source] = time.time()
+
+def follow_traffic(api, stop, instance):
+    """跟随 /traffic 流，更新当前速率；断开期间速率为0，不保留断开前的最后一个值"""
+    def on_sample(sample):
+        update_snapshot(instance, traffic={'up': sample.get('up', 0), 'down': sample.get('down', 0)})
+        mark_updated(instance, 'traffic')
+
+    def on_disconnect():
+        update_snapshot(instance, traffic={'up': 0, 'down': 0})
+    follow_stream(api.traffic, on_sample, stop, on_disconnect=on_disconnect)
+
+def sample_connections(api, stop, interval, instance):
+    """定时采样 /connections，按规则和出站链路统计活跃连接数"""
+    while not stop.is_set():
+        try:
+            data = api.connections()
+            counts = {}
+            for conn in data['connections']:
+                chains = conn.get('chains') or []
+                key = (conn.get('rule', ''), chains[0] if chains else '')
+                counts[key] = counts.get(key, 0) + 1
+            update_snapshot(
+                instance,
+                connections=counts,
+                totals={'upload': data.get('uploadTotal', 0), 'download': data.get('downloadTotal', 0)},
+                controller_up=1
+            )
+            mark_updated(instance, 'connections')
+        except Exception:
+            update_snapshot(instance, controller_up=0)
+        stop.wait(interval)
+
+def probe_delays(api, stop, interval, concurrency, url, timeout_ms, instance):
+    """定时测试所有节点延迟"""
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while not stop.is_set():
+            try:
+                names = api.node_names()
+                results = dict(zip(names, executor.map(lambda n: api.delay(n, url, timeout_ms), names)))
+                update_snapshot(instance, delays=results)
+                mark_updated(instance, 'delay')
+            except Exception:
+                pass
+            stop.wait(interval)
+
+def escape_label(value):
+    """转义Prometheus标签值"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_metrics():
+    """根据快照生成Prometheus文本格式，多实例时每条序列带 clash_instance 标签"""
+    with snapshot_lock:
+        data = {instance: {
+            'traffic': dict(snapshot['traffic']),
+            'totals': dict(snapshot['totals']),
+            'connections': dict(snapshot['connections']),
+            'delays': dict(snapshot['delays']),
+            'updated': dict(snapshot['updated']),
+            'controller_up': snapshot['controller_up']
+        } for instance, snapshot in sorted(snapshots.items())}
+    multi = len(data) > 1
+
+    def labels(instance, **values):
+        pairs = ([('clash_instance', instance)] if multi else []) + list(values.items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in pairs) + "}"
+
+    lines = [
+        "# HELP clash_up Whether the last controller poll succeeded.",
+        "# TYPE clash_up gauge"
+    ]
+    for instance, d in data.items():
+        lines.append(f"clash_up{labels(instance)} {d['controller_up']}")
+    lines += [
+        "# HELP clash_traffic_bytes_per_second Current traffic rate from /traffic.",
+        "# TYPE clash_traffic_bytes_per_second gauge"
+    ]
+    for instance, d in data.items():
+        lines.append(f'clash_traffic_bytes_per_second{labels(instance, direction="up")} {d["traffic"]["up"]}')
+        lines.append(f'clash_traffic_bytes_per_second{labels(instance, direction="down")} {d["traffic"]["down"]}')
+    lines += [
+        "# HELP clash_traffic_bytes_total Total bytes transferred since Clash started.",
+        "# TYPE clash_traffic_bytes_total counter"
+    ]
+    for instance, d in data.items():
+        lines.append(f'clash_traffic_bytes_total{labels(instance, direction="up")} {d["totals"]["upload"]}')
+        lines.append(f'clash_traffic_bytes_total{labels(instance, direction="down")} {d["totals"]["download"]}')
+    lines += [
+        "# HELP clash_connections_active Active connections by matched rule and outbound chain.",
+        "# TYPE clash_connections_active gauge"
+    ]
+    for instance, d in data.items():
+        for (rule, chain), count in sorted(d['connections'].items()):
+            lines.append(f'clash_connections_active{labels(instance, rule=rule, chain=chain)} {count}')
+
+    lines += [
+        "# HELP clash_proxy_delay_milliseconds Last measured delay per node.",
+        "# TYPE clash_proxy_delay_milliseconds gauge"
+    ]
+    for instance, d in data.items():
+        for name, delay in sorted(d['delays'].items()):
+            if delay is not None:
+                lines.append(f'clash_proxy_delay_milliseconds{labels(instance, proxy=name)} {delay}')
+    lines += [
+        "# HELP clash_proxy_up Whether the last delay test of a node succeeded.",
+        "# TYPE clash_proxy_up gauge"
+    ]
+    for instance, d in data.items():
+        for name, delay in sorted(d['delays'].items()):
+            lines.append(f'clash_proxy_up{labels(instance, proxy=name)} {0 if delay is None else 1}')
+
+    lines += [
+        "# HELP clash_exporter_last_update_timestamp_seconds Last successful update per data source.",
+        "# TYPE clash_exporter_last_update_timestamp_seconds gauge"
+    ]
+    for instance, d in data.items():
+        for source, ts in sorted(d['updated'].items()):
+            lines.append(f'clash_exporter_last_update_timestamp_seconds{labels(instance, source=source)} {ts:.3f}')
+    return "\n".join(lines) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """只提供 /metrics"""
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def run_exporter(host="0.0.0.0", port=9877, conn_interval=5, delay_interval=300,
+                 concurrency=16, url=DELAY_TEST_URL, timeout_ms=5000):
+    """启动后台采集线程和 /metrics 服务，直到Ctrl+C；多实例部署时采集每个实例"""
+    stop = threading.Event()
+    workers = []
+    for instance in load_instances():
+        name, controller = instance['name'], instance['controller']
+        # 先登记快照，未连通的实例也以 clash_up 0 出现
+        update_snapshot(name)
+        workers += [
+            (follow_traffic, (ClashAPI(controller, timeout=10), stop, name)),
+            (sample_connections, (ClashAPI(controller), stop, conn_interval, name)),
+            (probe_delays, (ClashAPI(controller, pool_size=concurrency), stop, delay_interval, concurrency,
+                            url, timeout_ms, name))
+        ]
+    for target, args in workers:
+        threading.Thread(target=target, args=args, daemon=True).start()
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    print_status(f"指标导出已启动: http://{host}:{port}/metrics", "SUCCESS")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print_status("指标导出已停止", "INFO")
+    finally:
+        stop.set()
+        server.server_close()
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="Clash Prometheus 指标导出")
+    parser.add_argument("--host", default="0.0.0.0", help="监听地址")
+    parser.add_argument("--port", type=int, default=9877, help="监听端口")
+    parser.add_argument("--conn-interval", type=int, default=5, help="连接采样间隔（秒）")
+    parser.add_argument("--delay-interval", type=int, default=300, help="节点测速间隔（秒）")
+    parser.add_argument("--concurrency", type=int, default=16, help="测速最大并发数")
+    parser.add_argument("--timeout", type=int, default=5000, help="单次测速超时（毫秒）")
+    args = parser.parse_args()
+    run_exporter(args.host, args.port, max(1, args.conn_interval), max(1, args.delay_interval),
+                 max(1, args.concurrency), DELAY_TEST_URL, args.timeout)
+
+if __name__ == "__main__":
+    sys.exit(main())
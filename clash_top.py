@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Clash 实时流量和日志查看工具（top风格）
+增量跟随 /traffic 和 /logs 流，使用固定大小的环形缓冲区保存秒级数据，
+并降采样为分钟级和小时级，长时间运行内存保持不变，也不会重新读取历史日志
+"""
+
+import sys
+import time
+import argparse
+import threading
+from collections import deque
+from clash_api import ClashAPI, follow_stream
+
+# 各级环形缓冲区容量：1小时的秒级、1天的分钟级、30天的小时级
+SECOND_SLOTS = 3600
+MINUTE_SLOTS = 1440
+HOUR_SLOTS = 720
+# 保留的最新日志条数
+LOG_LINES = 200
+# 迷你图字符
+SPARK_CHARS = " ▁▂▃▄▅▆▇█"
+
+class TieredSeries:
+    """秒/分钟/小时三级降采样的流量序列，每个点为 (时间戳, 平均上行, 平均下行, 峰值下行)"""
+
+    def __init__(self, second_slots=SECOND_SLOTS, minute_slots=MINUTE_SLOTS, hour_slots=HOUR_SLOTS):
+        self.seconds = deque(maxlen=second_slots)
+        self.minutes = deque(maxlen=minute_slots)
+        self.hours = deque(maxlen=hour_slots)
+        self.total_up = 0
+        self.total_down = 0
+        self._minute = self._new_bucket(None)
+        self._hour = self._new_bucket(None)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _new_bucket(start):
+        return {'start': start, 'up': 0, 'down': 0, 'peak': 0, 'count': 0}
+
+    @staticmethod
+    def _add(bucket, up, down, peak):
+        bucket['up'] += up
+        bucket['down'] += down
+        bucket['peak'] = max(bucket['peak'], peak)
+        bucket['count'] += 1
+
+    @staticmethod
+    def _close(bucket):
+        count = bucket['count'] or 1
+        return bucket['start'], bucket['up'] / count, bucket['down'] / count, bucket['peak']
+
+    def add(self, up, down, now=None):
+        """加入一个秒级样本，跨越分钟/小时边界时把聚合结果推入下一级"""
+        now = int(now if now is not None else time.time())
+        with self.lock:
+            self.seconds.append((now, up, down, down))
+            self.total_up += up
+            self.total_down += down
+
+            minute = now - now % 60
+            if self._minute['start'] is None:
+                self._minute['start'] = minute
+            elif minute != self._minute['start']:
+                point = self._close(self._minute)
+                self.minutes.append(point)
+                hour = point[0] - point[0] % 3600
+                if self._hour['start'] is None:
+                    self._hour['start'] = hour
+                elif hour != self._hour['start']:
+                    self.hours.append(self._close(self._hour))
+                    self._hour = self._new_bucket(hour)
+                self._add(self._hour, point[1], point[2], point[3])
+                self._minute = self._new_bucket(minute)
+            self._add(self._minute, up, down, down)
+
+    def view(self):
+        """返回各级缓冲区的副本"""
+        with self.lock:
+            return list(self.seconds), list(self.minutes), list(self.hours)
+
+def format_rate(value):
+    """格式化字节速率"""
+    for unit in ("B/s", "KB/s", "MB/s", "GB/s"):
+        if value < 1024 or unit == "GB/s":
+            return f"{value:.1f}{unit}" if unit != "B/s" else f"{value:.0f}{unit}"
+        value /= 1024
+
+def format_bytes(value):
+    """格式化字节数"""
+    return format_rate(value)[:-2]
+
+def sparkline(values, width):
+    """用字符画出最近 width 个值的趋势"""
+    values = values[-width:]
+    if not values:
+        return ""
+    top = max(values) or 1
+    return "".join(SPARK_CHARS[min(len(SPARK_CHARS) - 1, int(v / top * (len(SPARK_CHARS) - 1)))] for v in values)
+
+def render(series, logs, log_counts, width=60):
+    """生成一帧画面"""
+    seconds, minutes, hours = series.view()
+    current = seconds[-1] if seconds else (0, 0, 0, 0)
+    lines = [
+        f"Clash top  {time.strftime('%H:%M:%S')}   ↑ {format_rate(current[1])}   ↓ {format_rate(current[2])}"
+        f"   累计 ↑ {format_bytes(series.total_up)} ↓ {format_bytes(series.total_down)}",
+        "",
+        f"最近{width}秒  ↓ {sparkline([p[2] for p in seconds], width)}",
+        f"最近{width}分  ↓ {sparkline([p[2] for p in minutes], width)}",
+        f"最近{width}时  ↓ {sparkline([p[2] for p in hours], width)}",
+        "",
+        "日志: " + "  ".join(f"{k}={v}" for k, v in sorted(log_counts.items())),
+        "-" * (width + 12)
+    ]
+    lines += list(logs)[-15:]
+    return "\n".join(lines)
+
+def run_top(refresh=1.0, log_level="info", once=False):
+    """启动流式采集并持续刷新界面，直到Ctrl+C"""
+    series = TieredSeries()
+    logs = deque(maxlen=LOG_LINES)
+    log_counts = {}
+    # 日志线程写入、界面线程读取，读取时在锁内复制
+    log_lock = threading.Lock()
+    stop = threading.Event()
+
+    def on_traffic(sample):
+        series.add(sample.get('up', 0), sample.get('down', 0))
+
+    def on_log(entry):
+        level = entry.get('type', 'info')
+        line = f"[{time.strftime('%H:%M:%S')}] {level:<7} {entry.get('payload', '')}"
+        with log_lock:
+            log_counts[level] = log_counts.get(level, 0) + 1
+            logs.append(line)
+
+    traffic_api = ClashAPI(timeout=10)
+    log_api = ClashAPI(timeout=10)
+    threading.Thread(target=follow_stream, args=(traffic_api.traffic, on_traffic, stop), daemon=True).start()
+    threading.Thread(target=follow_stream, args=(lambda: log_api.logs(log_level), on_log, stop), daemon=True).start()
+
+    try:
+        while True:
+            time.sleep(refresh)
+            with log_lock:
+                recent, counts = list(logs), dict(log_counts)
+            frame = render(series, recent, counts)
+            if once:
+                print(frame)
+                break
+            # 清屏后把光标移到左上角
+            sys.stdout.write("\033[H\033[2J" + frame + "\n")
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="Clash 实时流量和日志查看")
+    parser.add_argument("--refresh", type=float, default=1.0, help="刷新间隔（秒）")
+    parser.add_argument("--level", default="info", choices=["debug", "info", "warning", "error"], help="日志级别")
+    args = parser.parse_args()
+    run_top(args.refresh, args.level)
+
+if __name__ == "__main__":
+    sys.exit(main())
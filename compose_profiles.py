@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+docker-compose.yml 生成工具
+按配置档生成compose定义：default 与原先的静态文件一致；
+high-throughput 在安全时使用host网络（省去docker-proxy的用户态转发），
+提高nofile上限，绑定CPU并限制内存，bridge网络下调整容器内的net sysctl；
+多实例部署时生成多个clash服务和前置的负载均衡器
+"""
+
+import os
+import sys
+import platform
+import argparse
+from yaml_io import dump_yaml
+from scale_out import instance_layout, split_cpuset, LB_CONFIG, LB_IMAGE, LB_CONTAINER, LB_PORTS
+
+COMPOSE_FILE = "docker-compose.yml"
+PROFILES = ('default', 'high-throughput')
+# 高吞吐配置档（及负载均衡器）的文件描述符上限（每条隧道至少占用两个）
+NOFILE_LIMIT = 1048576
+# 高吞吐配置档的内存上限（不使用swap，避免延迟抖动）
+MEMORY_LIMIT = "2g"
+# bridge网络下容器内可设置的net sysctl（host网络与宿主机共享，Docker不允许设置）
+NET_SYSCTLS = {
+    'net.core.somaxconn': 65535,
+    'net.ipv4.tcp_max_syn_backlog': 65535,
+    'net.ipv4.ip_local_port_range': '1024 65535',
+    'net.ipv4.tcp_tw_reuse': 1,
+    'net.ipv4.tcp_fin_timeout': 15
+}
+# host网络时Clash不能像bridge网络那样只在容器内监听53端口，改为仅本机的非特权端口
+HOST_DNS_LISTEN = '127.0.0.1:1053'
+COMPOSE_HEADER = "# 由 start_clash_docker.py 生成（配置档: {}），手动修改会在下次启动时被覆盖\n"
+# yacd的API密钥写入不纳入版本控制的env文件，compose文件中不出现密钥
+YACD_ENV_FILE = "config/yacd.env"
+
+def print_status(message, status="INFO"):
+    """打印状态信息"""
+    emoji_map = {
+        "INFO": "ℹ️",
+        "SUCCESS": "✅",
+        "ERROR": "❌",
+        "WARNING": "⚠️",
+        "PROCESSING": "🔄"
+    }
+    emoji = emoji_map.get(status, "ℹ️")
+    print(f"{emoji} {message}")
+
+def host_network_supported():
+    """host网络只在Linux上与宿主机共享网络栈（Docker Desktop中是虚拟机的网络）"""
+    return platform.system() == 'Linux'
+
+def uses_host_network(profile, bridge=False):
+    return profile == 'high-throughput' and not bridge and host_network_supported()
+
+def default_cpuset():
+    """默认绑定除CPU 0以外的所有可用CPU，把CPU 0留给网卡中断和宿主机进程；少于4个CPU时不绑定"""
+    try:
+        cpus = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = list(range(os.cpu_count() or 1))
+    if len(cpus) < 4:
+        return None
+    return ','.join(str(cpu) for cpu in cpus[1:])
+
+def config_overrides(profile, bridge=False):
+    """配置档对Clash配置的修改
+
+    host网络下Clash直接监听宿主机端口：关闭allow-lan使7890/7891只监听127.0.0.1（与bridge网络只发布到本机一致），
+    DNS改为本机非特权端口，避免占用或暴露宿主机的53端口。
+    高吞吐配置档降低日志级别，减少每条连接一行的日志写入；API的日志流不受影响。
+    """
+    overrides = {}
+    if profile == 'high-throughput':
+        overrides['log-level'] = 'warning'
+    if uses_host_network(profile, bridge):
+        overrides['allow-lan'] = False
+        overrides['dns-listen'] = HOST_DNS_LISTEN
+    return overrides
+
+def apply_overrides(config, overrides):
+    """把配置档的修改应用到Clash配置（原地修改）"""
+    for key, value in overrides.items():
+        if key == 'dns-listen':
+            config.setdefault('dns', {})['listen'] = value
+        else:
+            config[key] = value
+    return config
+
+def clash_service(profile, bridge=False, cpuset=None, memory=MEMORY_LIMIT, instance=None):
+    """clash服务定义；instance 为多实例部署中的实例（使用自己的端口和配置目录）"""
+    service = {
+        'image': 'dreamacro/clash:latest',
+        'container_name': instance['name'] if instance else 'clash',
+        'restart': 'unless-stopped'
+    }
+    if uses_host_network(profile, bridge):
+        service['network_mode'] = 'host'
+    elif instance:
+        service['ports'] = [
+            f"127.0.0.1:{instance['mixed_port']}:{instance['mixed_port']}",
+            f"127.0.0.1:{instance['socks_port']}:{instance['socks_port']}",
+            f"{instance['controller_port']}:{instance['controller_port']}"
+        ]
+    else:
+        service['ports'] = [
+            '127.0.0.1:7890:7890',
+            '127.0.0.1:7891:7891',
+            '9090:9090'
+        ]
+    service['volumes'] = [f"./{instance['config_dir']}:/root/.config/clash" if instance
+                          else './config:/root/.config/clash']
+    service['environment'] = ['TZ=Asia/Shanghai']
+    if profile == 'high-throughput':
+        service['ulimits'] = {'nofile': {'soft': NOFILE_LIMIT, 'hard': NOFILE_LIMIT}}
+        if cpuset:
+            service['cpuset'] = cpuset
+        if memory:
+            service['mem_limit'] = memory
+            service['memswap_limit'] = memory
+        if not uses_host_network(profile, bridge):
+            service['sysctls'] = {key: str(value) for key, value in NET_SYSCTLS.items()}
+        # 限制日志文件大小，长时间高负载运行不会写满磁盘
+        service['logging'] = {'driver': 'json-file', 'options': {'max-size': '10m', 'max-file': '3'}}
+    if not uses_host_network(profile, bridge):
+        service['networks'] = ['clash_network']
+    return service
+
+def lb_service(profile, bridge=False, instances=()):
+    """多实例部署前置的负载均衡器，对外提供与单实例相同的7890/7891端口"""
+    service = {
+        'image': LB_IMAGE,
+        'container_name': LB_CONTAINER,
+        'restart': 'unless-stopped'
+    }
+    if uses_host_network(profile, bridge):
+        service['network_mode'] = 'host'
+    else:
+        service['ports'] = [f"127.0.0.1:{port}:{port}" for port in LB_PORTS.values()]
+    service['volumes'] = [f"./{LB_CONFIG}:/usr/local/etc/haproxy/haproxy.cfg:ro"]
+    service['ulimits'] = {'nofile': {'soft': NOFILE_LIMIT, 'hard': NOFILE_LIMIT}}
+    service['depends_on'] = [instance['name'] for instance in instances]
+    if not uses_host_network(profile, bridge):
+        service['networks'] = ['clash_network']
+    return service
+
+def yacd_service(profile, bridge=False, secret=None, clash_name='clash'):
+    """yacd服务定义；clash使用host网络时通过宿主机网关访问API
+
+    secret 不为空时从 YACD_ENV_FILE 读取密钥（由 write_yacd_env 写出）。
+    """
+    api_host = 'host.docker.internal' if uses_host_network(profile, bridge) else clash_name
+    service = {
+        'image': 'haishanh/yacd:latest',
+        'container_name': 'yacd',
+        'restart': 'unless-stopped',
+        'ports': ['8080:80'],
+        'environment': [f'CLASH_API_BASE_URL=http://{api_host}:9090']
+    }
+    if secret:
+        service['env_file'] = [f"./{YACD_ENV_FILE}"]
+    if api_host != clash_name:
+        service['extra_hosts'] = ['host.docker.internal:host-gateway']
+    service['depends_on'] = [clash_name]
+    service['networks'] = ['clash_network']
+    return service
+
+def build_compose(profile='default', secret=None, bridge=False, cpuset=None, memory=MEMORY_LIMIT, instances=1):
+    """生成compose定义（字典）
+
+    instances 大于1时生成多个clash实例和前置的负载均衡器，cpuset 均分给各实例，memory 为每个实例的上限；
+    yacd连接第一个实例。
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"未知的配置档: {profile}")
+    if instances <= 1:
+        services = {'clash': clash_service(profile, bridge, cpuset, memory)}
+    else:
+        layout = instance_layout(instances)
+        services = {instance['name']: clash_service(profile, bridge, instance_cpuset, memory, instance)
+                    for instance, instance_cpuset in zip(layout, split_cpuset(cpuset, instances))}
+        services[LB_CONTAINER] = lb_service(profile, bridge, layout)
+    services['yacd'] = yacd_service(profile, bridge, secret, next(iter(services)))
+    return {
+        'services': services,
+        'networks': {
+            'clash_network': {'driver': 'bridge'}
+        }
+    }
+
+def write_compose(compose, profile, path=COMPOSE_FILE):
+    """写出compose文件，内容未变化时不改写，返回是否变化"""
+    text = COMPOSE_HEADER.format(profile) + dump_yaml(compose)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == text:
+                return False
+    except OSError:
+        pass
+    with open(path + ".part", 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(path + ".part", path)
+    return True
+
+def write_yacd_env(secret, path=YACD_ENV_FILE):
+    """把yacd使用的API密钥写入env文件（仅所有者可读），内容未变化时不改写，返回是否变化"""
+    text = f"CLASH_API_SECRET={secret}\n"
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == text:
+                return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd = os.open(path + ".part", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(path + ".part", path)
+    return True
+
+def host_sysctl_hint(profile, bridge=False):
+    """host网络下net sysctl作用于整个宿主机，不自动修改，只给出建议命令"""
+    if not uses_host_network(profile, bridge):
+        return None
+    return "sudo sysctl -w " + " ".join(f"{key}='{value}'" if ' ' in str(value) else f"{key}={value}"
+                                        for key, value in NET_SYSCTLS.items())
+
+def main():
+    """命令行入口：只生成compose文件，不启动服务"""
+    parser = argparse.ArgumentParser(description="生成 docker-compose.yml")
+    parser.add_argument("--profile", choices=PROFILES, default="default", help="配置档")
+    parser.add_argument("--bridge", action="store_true", help="高吞吐配置档也使用bridge网络")
+    parser.add_argument("--cpuset", help="绑定的CPU（如 1-3），空字符串表示不绑定，默认除CPU 0以外的所有CPU")
+    parser.add_argument("--memory", default=MEMORY_LIMIT, help="内存上限，空字符串表示不限制")
+    parser.add_argument("--instances", type=int, default=1, help="clash实例数，大于1时前置负载均衡器")
+    parser.add_argument("--output", default=COMPOSE_FILE, help="输出文件")
+    args = parser.parse_args()
+
+    cpuset = default_cpuset() if args.cpuset is None else args.cpuset
+    compose = build_compose(args.profile, bridge=args.bridge, cpuset=cpuset, memory=args.memory,
+                            instances=max(1, args.instances))
+    changed = write_compose(compose, args.profile, args.output)
+    print_status(f"{args.output} {'已更新' if changed else '未变化'}（配置档: {args.profile}）", "SUCCESS")
+    hint = host_sysctl_hint(args.profile, args.bridge)
+    if hint:
+        print_status(f"host网络下可在宿主机上调整: {hint}", "INFO")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Clash 连接跟踪工具
+按连接ID对比相邻两次 /connections 快照，只产出新建、关闭和流量增量事件，
+并维护按主机和出站链路的流量排行，用于定位占用带宽的连接
+"""
+
+import sys
+import time
+import argparse
+from collections import OrderedDict
+import requests
+from clash_api import ClashAPI
+
+OPENED = 'opened'
+CLOSED = 'closed'
+BYTES = 'bytes'
+# 排行表最多保留的主机/出站节点数，超出时淘汰最久没有流量的条目
+MAX_TRACKED_KEYS = 10000
+
+class ConnRecord:
+    """活跃连接的精简记录"""
+
+    __slots__ = ('id', 'host', 'chain', 'rule', 'rule_payload', 'upload', 'download')
+
+    def __init__(self, conn):
+        metadata = conn.get('metadata') or {}
+        chains = conn.get('chains') or []
+        self.id = conn.get('id')
+        self.host = metadata.get('host') or metadata.get('destinationIP') or ''
+        # chains 从出站节点到代理组排列，第一个是实际节点
+        self.chain = chains[0] if chains else ''
+        self.rule = conn.get('rule', '')
+        self.rule_payload = conn.get('rulePayload', '')
+        self.upload = conn.get('upload', 0)
+        self.download = conn.get('download', 0)
+
+class ConnectionTracker:
+    """维护活跃连接集合，并把快照之间的差异转换成事件"""
+
+    def __init__(self, max_keys=MAX_TRACKED_KEYS):
+        self.live = {}
+        self.max_keys = max_keys
+        # 按最近活动排序（LRU），长时间运行时内存有上限
+        self.hosts = OrderedDict()    # 主机 -> [上行, 下行, 连接数]
+        self.chains = OrderedDict()   # 出站节点 -> [上行, 下行, 连接数]
+
+    def _account(self, record, up, down, opened=0):
+        for table, key in ((self.hosts, record.host), (self.chains, record.chain)):
+            stats = table.get(key)
+            if stats is None:
+                stats = table[key] = [0, 0, 0]
+                if len(table) > self.max_keys:
+                    table.popitem(last=False)
+            else:
+                table.move_to_end(key)
+            stats[0] += up
+            stats[1] += down
+            stats[2] += opened
+
+    def update(self, connections):
+        """处理一次快照，返回事件列表 [(类型, 记录, 上行增量, 下行增量)]"""
+        events = []
+        seen = set()
+        live = self.live
+        for conn in connections:
+            conn_id = conn.get('id')
+            seen.add(conn_id)
+            record = live.get(conn_id)
+            if record is None:
+                record = live[conn_id] = ConnRecord(conn)
+                self._account(record, record.upload, record.download, opened=1)
+                events.append((OPENED, record, record.upload, record.download))
+                continue
+            upload = conn.get('upload', 0)
+            download = conn.get('download', 0)
+            if upload != record.upload or download != record.download:
+                up, down = upload - record.upload, download - record.download
+                record.upload, record.download = upload, download
+                self._account(record, up, down)
+                events.append((BYTES, record, up, down))
+        for conn_id in [i for i in live if i not in seen]:
+            events.append((CLOSED, live.pop(conn_id), 0, 0))
+        return events
+
+    def top(self, by='host', n=10):
+        """按总流量返回前N个主机或出站节点 [(名称, 上行, 下行, 连接数)]"""
+        table = self.hosts if by == 'host' else self.chains
+        ranked = sorted(table.items(), key=lambda item: item[1][0] + item[1][1], reverse=True)
+        return [(name, *stats) for name, stats in ranked[:n]]
+
+def format_size(value):
+    """格式化字节数"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024 or unit == "GB":
+            return f"{value:.1f}{unit}" if unit != "B" else f"{value:.0f}{unit}"
+        value /= 1024
+
+def print_top(tracker, n):
+    """打印主机和出站节点流量排行"""
+    for by, title in (('host', '主机'), ('chain', '出站节点')):
+        print(f"\n📊 {title}流量排行 Top {n}:")
+        for name, up, down, count in tracker.top(by, n):
+            print(f"   ↑ {format_size(up):>9} ↓ {format_size(down):>9}  {count:>5} 连接  {name}")
+
+def track_connections(interval=2, top_n=10, duration=None, verbose=False):
+    """持续跟踪连接变化并输出排行，直到Ctrl+C或达到 duration 秒
+
+    控制器重启或请求失败时保留已累计的排行，按采样间隔继续重试。
+    """
+    tracker = ConnectionTracker()
+    deadline = time.monotonic() + duration if duration else None
+    with ClashAPI() as api:
+        try:
+            disconnected = False
+            while deadline is None or time.monotonic() < deadline:
+                try:
+                    snapshot = api.connections()['connections']
+                except requests.exceptions.RequestException as e:
+                    if not disconnected:
+                        print(f"⚠️ 获取连接失败，继续重试: {e.__class__.__name__}")
+                        disconnected = True
+                    time.sleep(interval)
+                    continue
+                if disconnected:
+                    print("✅ 已重新连接控制器")
+                    disconnected = False
+                events = tracker.update(snapshot)
+                opened = sum(1 for e in events if e[0] == OPENED)
+                closed = sum(1 for e in events if e[0] == CLOSED)
+                delta = sum(e[2] + e[3] for e in events)
+                print(f"[{time.strftime('%H:%M:%S')}] 活跃 {len(tracker.live):>5}  新建 {opened:>4}  "
+                      f"关闭 {closed:>4}  流量 +{format_size(delta)}")
+                if verbose:
+                    for kind, record, up, down in events:
+                        if kind != BYTES:
+                            print(f"   {'+' if kind == OPENED else '-'} {record.host} via {record.chain} ({record.rule} {record.rule_payload})")
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+    print_top(tracker, top_n)
+    return tracker
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="Clash 连接跟踪与流量排行")
+    parser.add_argument("--interval", type=float, default=2, help="采样间隔（秒）")
+    parser.add_argument("--top", type=int, default=10, help="排行数量")
+    parser.add_argument("--duration", type=float, help="运行时长（秒），默认直到Ctrl+C")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出每个新建/关闭的连接")
+    args = parser.parse_args()
+    track_connections(args.interval, args.top, args.duration, args.verbose)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Clash DNS 上游测速工具
+对候选UDP和DoH解析器并发查询一组测试域名，统计延迟百分位和失败率，
+并用最快的健康解析器生成配置中的 dns 段
+"""
+
+import sys
+import json
+import time
+import random
+import socket
+import struct
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from latency_stats import percentile
+
+# 默认解析器（未测速时使用）
+DEFAULT_UDP = ['223.5.5.5', '119.29.29.29']
+DEFAULT_DOH = ['https://doh.pub/dns-query', 'https://dns.alidns.com/dns-query']
+# 测速候选
+CANDIDATE_UDP = ['223.5.5.5', '223.6.6.6', '119.29.29.29', '114.114.114.114', '180.76.76.76',
+                 '1.1.1.1', '8.8.8.8']
+CANDIDATE_DOH = ['https://doh.pub/dns-query', 'https://dns.alidns.com/dns-query',
+                 'https://doh.360.cn/dns-query', 'https://1.1.1.1/dns-query', 'https://dns.google/dns-query']
+# 测试域名（国内外常用站点）
+TEST_DOMAINS = ['www.baidu.com', 'www.qq.com', 'www.taobao.com', 'www.jd.com',
+                'www.google.com', 'www.github.com', 'www.cloudflare.com', 'www.youtube.com']
+# 测速结果缓存
+DNS_BENCH_FILE = "config/.dns_bench.json"
+DNS_BENCH_TTL = 24 * 3600
+# 失败率超过该值的解析器视为不健康
+MAX_FAILURE_RATE = 0.2
+# fake-ip 模式下仍返回真实IP的域名
+FAKE_IP_FILTER = ['*.lan', '*.local', 'localhost.ptlink.com', 'time.*.com', 'ntp.*.com',
+                  '+.pool.ntp.org', '+.msftconnecttest.com', '+.msftncsi.com']
+
+def build_query(domain, query_id, qtype=1):
+    """构造DNS查询报文（A记录，递归查询）"""
+    header = struct.pack(">HHHHHH", query_id, 0x0100, 1, 0, 0, 0)
+    question = b"".join(bytes([len(label)]) + label.encode() for label in domain.strip('.').split('.'))
+    return header + question + b"\x00" + struct.pack(">HH", qtype, 1)
+
+def check_response(data, query_id):
+    """校验响应报文：ID匹配、是响应、RCODE为NOERROR且有应答记录"""
+    if len(data) < 12:
+        return False
+    response_id, flags, _, answers = struct.unpack(">HHHH", data[:8])
+    return response_id == query_id and bool(flags & 0x8000) and flags & 0x000F == 0 and answers > 0
+
+def split_server(server, default_port=53):
+    """解析 '地址' 或 '地址:端口'"""
+    host, sep, port = server.rpartition(':')
+    if sep and port.isdigit() and host and (host.count(':') == 0 or host.startswith('[')):
+        return host.strip('[]'), int(port)
+    return server, default_port
+
+def query_udp(server, domain, timeout=2.0):
+    """UDP查询，成功返回毫秒数，失败返回None"""
+    query_id = random.randint(0, 0xFFFF)
+    host, port = split_server(server)
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    start = time.perf_counter()
+    try:
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(timeout)
+            sock.sendto(build_query(domain, query_id), (host, port))
+            while True:
+                data = sock.recv(4096)
+                # 忽略迟到的其他查询响应
+                if len(data) >= 2 and struct.unpack(">H", data[:2])[0] == query_id:
+                    break
+    except OSError:
+        return None
+    return (time.perf_counter() - start) * 1000 if check_response(data, query_id) else None
+
+def query_doh(session, url, domain, timeout=2.0):
+    """DoH查询（RFC 8484 POST），成功返回毫秒数，失败返回None"""
+    # DoH建议使用ID 0，便于缓存
+    start = time.perf_counter()
+    try:
+        response = session.post(url, data=build_query(domain, 0), timeout=timeout,
+                                headers={'Content-Type': 'application/dns-message',
+                                         'Accept': 'application/dns-message'})
+    except requests.exceptions.RequestException:
+        return None
+    if response.status_code != 200 or not check_response(response.content, 0):
+        return None
+    return (time.perf_counter() - start) * 1000
+
+def benchmark_resolvers(udp=CANDIDATE_UDP, doh=CANDIDATE_DOH, domains=TEST_DOMAINS, rounds=3,
+                        concurrency=32, timeout=2.0):
+    """并发测速所有解析器，返回 [{'resolver', 'kind', 'queries', 'failures', 'failure_rate', 'p50', 'p90'}]
+
+    第一轮包含DoH的连接建立，之后复用连接，与Clash长期运行时的情况一致。
+    """
+    session = requests.Session()
+    session.trust_env = False
+    adapter = HTTPAdapter(pool_maxsize=concurrency)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    jobs = [(kind, resolver, domain)
+            for _ in range(rounds)
+            for kind, resolvers in (('udp', udp), ('doh', doh))
+            for resolver in resolvers
+            for domain in domains]
+
+    def run(job):
+        kind, resolver, domain = job
+        if kind == 'udp':
+            return query_udp(resolver, domain, timeout)
+        return query_doh(session, resolver, domain, timeout)
+
+    samples = {}
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for (kind, resolver, _), latency in zip(jobs, executor.map(run, jobs)):
+                samples.setdefault((kind, resolver), []).append(latency)
+    finally:
+        session.close()
+
+    results = []
+    for (kind, resolver), latencies in samples.items():
+        ok = [value for value in latencies if value is not None]
+        results.append({
+            'resolver': resolver,
+            'kind': kind,
+            'queries': len(latencies),
+            'failures': len(latencies) - len(ok),
+            'failure_rate': round((len(latencies) - len(ok)) / len(latencies), 3),
+            'p50': round(percentile(ok, 50), 1) if ok else None,
+            'p90': round(percentile(ok, 90), 1) if ok else None
+        })
+    return results
+
+def select_resolvers(results, kind, count=2, max_failure_rate=MAX_FAILURE_RATE):
+    """按p50和p90选出最快的健康解析器"""
+    healthy = [r for r in results if r['kind'] == kind and r['p50'] is not None
+               and r['failure_rate'] <= max_failure_rate]
+    healthy.sort(key=lambda r: (r['p50'], r['p90']))
+    return [r['resolver'] for r in healthy[:count]]
+
+def build_dns_config(default_nameserver=None, nameserver=None, fallback=None, fake_ip=False):
+    """生成配置中的 dns 段"""
+    dns = {
+        'enable': True,
+        'listen': '0.0.0.0:53',
+        'default-nameserver': list(default_nameserver or DEFAULT_UDP),
+        'nameserver': list(nameserver or DEFAULT_DOH),
+        'fallback': list(fallback or nameserver or DEFAULT_DOH),
+        'fallback-filter': {
+            'geoip': True,
+            'ipcidr': [
+                '240.0.0.0/4',
+                '0.0.0.0/32'
+            ]
+        }
+    }
+    if fake_ip:
+        # 直接返回假IP，省去建立连接前等待真实解析的时间
+        dns['enhanced-mode'] = 'fake-ip'
+        dns['fake-ip-range'] = '198.18.0.1/16'
+        dns['fake-ip-filter'] = list(FAKE_IP_FILTER)
+    return dns
+
+def load_bench(path=DNS_BENCH_FILE):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_bench(data, path=DNS_BENCH_FILE):
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    except OSError:
+        pass
+
+def fastest_dns_config(fake_ip=False, ttl=DNS_BENCH_TTL, path=DNS_BENCH_FILE, **bench_options):
+    """返回由最快健康解析器组成的 dns 段，测速结果在 ttl 秒内复用
+
+    某类解析器全部不健康时该项使用默认值；候选解析器或测试域名变化后缓存失效，重新测速。
+    """
+    candidates = {'udp': list(bench_options.get('udp', CANDIDATE_UDP)),
+                  'doh': list(bench_options.get('doh', CANDIDATE_DOH)),
+                  'domains': list(bench_options.get('domains', TEST_DOMAINS))}
+    cached = load_bench(path)
+    if (ttl and time.time() - cached.get('time', 0) < ttl and cached.get('results')
+            and cached.get('candidates') == candidates):
+        results = cached['results']
+    else:
+        results = benchmark_resolvers(**bench_options)
+        save_bench({'time': time.time(), 'candidates': candidates, 'results': results}, path)
+    return build_dns_config(select_resolvers(results, 'udp'), select_resolvers(results, 'doh'), fake_ip=fake_ip)
+
+def print_results(results):
+    """打印解析器测速结果"""
+    print(f"{'解析器':<40} {'类型':<5} {'p50':>7} {'p90':>7} {'失败率':>7}")
+    for r in sorted(results, key=lambda r: (r['p50'] is None, r['p50'] or 0)):
+        p50 = "-" if r['p50'] is None else f"{r['p50']:.0f}ms"
+        p90 = "-" if r['p90'] is None else f"{r['p90']:.0f}ms"
+        print(f"{r['resolver']:<40} {r['kind']:<5} {p50:>7} {p90:>7} {r['failure_rate']:>7.0%}")
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="Clash DNS 上游测速")
+    parser.add_argument("--udp", action="append", help="UDP解析器（可重复，支持 地址:端口），默认使用内置候选")
+    parser.add_argument("--doh", action="append", help="DoH地址（可重复），默认使用内置候选")
+    parser.add_argument("--domain", action="append", help="测试域名（可重复）")
+    parser.add_argument("--rounds", type=int, default=3, help="测速轮数")
+    parser.add_argument("--concurrency", type=int, default=32, help="最大并发查询数")
+    parser.add_argument("--timeout", type=float, default=2.0, help="单次查询超时（秒）")
+    parser.add_argument("--json", dest="json_path", help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    results = benchmark_resolvers(
+        udp=args.udp if args.udp is not None else CANDIDATE_UDP,
+        doh=args.doh if args.doh is not None else CANDIDATE_DOH,
+        domains=args.domain or TEST_DOMAINS,
+        rounds=max(1, args.rounds),
+        concurrency=max(1, args.concurrency),
+        timeout=args.timeout
+    )
+    print_results(results)
+    print(f"\n✅ 最快的健康解析器: UDP {select_resolvers(results, 'udp')}, DoH {select_resolvers(results, 'doh')}")
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Docker 容器控制层
+通过 /var/run/docker.sock 上的一条持久HTTP连接访问Docker Engine API，返回结构化数据；
+socket不可用时回退到docker命令行
+"""
+
+import io
+import os
+import json
+import shlex
+import socket
+import struct
+import tarfile
+import subprocess
+import http.client
+from urllib.parse import quote, urlencode
+
+DEFAULT_SOCKET = "/var/run/docker.sock"
+API_VERSION = "v1.41"
+
+class DockerError(Exception):
+    """Docker API返回错误"""
+
+    def __init__(self, status, message):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+        self.message = message
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """基于unix socket的HTTP连接"""
+
+    def __init__(self, socket_path, timeout=10):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+class DockerClient:
+    """Docker Engine API客户端，复用同一条keep-alive连接"""
+
+    def __init__(self, socket_path=None, timeout=10):
+        self.socket_path = socket_path or docker_socket_path()
+        self.timeout = timeout
+        self.conn = UnixHTTPConnection(self.socket_path, timeout)
+
+    def close(self):
+        self.conn.close()
+
+    def request(self, method, path, params=None, body=None, headers=None, raw=False):
+        """发送请求，返回解析后的JSON（raw=True时返回字节）
+
+        连接层的错误（包括 http.client 的协议错误）都以 OSError 抛出。
+        """
+        url = f"/{API_VERSION}{path}"
+        if params:
+            url += "?" + urlencode(params)
+        headers = dict(headers or {})
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+            headers.setdefault("Content-Type", "application/json")
+        for attempt in range(2):
+            try:
+                self.conn.request(method, url, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.RemoteDisconnected, http.client.ImproperConnectionState,
+                    BrokenPipeError, ConnectionResetError) as e:
+                # 服务端关闭了空闲连接，或连接停留在未读完的状态，丢弃连接后重连重试一次
+                self.conn.close()
+                if attempt:
+                    raise ConnectionError(f"Docker API连接失败: {e!r}") from e
+            except http.client.HTTPException as e:
+                # 响应无法解析，连接状态不可信：丢弃连接，转为OSError由调用方回退到命令行
+                self.conn.close()
+                raise ConnectionError(f"Docker API响应异常: {e!r}") from e
+            except OSError:
+                self.conn.close()
+                raise
+        if response.status >= 400:
+            try:
+                message = json.loads(data).get("message", "")
+            except ValueError:
+                message = data.decode(errors="replace")
+            raise DockerError(response.status, message)
+        if raw:
+            return data
+        return json.loads(data) if data else None
+
+    def ping(self):
+        return self.request("GET", "/_ping", raw=True) == b"OK"
+
+    def containers(self, name=None, include_stopped=True):
+        """列出容器"""
+        params = {"all": "1" if include_stopped else "0"}
+        if name:
+            params["filters"] = json.dumps({"name": [name]})
+        return self.request("GET", "/containers/json", params)
+
+    def inspect(self, name):
+        return self.request("GET", f"/containers/{quote(name)}/json")
+
+    def start(self, name):
+        self.request("POST", f"/containers/{quote(name)}/start")
+
+    def stop(self, name, timeout=10):
+        self.request("POST", f"/containers/{quote(name)}/stop", {"t": timeout})
+
+    def restart(self, name, timeout=10):
+        self.request("POST", f"/containers/{quote(name)}/restart", {"t": timeout})
+
+    def remove(self, name, force=True):
+        self.request("DELETE", f"/containers/{quote(name)}", {"force": "1" if force else "0"})
+
+    def remove_image(self, image, force=False):
+        return self.request("DELETE", f"/images/{quote(image, safe='')}", {"force": "1" if force else "0"})
+
+    def prune(self, kind):
+        """清理未使用的 containers/volumes/networks/images"""
+        return self.request("POST", f"/{kind}/prune")
+
+    def exec(self, name, cmd):
+        """在容器中执行命令，返回 (退出码, 输出文本)"""
+        exec_id = self.request("POST", f"/containers/{quote(name)}/exec", body={
+            "Cmd": cmd, "AttachStdout": True, "AttachStderr": True
+        })["Id"]
+        stream = self.request("POST", f"/exec/{exec_id}/start", body={"Detach": False, "Tty": False}, raw=True)
+        exit_code = self.request("GET", f"/exec/{exec_id}/json").get("ExitCode")
+        return exit_code, demux_stream(stream)
+
+    def copy_to(self, name, src_path, dest_dir):
+        """把本地文件复制到容器目录"""
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            tar.add(src_path, arcname=os.path.basename(src_path))
+        self.request("PUT", f"/containers/{quote(name)}/archive", {"path": dest_dir},
+                     body=buffer.getvalue(), headers={"Content-Type": "application/x-tar"})
+
+def demux_stream(data):
+    """解析Docker多路复用输出流（8字节帧头 + 内容）"""
+    output = []
+    offset = 0
+    while offset + 8 <= len(data):
+        _, size = struct.unpack(">BxxxL", data[offset:offset + 8])
+        output.append(data[offset + 8:offset + 8 + size])
+        offset += 8 + size
+    return b"".join(output).decode(errors="replace")
+
+def docker_socket_path():
+    """从DOCKER_HOST或默认位置获取socket路径"""
+    host = os.environ.get("DOCKER_HOST", "")
+    if host.startswith("unix://"):
+        return host[len("unix://"):]
+    return DEFAULT_SOCKET
+
+_client = None
+
+def get_client():
+    """返回共享的Docker客户端，socket不可用时返回None"""
+    global _client
+    if _client is None:
+        path = docker_socket_path()
+        if not os.path.exists(path):
+            return None
+        try:
+            client = DockerClient(path)
+            if not client.ping():
+                return None
+        except (OSError, DockerError):
+            return None
+        _client = client
+    return _client
+
+def _run(command):
+    """命令行回退"""
+    try:
+        result = subprocess.run(command, shell=True, capture_output=True, text=True, check=True)
+        return True, result.stdout
+    except subprocess.CalledProcessError as e:
+        return False, e.stderr
+
+def container_status(name):
+    """返回容器状态 {'name', 'state', 'health'}，容器不存在时返回None"""
+    client = get_client()
+    if client:
+        try:
+            state = client.inspect(name)["State"]
+            return {"name": name, "state": state.get("Status"),
+                    "health": (state.get("Health") or {}).get("Status")}
+        except DockerError as e:
+            if e.status == 404:
+                return None
+        except OSError:
+            pass
+    success, output = _run(
+        f"docker inspect --format '{{{{.State.Status}}}} {{{{if .State.Health}}}}{{{{.State.Health.Status}}}}{{{{end}}}}' {name}"
+    )
+    if not success or not output.strip():
+        return None
+    state, *health = output.split()
+    return {"name": name, "state": state, "health": health[0] if health else None}
+
+def container_gateway(name):
+    """返回容器所在网络的网关地址（即宿主机在该网络中的地址），获取失败时返回None"""
+    client = get_client()
+    if client:
+        try:
+            networks = client.inspect(name)["NetworkSettings"].get("Networks") or {}
+            for network in networks.values():
+                if network.get("Gateway"):
+                    return network["Gateway"]
+            return None
+        except DockerError:
+            return None
+        except OSError:
+            pass
+    success, output = _run(
+        f"docker inspect --format '{{{{range .NetworkSettings.Networks}}}}{{{{.Gateway}}}} {{{{end}}}}' {name}"
+    )
+    gateways = output.split() if success else []
+    return gateways[0] if gateways else None
+
+def container_running(name):
+    """容器是否在运行"""
+    status = container_status(name)
+    return bool(status) and status["state"] == "running"
+
+def _with_fallback(api_call, command):
+    """优先调用API，失败时执行命令行"""
+    client = get_client()
+    if client:
+        try:
+            api_call(client)
+            return True
+        except DockerError:
+            return False
+        except OSError:
+            pass
+    return _run(command)[0]
+
+def remove_container(name):
+    return _with_fallback(lambda c: c.remove(name, force=True), f"docker rm -f {name}")
+
+def remove_image(image):
+    return _with_fallback(lambda c: c.remove_image(image), f"docker rmi {image}")
+
+def restart_container(name):
+    return _with_fallback(lambda c: c.restart(name), f"docker restart {name}")
+
+def prune(kind):
+    """kind: containers/volumes/networks/images"""
+    command = {"containers": "docker container prune -f", "volumes": "docker volume prune -f",
+               "networks": "docker network prune -f", "images": "docker image prune -f"}[kind]
+    return _with_fallback(lambda c: c.prune(kind), command)
+
+def exec_in_container(name, cmd):
+    """在容器中执行命令，返回 (是否成功, 输出)"""
+    client = get_client()
+    if client:
+        try:
+            exit_code, output = client.exec(name, cmd)
+            return exit_code == 0, output
+        except DockerError as e:
+            return False, str(e)
+        except OSError:
+            pass
+    return _run(f"docker exec {name} " + " ".join(shlex.quote(part) for part in cmd))
+
+def copy_to_container(name, src_path, dest_dir):
+    """复制本地文件到容器目录"""
+    return _with_fallback(lambda c: c.copy_to(name, src_path, dest_dir),
+                          f"docker cp {src_path} {name}:{dest_dir}")
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Clash Docker 代理压力测试工具
+在本机启动HTTP/HTTPS源站，分别经7890（HTTP代理）和7891（SOCKS5）以指定并发发起请求，
+统计请求速率、吞吐量、延迟百分位、错误率，以及连接复用与每次新建连接的差异。
+源站地址属于生成配置中的局域网DIRECT规则（源配置规则未把该网段指向其他目标时），测试不需要外部网络。
+"""
+
+import os
+import ssl
+import sys
+import json
+import time
+import socket
+import struct
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+import ipaddress
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from latency_stats import percentile
+from docker_api import container_gateway
+from clash_api import load_instances
+
+PROXY_HOST = "127.0.0.1"
+HTTP_PORT = 7890
+SOCKS_PORT = 7891
+# 响应体最大长度
+MAX_BODY = 64 * 1024 * 1024
+
+class OriginHandler(BaseHTTPRequestHandler):
+    """/bytes/N 返回N字节，保持keep-alive"""
+
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分两次写出，关闭Nagle避免与客户端延迟确认叠加出40ms等待
+    disable_nagle_algorithm = True
+    payload = b"\0" * (1 << 20)
+
+    def do_GET(self):
+        try:
+            size = min(MAX_BODY, int(self.path.rsplit('/', 1)[-1]))
+        except ValueError:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        remaining = size
+        while remaining > 0:
+            chunk = self.payload[:min(remaining, len(self.payload))]
+            self.wfile.write(chunk)
+            remaining -= len(chunk)
+
+    def log_message(self, format, *args):
+        pass
+
+def generate_certificate(directory):
+    """用openssl生成自签名证书，返回 (证书, 私钥)，失败时返回None"""
+    cert, key = os.path.join(directory, "origin.crt"), os.path.join(directory, "origin.key")
+    try:
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                        "-subj", "/CN=clash-load-test", "-keyout", key, "-out", cert],
+                       capture_output=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return cert, key
+
+def start_origin(bind="127.0.0.1", port=0, tls_files=None):
+    """在后台线程启动源站，返回server；只监听容器访问源站使用的地址，不对外暴露"""
+    server = ThreadingHTTPServer((bind, port), OriginHandler)
+    server.daemon_threads = True
+    if tls_files:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*tls_files)
+        # 握手延后到处理线程中进行，不阻塞accept
+        server.socket = context.wrap_socket(server.socket, server_side=True, do_handshake_on_connect=False)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def socks5_connect(proxy_host, proxy_port, host, port, timeout):
+    """经SOCKS5代理建立到 host:port 的TCP连接（无认证）"""
+    sock = socket.create_connection((proxy_host, proxy_port), timeout=timeout)
+    try:
+        sock.sendall(b"\x05\x01\x00")
+        if recv_exact(sock, 2) != b"\x05\x00":
+            raise ConnectionError("SOCKS5协商失败")
+        try:
+            address = ipaddress.ip_address(host)
+            target = (b"\x01" if address.version == 4 else b"\x04") + address.packed
+        except ValueError:
+            target = b"\x03" + bytes([len(host)]) + host.encode()
+        sock.sendall(b"\x05\x01\x00" + target + struct.pack(">H", port))
+        reply = recv_exact(sock, 4)
+        if reply[1] != 0:
+            raise ConnectionError(f"SOCKS5连接失败: {reply[1]}")
+        # 跳过绑定地址和端口
+        address_length = {1: 4, 4: 16}.get(reply[3]) or recv_exact(sock, 1)[0]
+        recv_exact(sock, address_length + 2)
+        return sock
+    except Exception:
+        sock.close()
+        raise
+
+def recv_exact(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("连接被关闭")
+        data += chunk
+    return data
+
+def open_connection(mode, host, port, tls, timeout):
+    """建立到源站的连接，返回 (连接, 请求路径前缀)
+
+    mode: direct 直连；http 经HTTP代理（HTTPS使用CONNECT隧道）；socks5 经SOCKS5代理。
+    """
+    context = None
+    if tls:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    if mode == 'direct':
+        if tls:
+            return http.client.HTTPSConnection(host, port, timeout=timeout, context=context), ""
+        return http.client.HTTPConnection(host, port, timeout=timeout), ""
+    if mode == 'http':
+        if tls:
+            conn = http.client.HTTPSConnection(PROXY_HOST, HTTP_PORT, timeout=timeout, context=context)
+            conn.set_tunnel(host, port)
+            return conn, ""
+        return http.client.HTTPConnection(PROXY_HOST, HTTP_PORT, timeout=timeout), f"http://{host}:{port}"
+    sock = socks5_connect(PROXY_HOST, SOCKS_PORT, host, port, timeout)
+    if tls:
+        sock = context.wrap_socket(sock, server_hostname=host)
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    conn.sock = sock
+    return conn, ""
+
+def run_case(mode, host, port, tls, reuse, concurrency, duration, size, timeout):
+    """以固定并发运行一个测试场景 duration 秒，返回统计结果"""
+    deadline = time.perf_counter() + duration
+    latencies = []
+    counters = {'bytes': 0, 'errors': 0, 'connections': 0}
+    lock = threading.Lock()
+
+    def worker():
+        conn = None
+        local_latencies = []
+        local = {'bytes': 0, 'errors': 0, 'connections': 0}
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                if conn is None:
+                    conn, prefix = open_connection(mode, host, port, tls, timeout)
+                    local['connections'] += 1
+                conn.request("GET", f"{prefix}/bytes/{size}", headers={"Host": f"{host}:{port}"})
+                response = conn.getresponse()
+                body = response.read()
+                if response.status != 200 or len(body) != size:
+                    raise ConnectionError(f"HTTP {response.status}, {len(body)} 字节")
+                local_latencies.append((time.perf_counter() - start) * 1000)
+                local['bytes'] += len(body)
+                if not reuse or response.will_close:
+                    conn.close()
+                    conn = None
+            except Exception:
+                local['errors'] += 1
+                if conn is not None:
+                    conn.close()
+                    conn = None
+        if conn is not None:
+            conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            for key, value in local.items():
+                counters[key] += value
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    total = len(latencies) + counters['errors']
+    return {
+        'mode': mode,
+        'scheme': 'https' if tls else 'http',
+        'reuse': reuse,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': counters['errors'],
+        'error_rate': round(counters['errors'] / total, 4) if total else 0.0,
+        'connections': counters['connections'],
+        'rps': round(len(latencies) / elapsed, 1),
+        'mb_per_s': round(counters['bytes'] / elapsed / 1024 / 1024, 2),
+        'p50': round(percentile(latencies, 50), 2) if latencies else None,
+        'p90': round(percentile(latencies, 90), 2) if latencies else None,
+        'p99': round(percentile(latencies, 99), 2) if latencies else None
+    }
+
+def format_ms(value):
+    return "-" if value is None else f"{value:.1f}"
+
+def print_report(results):
+    """打印测试结果表，并给出连接复用带来的提升"""
+    print(f"{'路径':<8} {'协议':<6} {'复用':<4} {'请求/s':>9} {'MB/s':>8} {'p50':>7} {'p90':>7} {'p99':>7} {'错误率':>7} {'新建连接':>8}")
+    for r in results:
+        print(f"{r['mode']:<8} {r['scheme']:<6} {'是' if r['reuse'] else '否':<4} {r['rps']:>9.0f} {r['mb_per_s']:>8.1f} "
+              f"{format_ms(r['p50']):>7} {format_ms(r['p90']):>7} {format_ms(r['p99']):>7} "
+              f"{r['error_rate']:>7.1%} {r['connections']:>8}")
+    by_case = {(r['mode'], r['scheme'], r['reuse']): r for r in results}
+    for (mode, scheme, reuse), r in by_case.items():
+        fresh = by_case.get((mode, scheme, False))
+        if reuse and fresh and fresh['rps']:
+            print(f"💡 {mode}/{scheme} 连接复用: 请求速率 {r['rps'] / fresh['rps']:.1f}x")
+
+def run_load_test(modes=('http', 'socks5'), reuse=(True, False), concurrency=32, duration=10,
+                  size=16384, timeout=10, https=False, origin_host=None, json_path=None):
+    """启动源站并依次运行所有场景，返回结果列表"""
+    if origin_host is None:
+        # 容器在bridge网络中，通过网关地址访问宿主机上的源站；host网络或未运行容器时使用本机地址
+        origin_host = container_gateway(load_instances()[0]['name']) or "127.0.0.1"
+    schemes = [False]
+    tls_dir = tempfile.TemporaryDirectory()
+    tls_files = None
+    if https:
+        tls_files = generate_certificate(tls_dir.name)
+        if tls_files:
+            schemes.append(True)
+        else:
+            print("⚠️ 未能用openssl生成证书，跳过HTTPS测试")
+
+    servers = {tls: start_origin(origin_host, 0, tls_files if tls else None) for tls in schemes}
+    print(f"🔄 源站: {origin_host} (HTTP端口 {servers[False].server_address[1]}"
+          f"{f', HTTPS端口 {servers[True].server_address[1]}' if True in servers else ''})，"
+          f"并发 {concurrency}，每项 {duration}s，响应 {size} 字节")
+    results = []
+    try:
+        for mode in modes:
+            for tls in schemes:
+                for reuse_flag in reuse:
+                    result = run_case(mode, origin_host, servers[tls].server_address[1], tls, reuse_flag,
+                                      concurrency, duration, size, timeout)
+                    results.append(result)
+                    print(f"   {mode}/{result['scheme']}/{'复用' if reuse_flag else '新建'}: "
+                          f"{result['rps']:.0f} 请求/s, 错误率 {result['error_rate']:.1%}")
+    finally:
+        for server in servers.values():
+            server.shutdown()
+            server.server_close()
+        tls_dir.cleanup()
+
+    print()
+    print_report(results)
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存到: {json_path}")
+    return results
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="Clash Docker 代理压力测试")
+    parser.add_argument("--mode", action="append", choices=["direct", "http", "socks5"],
+                        help="请求路径（可重复，默认 http 和 socks5；direct 为不经代理的基线）")
+    parser.add_argument("--reuse", choices=["both", "on", "off"], default="both", help="是否复用连接")
+    parser.add_argument("--concurrency", type=int, default=32, help="并发连接数")
+    parser.add_argument("--duration", type=float, default=10, help="每个场景的持续时间（秒）")
+    parser.add_argument("--size", type=int, default=16384, help="每个响应的字节数")
+    parser.add_argument("--timeout", type=float, default=10, help="单次请求超时（秒）")
+    parser.add_argument("--https", action="store_true", help="同时测试HTTPS源站（需要openssl）")
+    parser.add_argument("--origin-host", help="容器访问源站使用的地址，源站只监听该地址（默认为clash容器网络的网关）")
+    parser.add_argument("--json", dest="json_path", help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    reuse = {"both": (True, False), "on": (True,), "off": (False,)}[args.reuse]
+    results = run_load_test(args.mode or ("http", "socks5"), reuse, max(1, args.concurrency),
+                            args.duration, max(0, args.size), args.timeout, args.https,
+                            args.origin_host, args.json_path)
+    sys.exit(0 if results and all(r['requests'] for r in results) else 1)
+
+if __name__ == "__main__":
+    main()
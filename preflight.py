@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Clash 节点预检工具
+在生成配置前并发探测每个节点 server:port 的TCP连接（需要时完成TLS握手），
+整个阶段有全局截止时间，结果按TTL缓存，重复启动时不会重新探测
+"""
+
+import os
+import ssl
+import sys
+import json
+import time
+import socket
+from concurrent.futures import ThreadPoolExecutor, wait
+from yaml_io import load_yaml
+
+# 探测结果缓存
+PROBE_CACHE_FILE = "config/.probe_cache.json"
+# 缓存有效期（秒）
+PROBE_TTL = 3600
+# 基于UDP的协议，无法用TCP探测，直接视为可用
+UDP_TYPES = {'hysteria', 'hysteria2', 'tuic', 'wireguard'}
+# 总是使用TLS的协议
+TLS_TYPES = {'trojan'}
+
+def probe_target(proxy):
+    """返回节点的探测目标 (server, port, sni)，不需要TLS时sni为None，无法探测时返回None"""
+    server = proxy.get('server')
+    port = proxy.get('port')
+    if not server or not port or str(proxy.get('type', '')).lower() in UDP_TYPES:
+        return None
+    try:
+        port = int(port)
+    except (TypeError, ValueError):
+        return None
+    sni = None
+    if proxy.get('tls') or str(proxy.get('type', '')).lower() in TLS_TYPES:
+        sni = proxy.get('sni') or proxy.get('servername') or server
+    return str(server), port, sni
+
+def target_key(target):
+    return "{}:{}|{}".format(*target)
+
+def probe(server, port, sni=None, timeout=2.0):
+    """TCP连接（及TLS握手），成功返回耗时毫秒，失败返回None"""
+    start = time.perf_counter()
+    try:
+        with socket.create_connection((server, port), timeout=timeout) as sock:
+            if sni:
+                # 只确认握手能完成，节点证书常为自签名，不加载CA也不做校验
+                context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+                with context.wrap_socket(sock, server_hostname=sni):
+                    pass
+    except (OSError, ssl.SSLError):
+        return None
+    return round((time.perf_counter() - start) * 1000, 1)
+
+def load_probe_cache(path=PROBE_CACHE_FILE):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_probe_cache(cache, path=PROBE_CACHE_FILE):
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+    except OSError:
+        pass
+
+def probe_proxies(proxies, deadline=5.0, concurrency=64, timeout=2.0, ttl=PROBE_TTL,
+                  cache_path=PROBE_CACHE_FILE):
+    """并发探测节点，返回 (节点名 -> True/False/None, 统计信息)
+
+    None 表示无法探测或截止时间前未完成，这类节点保持原样。
+    相同 server:port 的节点只探测一次；未过期的缓存结果直接使用。
+    """
+    started = time.monotonic()
+    now = time.time()
+    cache = {key: entry for key, entry in load_probe_cache(cache_path).items()
+             if now - entry.get('time', 0) < ttl} if ttl else {}
+    targets = {}
+    probe_args = {}
+    for proxy in proxies:
+        if isinstance(proxy, dict) and proxy.get('name'):
+            target = probe_target(proxy)
+            key = target_key(target) if target else None
+            targets[str(proxy['name'])] = key
+            if key:
+                probe_args[key] = target
+
+    pending = [key for key in probe_args if key not in cache]
+    stats = {'targets': len(probe_args), 'cached': len(probe_args) - len(pending),
+             'probed': len(pending), 'timed_out': 0}
+
+    if pending:
+        executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(pending))))
+        futures = {executor.submit(probe, *probe_args[key], min(timeout, deadline)): key for key in pending}
+        done, not_done = wait(futures, timeout=max(0, deadline - (time.monotonic() - started)))
+        executor.shutdown(wait=False, cancel_futures=True)
+        for future in done:
+            cache[futures[future]] = {'latency': future.result(), 'time': now}
+        stats['timed_out'] = len(not_done)
+        save_probe_cache(cache, cache_path)
+
+    results = {}
+    for name, key in targets.items():
+        entry = cache.get(key) if key else None
+        results[name] = None if entry is None else entry['latency'] is not None
+    stats['reachable'] = sum(1 for ok in results.values() if ok)
+    stats['unreachable'] = sum(1 for ok in results.values() if ok is False)
+    return results, stats
+
+def prune_unreachable(config, results, policy='drop'):
+    """按探测结果处理不可达节点（原地修改）
+
+    drop: 从 proxies 中删除，代理组中的悬空成员由随后的节点规范化阶段清理；
+    demote: 保留节点，但在 proxies 和每个代理组中移到最后。
+    返回受影响的节点数。
+    """
+    dead = {name for name, ok in results.items() if ok is False}
+    if not dead:
+        return 0
+    proxies = config.get('proxies') or []
+    if policy == 'drop':
+        config['proxies'] = [p for p in proxies if not (isinstance(p, dict) and str(p.get('name')) in dead)]
+        return len(dead)
+
+    def demoted(items, name_of):
+        return sorted(items, key=lambda item: name_of(item) in dead)
+    config['proxies'] = demoted(proxies, lambda p: str(p.get('name')) if isinstance(p, dict) else None)
+    for group in config.get('proxy-groups') or []:
+        if isinstance(group, dict) and isinstance(group.get('proxies'), list):
+            group['proxies'] = demoted(group['proxies'], str)
+    return len(dead)
+
+def main():
+    """命令行入口：探测配置文件中的节点并输出不可达列表"""
+    if len(sys.argv) != 2:
+        print("用法: python3 preflight.py config.yaml")
+        sys.exit(1)
+    if not os.path.exists(sys.argv[1]):
+        print(f"❌ 配置文件不存在: {sys.argv[1]}", file=sys.stderr)
+        sys.exit(1)
+
+    with open(sys.argv[1], 'r', encoding='utf-8') as f:
+        config = load_yaml(f) or {}
+    results, stats = probe_proxies(config.get('proxies') or [], ttl=0)
+    for name, ok in results.items():
+        if ok is False:
+            print(name)
+    print(f"✅ 预检完成: 可达 {stats['reachable']}, 不可达 {stats['unreachable']}, "
+          f"未完成 {stats['timed_out']}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
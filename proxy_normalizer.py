@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Clash 节点规范化工具
+按名称和服务器身份建立索引，合并重复节点，把代理组成员改写为保留下来的节点名，
+并删除指向不存在节点的成员，整个过程只遍历一次节点和代理组
+"""
+
+import os
+import sys
+import json
+from yaml_io import load_yaml
+
+# 名称包含该标记的节点和代理组成员会被过滤
+EXCLUDE_MARKER = 'Auto - UrlTest'
+# Clash内置出站，可以直接作为代理组成员
+BUILTIN_OUTBOUNDS = {'DIRECT', 'REJECT', 'REJECT-DROP', 'PASS', 'COMPATIBLE'}
+# 代理组中引用节点的字段
+GROUP_MEMBER_KEYS = ('proxies', 'all')
+
+def node_identity(proxy):
+    """返回节点的服务器身份：除名称外的全部字段（类型、地址、端口、凭据、传输参数）
+
+    服务器地址不区分大小写，字段顺序不影响结果。
+    """
+    fields = {key: value for key, value in proxy.items() if key != 'name'}
+    if isinstance(fields.get('server'), str):
+        fields['server'] = fields['server'].strip().lower()
+    return json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str)
+
+def index_proxies(proxies, exclude=EXCLUDE_MARKER):
+    """建立名称索引并合并重复节点，返回 (保留的节点, 名称 -> 保留的节点名, 统计信息)"""
+    kept = []
+    names = {}
+    identities = {}
+    stats = {'before': len(proxies), 'invalid': 0, 'excluded': 0, 'duplicate_name': 0, 'duplicate': 0}
+
+    for proxy in proxies:
+        if not isinstance(proxy, dict) or not proxy.get('name'):
+            stats['invalid'] += 1
+            continue
+        name = str(proxy['name'])
+        if exclude and exclude in name:
+            stats['excluded'] += 1
+            continue
+        if name in names:
+            # Clash不允许重名节点，保留第一个
+            stats['duplicate_name'] += 1
+            continue
+        identity = node_identity(proxy)
+        survivor = identities.get(identity)
+        if survivor is not None:
+            names[name] = survivor
+            stats['duplicate'] += 1
+            continue
+        identities[identity] = name
+        names[name] = name
+        kept.append(proxy)
+
+    stats['after'] = len(kept)
+    return kept, names, stats
+
+def rewrite_members(members, names, group_names, exclude=EXCLUDE_MARKER):
+    """把代理组成员改写为保留的节点名，去掉重复和不存在的成员，返回 (新成员列表, 删除的悬空成员数)"""
+    rewritten = []
+    seen = set()
+    dangling = 0
+    for member in members:
+        member = str(member)
+        if exclude and exclude in member:
+            continue
+        target = names.get(member)
+        if target is None:
+            if member in group_names or member.upper() in BUILTIN_OUTBOUNDS:
+                target = member
+            else:
+                dangling += 1
+                continue
+        if target not in seen:
+            seen.add(target)
+            rewritten.append(target)
+    return rewritten, dangling
+
+def normalize_proxies(config, exclude=EXCLUDE_MARKER):
+    """规范化配置中的 proxies 和 proxy-groups（原地修改），返回统计信息
+
+    统计信息中的 aliases 记录被合并的节点名 -> 保留的节点名，可用于改写规则目标。
+    """
+    proxies, names, stats = index_proxies(config.get('proxies') or [], exclude)
+    config['proxies'] = proxies
+
+    groups = [g for g in config.get('proxy-groups') or [] if isinstance(g, dict)]
+    group_names = {str(g.get('name')) for g in groups}
+    stats['dangling'] = 0
+    stats['emptied'] = 0
+    for group in groups:
+        for key in GROUP_MEMBER_KEYS:
+            if isinstance(group.get(key), list):
+                group[key], dangling = rewrite_members(group[key], names, group_names, exclude)
+                stats['dangling'] += dangling
+        # 没有成员也没有proxy-provider的代理组会导致Clash加载失败；
+        # 改为REJECT，原本应走代理的流量不会被悄悄改为直连
+        if 'proxies' in group and not group['proxies'] and not group.get('use'):
+            group['proxies'] = ['REJECT']
+            stats['emptied'] += 1
+    if 'proxy-groups' in config:
+        config['proxy-groups'] = groups
+
+    stats['removed'] = stats['before'] - stats['after']
+    stats['aliases'] = {name: target for name, target in names.items() if name != target}
+    return stats
+
+def main():
+    """命令行入口：输出配置文件中的重复节点统计"""
+    if len(sys.argv) != 2:
+        print("用法: python3 proxy_normalizer.py config.yaml")
+        sys.exit(1)
+    if not os.path.exists(sys.argv[1]):
+        print(f"❌ 配置文件不存在: {sys.argv[1]}", file=sys.stderr)
+        sys.exit(1)
+
+    with open(sys.argv[1], 'r', encoding='utf-8') as f:
+        config = load_yaml(f) or {}
+    stats = normalize_proxies(config)
+    for name, target in sorted(stats['aliases'].items()):
+        print(f"{name} -> {target}")
+    print(f"✅ 节点规范化完成: {stats['before']} -> {stats['after']} "
+          f"(重复 {stats['duplicate']}, 重名 {stats['duplicate_name']}, 过滤 {stats['excluded']}, "
+          f"无效 {stats['invalid']}, 悬空成员 {stats['dangling']}, 清空的代理组 {stats['emptied']})", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
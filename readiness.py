@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Clash 就绪检测与启动阶段计时
+以指数退避轮询API和代理端口，服务可用即返回，不再固定等待
+"""
+
+import time
+import socket
+from contextlib import contextmanager
+import requests
+from clash_api import ClashAPI
+
+PROXY_HOST = "127.0.0.1"
+PROXY_PORT = 7890
+
+# 各启动阶段耗时（秒），按执行顺序记录
+PHASE_TIMES = {}
+
+@contextmanager
+def timed_phase(name):
+    """记录一个启动阶段的耗时"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_TIMES[name] = PHASE_TIMES.get(name, 0) + time.perf_counter() - start
+
+def print_phase_timings():
+    """打印各阶段耗时"""
+    if not PHASE_TIMES:
+        return
+    total = sum(PHASE_TIMES.values()) or 1e-9
+    print("\n⏱️  启动阶段耗时:")
+    for name, seconds in PHASE_TIMES.items():
+        print(f"   {name:<12} {seconds * 1000:>8.0f}ms  {seconds / total:>5.0%}")
+    print(f"   {'total':<12} {total * 1000:>8.0f}ms")
+
+def backoff_delays(initial=0.05, maximum=1.0, factor=2):
+    """生成指数退避的等待时间序列"""
+    delay = initial
+    while True:
+        yield delay
+        delay = min(maximum, delay * factor)
+
+def port_open(host, port, timeout=0.5):
+    """检查TCP端口是否接受连接"""
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+def controller_ready(api):
+    """检查API是否已能响应请求（密钥不匹配返回401也说明已就绪）"""
+    try:
+        api.version()
+        return True
+    except requests.exceptions.HTTPError as e:
+        return e.response.status_code == 401
+    except requests.exceptions.RequestException:
+        return False
+
+def wait_until_ready(api=None, timeout=60, proxy_host=PROXY_HOST, proxy_port=PROXY_PORT):
+    """等待API和代理端口都可用，返回耗时（秒），超时返回None"""
+    start = time.perf_counter()
+    # 轮询本身负责重试，客户端不再额外重试
+    own_api = api is None
+    api = api or ClashAPI(retries=0)
+    api_up = False
+    try:
+        for delay in backoff_delays():
+            api_up = api_up or controller_ready(api)
+            if api_up and port_open(proxy_host, proxy_port):
+                return time.perf_counter() - start
+            remaining = timeout - (time.perf_counter() - start)
+            if remaining <= 0:
+                return None
+            time.sleep(min(delay, remaining))
+    finally:
+        if own_api:
+            api.close()
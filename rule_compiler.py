@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Clash 规则编译工具
+去除重复和被前面规则完全覆盖（永远不会命中）的规则，输出等价的最小有序规则列表
+"""
+
+import os
+import sys
+import ipaddress
+from yaml_io import load_yaml
+
+# 不带payload的规则类型
+NO_PAYLOAD_TYPES = {'MATCH', 'FINAL'}
+# 规则选项（出现在目标之后）
+RULE_OPTIONS = {'no-resolve'}
+# 逻辑规则，payload 是带括号的子规则列表，其中的逗号不分隔字段
+LOGICAL_TYPES = {'AND', 'OR', 'NOT'}
+# IP网段类规则
+CIDR_TYPES = ('IP-CIDR', 'IP-CIDR6', 'SRC-IP-CIDR')
+# 域名类规则
+DOMAIN_TYPES = ('DOMAIN', 'DOMAIN-SUFFIX', 'DOMAIN-KEYWORD')
+# 会解析域名后按IP匹配的规则
+IP_TYPES = ('IP-CIDR', 'IP-CIDR6', 'GEOIP')
+# 编译器能判断匹配范围的规则类型，其他类型（逻辑规则、未知类型）原样保留，不去重也不规范化
+MODELED_TYPES = set(DOMAIN_TYPES) | set(CIDR_TYPES) | {'GEOIP'} | NO_PAYLOAD_TYPES
+# /connections 中的规则名称 -> 配置文件中的规则类型
+CONNECTION_RULE_TYPES = {
+    'Domain': 'DOMAIN',
+    'DomainSuffix': 'DOMAIN-SUFFIX',
+    'DomainKeyword': 'DOMAIN-KEYWORD',
+    'GeoIP': 'GEOIP',
+    'IPCIDR': 'IP-CIDR',
+    'IPCIDR6': 'IP-CIDR6',
+    'SrcIPCIDR': 'SRC-IP-CIDR',
+    'SrcPort': 'SRC-PORT',
+    'DstPort': 'DST-PORT',
+    'Process': 'PROCESS-NAME',
+    'ProcessPath': 'PROCESS-PATH',
+    'RuleSet': 'RULE-SET',
+    'Match': 'MATCH'
+}
+
+def split_rule(rule):
+    """按顶层逗号拆分规则字符串，括号内（逻辑规则的子规则）的逗号不拆分"""
+    parts = []
+    depth = 0
+    current = []
+    for char in str(rule):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth = max(0, depth - 1)
+        elif char == ',' and depth == 0:
+            parts.append(''.join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    parts.append(''.join(current).strip())
+    return parts
+
+def parse_rule(rule):
+    """解析规则字符串，返回 (类型, payload, 目标, 选项元组)
+
+    选项按原顺序原样返回；逻辑规则的 payload 为完整的括号部分。
+    """
+    parts = split_rule(rule)
+    rule_type = parts[0].upper()
+    if rule_type in NO_PAYLOAD_TYPES:
+        return rule_type, '', parts[1] if len(parts) > 1 else '', tuple(parts[2:])
+    if len(parts) < 3:
+        return rule_type, parts[1] if len(parts) > 1 else '', '', ()
+    return rule_type, parts[1], parts[2], tuple(parts[3:])
+
+def is_modeled(rule_type, options):
+    """规则的匹配范围是否能被编译器判断（已知类型且只带已知选项）"""
+    return rule_type in MODELED_TYPES and all(option in RULE_OPTIONS for option in options)
+
+def normalize_payload(rule_type, payload):
+    """规范化payload，域名类规则不区分大小写
+
+    DOMAIN/DOMAIN-SUFFIX 去掉开头的点（Clash 按后缀匹配时会忽略它）；
+    DOMAIN-KEYWORD 是子串匹配，点是关键字的一部分，只转小写。
+    """
+    if rule_type in ('DOMAIN', 'DOMAIN-SUFFIX'):
+        payload = payload.lower()
+        return payload[1:] if payload.startswith('.') else payload
+    if rule_type == 'DOMAIN-KEYWORD':
+        return payload.lower()
+    return payload
+
+def rule_key(rule):
+    """返回用于统计命中次数的规则键 (类型, payload)"""
+    rule_type, payload, _, _ = parse_rule(rule)
+    return rule_type, normalize_payload(rule_type, payload)
+
+def format_rule(rule_type, payload, target, options=()):
+    """将规则组件拼接为规则字符串"""
+    if rule_type in NO_PAYLOAD_TYPES:
+        return ','.join([rule_type, target, *options])
+    return ','.join([rule_type, payload, target, *options])
+
+def rename_target(rule, aliases):
+    """按 {旧名称: 新名称} 改写规则目标，目标不在映射中时原样返回"""
+    rule_type, payload, target, options = parse_rule(rule)
+    if target not in aliases:
+        return rule
+    return format_rule(rule_type, payload, aliases[target], options)
+
+def domain_suffixes(domain):
+    """返回域名本身及其所有上级后缀"""
+    labels = domain.split('.')
+    return ['.'.join(labels[i:]) for i in range(len(labels))]
+
+def new_rule_index():
+    """创建规则索引，记录已出现的规则用于判断后续规则是否被覆盖"""
+    return {
+        'exact': set(),
+        'suffixes': set(),
+        'domains': set(),
+        'keywords': [],
+        'networks': {}  # (类型, IP版本, 选项) -> {前缀长度: set(网段)}
+    }
+
+def is_shadowed(index, rule_type, payload, options):
+    """判断规则能匹配的所有连接是否都已被前面的规则匹配"""
+    if (rule_type, payload, options) in index['exact']:
+        return True
+    if rule_type in ('DOMAIN-SUFFIX', 'DOMAIN'):
+        if any(s in index['suffixes'] for s in domain_suffixes(payload)):
+            return True
+        if rule_type == 'DOMAIN' and payload in index['domains']:
+            return True
+        return any(k in payload for k in index['keywords'])
+    if rule_type == 'DOMAIN-KEYWORD':
+        return any(k in payload for k in index['keywords'])
+    if rule_type in CIDR_TYPES:
+        network = parse_network(payload)
+        if network is None:
+            return False
+        by_length = index['networks'].get((rule_type, network.version, options), {})
+        return any(
+            network.supernet(new_prefix=length) in nets
+            for length, nets in by_length.items() if length <= network.prefixlen
+        )
+    return False
+
+def add_to_index(index, rule_type, payload, options):
+    """将规则加入索引"""
+    index['exact'].add((rule_type, payload, options))
+    if rule_type == 'DOMAIN-SUFFIX':
+        index['suffixes'].add(payload)
+    elif rule_type == 'DOMAIN':
+        index['domains'].add(payload)
+    elif rule_type == 'DOMAIN-KEYWORD':
+        index['keywords'].append(payload)
+    elif rule_type in CIDR_TYPES:
+        network = parse_network(payload)
+        if network is not None:
+            key = (rule_type, network.version, options)
+            index['networks'].setdefault(key, {}).setdefault(network.prefixlen, set()).add(network)
+
+def parse_network(payload):
+    """解析CIDR，无效时返回None"""
+    try:
+        return ipaddress.ip_network(payload, strict=False)
+    except ValueError:
+        return None
+
+def compile_rules(rules):
+    """编译规则列表，返回 (编译后的规则, 统计信息)
+
+    只删除永远不会命中的规则，保证匹配结果与原列表完全一致：
+    重复规则、被前面更宽的 DOMAIN-SUFFIX/DOMAIN-KEYWORD/IP-CIDR 覆盖的规则，以及 MATCH 之后的规则。
+    逻辑规则、未知类型和带未知选项的规则原样保留。
+    """
+    index = new_rule_index()
+    compiled = []
+    stats = {'before': len(rules), 'duplicate': 0, 'shadowed': 0, 'unreachable': 0}
+
+    for i, rule in enumerate(rules):
+        rule_type, payload, target, options = parse_rule(rule)
+        if not is_modeled(rule_type, options):
+            compiled.append(str(rule).strip())
+            continue
+        payload = normalize_payload(rule_type, payload)
+        options = tuple(sorted(options))
+
+        if (rule_type, payload, options) in index['exact']:
+            stats['duplicate'] += 1
+            continue
+        if is_shadowed(index, rule_type, payload, options):
+            stats['shadowed'] += 1
+            continue
+
+        add_to_index(index, rule_type, payload, options)
+        compiled.append(format_rule(rule_type, payload, target, options))
+        if rule_type in NO_PAYLOAD_TYPES:
+            stats['unreachable'] = len(rules) - i - 1
+            break
+
+    stats['after'] = len(compiled)
+    return compiled, stats
+
+def domains_overlap(a_type, a, b_type, b):
+    """判断两条域名类规则是否可能匹配同一个域名"""
+    if 'DOMAIN-KEYWORD' in (a_type, b_type):
+        # 关键字规则难以精确判断，保守地认为会重叠
+        return True
+    if a_type == 'DOMAIN' and b_type == 'DOMAIN':
+        return a == b
+    if a_type == 'DOMAIN':
+        return b in domain_suffixes(a)
+    if b_type == 'DOMAIN':
+        return a in domain_suffixes(b)
+    return a in domain_suffixes(b) or b in domain_suffixes(a)
+
+def resolves_domain(rule):
+    """规则是否会解析域名（不带no-resolve的IP-CIDR/GEOIP），解析后的IP对后续所有IP规则可见"""
+    rule_type, _, _, options = parse_rule(rule)
+    return rule_type in IP_TYPES and 'no-resolve' not in options
+
+def rules_overlap(a, b, resolved=True):
+    """判断两条规则是否可能匹配同一个连接（无法确定时返回True）
+
+    resolved 表示两条规则之前是否已有会解析域名的规则：一旦解析过，
+    带no-resolve的IP规则也会按解析出的IP匹配域名连接。
+    """
+    a_type, a_payload, _, a_options = parse_rule(a)
+    b_type, b_payload, _, b_options = parse_rule(b)
+    if not is_modeled(a_type, a_options) or not is_modeled(b_type, b_options):
+        return True
+    a_payload = normalize_payload(a_type, a_payload)
+    b_payload = normalize_payload(b_type, b_payload)
+
+    if a_type in DOMAIN_TYPES and b_type in DOMAIN_TYPES:
+        return domains_overlap(a_type, a_payload, b_type, b_payload)
+    if a_type in DOMAIN_TYPES and b_type in IP_TYPES:
+        # 带no-resolve的IP规则不会解析域名，前面也没有规则解析过时才与域名规则互不相交
+        return resolved or 'no-resolve' not in b_options
+    if b_type in DOMAIN_TYPES and a_type in IP_TYPES:
+        return resolved or 'no-resolve' not in a_options
+    if a_type in CIDR_TYPES and b_type in CIDR_TYPES:
+        if (a_type == 'SRC-IP-CIDR') != (b_type == 'SRC-IP-CIDR'):
+            return True
+        a_net, b_net = parse_network(a_payload), parse_network(b_payload)
+        if a_net is None or b_net is None:
+            return True
+        return a_net.version == b_net.version and a_net.overlaps(b_net)
+    return True
+
+def reorder_rules(rules, hits):
+    """按命中次数把热点规则前移，返回 (新规则列表, 移动的规则数)
+
+    只交换相邻且互不冲突（不会匹配同一连接，或目标相同）的规则，
+    因此每个连接命中的目标与原列表完全一致；MATCH 始终保持在最后。
+    """
+    ordered = list(rules)
+    counts = [hits.get(rule_key(rule), 0) for rule in ordered]
+    targets = [parse_rule(rule)[2] for rule in ordered]
+    resolving = [resolves_domain(rule) for rule in ordered]
+    positions = {rule: i for i, rule in enumerate(ordered)}
+
+    for i in range(1, len(ordered)):
+        if counts[i] == 0 or rule_key(ordered[i])[0] in NO_PAYLOAD_TYPES:
+            continue
+        j = i
+        while j > 0 and counts[j - 1] < counts[j]:
+            if targets[j - 1] != targets[j] and rules_overlap(ordered[j - 1], ordered[j],
+                                                              resolved=any(resolving[:j - 1])):
+                break
+            for seq in (ordered, counts, targets, resolving):
+                seq[j - 1], seq[j] = seq[j], seq[j - 1]
+            j -= 1
+
+    moved = sum(1 for i, rule in enumerate(ordered) if i < positions[rule])
+    return ordered, moved
+
+def load_rule_file(file_path):
+    """读取用户规则文件，支持YAML（rules/payload列表）和每行一条规则的文本文件"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    if file_path.endswith(('.yaml', '.yml')):
+        data = load_yaml(content) or {}
+        if isinstance(data, dict):
+            data = data.get('rules') or data.get('payload') or []
+        return [str(rule).strip() for rule in data if str(rule).strip()]
+
+    rules = []
+    for line in content.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if line.startswith('- '):
+            line = line[2:].strip().strip('\'"')
+        if line:
+            rules.append(line)
+    return rules
+
+def load_rule_files(paths):
+    """按顺序读取多个规则文件"""
+    rules = []
+    for path in paths or []:
+        rules.extend(load_rule_file(path))
+    return rules
+
+def main():
+    """命令行入口：编译规则文件并输出结果"""
+    if len(sys.argv) < 2:
+        print("用法: python3 rule_compiler.py 规则文件... [> compiled.txt]")
+        sys.exit(1)
+
+    missing = [p for p in sys.argv[1:] if not os.path.exists(p)]
+    if missing:
+        print(f"❌ 规则文件不存在: {', '.join(missing)}", file=sys.stderr)
+        sys.exit(1)
+
+    compiled, stats = compile_rules(load_rule_files(sys.argv[1:]))
+    for rule in compiled:
+        print(rule)
+    print(f"✅ 规则编译完成: {stats['before']} -> {stats['after']} "
+          f"(重复 {stats['duplicate']}, 被覆盖 {stats['shadowed']}, MATCH后 {stats['unreachable']})",
+          file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Clash rule-provider 编译工具
+下载（或从本地缓存读取）rule-provider 内容，把 RULE-SET 规则展开为排序、合并后的内联规则，
+内容按哈希缓存解析结果，只有内容变化的规则集才会重新解析
+"""
+
+import os
+import sys
+import json
+import hashlib
+import ipaddress
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from yaml_io import load_yaml
+from rule_compiler import parse_rule, format_rule, split_rule, IP_TYPES
+
+# 规则集缓存目录和索引
+PROVIDER_DIR = "config/rule_providers"
+PROVIDER_INDEX = os.path.join(PROVIDER_DIR, "index.json")
+# 展开后同一规则集内的排列顺序：先匹配域名，最后才是需要解析IP的规则
+EXPAND_ORDER = ('DOMAIN-SUFFIX', 'DOMAIN', 'DOMAIN-KEYWORD', 'IP-CIDR', 'IP-CIDR6')
+# 解析结果格式版本，解析规则变化时递增，旧的解析结果会被重新生成
+PARSE_VERSION = 3
+
+def print_status(message, status="INFO"):
+    """打印状态信息"""
+    emoji_map = {
+        "INFO": "ℹ️",
+        "SUCCESS": "✅",
+        "ERROR": "❌",
+        "WARNING": "⚠️",
+        "PROCESSING": "🔄"
+    }
+    emoji = emoji_map.get(status, "ℹ️")
+    print(f"{emoji} {message}")
+
+def load_index():
+    try:
+        with open(PROVIDER_INDEX, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_index(index):
+    try:
+        with open(PROVIDER_INDEX, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2, sort_keys=True)
+    except OSError as e:
+        print_status(f"保存规则集索引失败: {e}", "WARNING")
+
+def entries_path(digest):
+    """按内容哈希和解析版本保存的解析结果路径"""
+    return os.path.join(PROVIDER_DIR, f"{digest[:16]}-v{PARSE_VERSION}.json")
+
+def payload_lines(content):
+    """提取规则集条目，支持YAML（payload列表）和每行一条的文本格式"""
+    text = content.decode('utf-8', errors='replace')
+    try:
+        data = load_yaml(text)
+    except Exception:
+        data = None
+    if isinstance(data, dict) and isinstance(data.get('payload'), list):
+        return [str(item).strip() for item in data['payload'] if str(item).strip()]
+    lines = []
+    for line in text.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if line.startswith('- '):
+            line = line[2:].strip().strip('\'"')
+        if line and line != 'payload:':
+            lines.append(line)
+    return lines
+
+def parse_payload(lines, behavior):
+    """把规则集条目转换为 [类型, payload, 选项列表]，返回 (条目, 无法等价转换的条目数)
+
+    domain 规则集中 '+.域名' 即 DOMAIN-SUFFIX；'.域名' 只匹配子域名，
+    同一规则集中还有该域名本身时两者合起来与 DOMAIN-SUFFIX 等价。
+    """
+    entries = []
+    unsupported = 0
+    subdomains = []
+    for line in lines:
+        if behavior == 'domain':
+            line = line.lower()
+            if '*' in line:
+                # 单级通配没有等价的内联规则
+                unsupported += 1
+            elif line.startswith('+.'):
+                entries.append(['DOMAIN-SUFFIX', line[2:], []])
+            elif line.startswith('.'):
+                subdomains.append(line[1:])
+            else:
+                entries.append(['DOMAIN', line, []])
+        elif behavior == 'ipcidr':
+            try:
+                network = ipaddress.ip_network(line, strict=False)
+            except ValueError:
+                unsupported += 1
+                continue
+            entries.append(['IP-CIDR' if network.version == 4 else 'IP-CIDR6', str(network), []])
+        else:
+            parts = split_rule(line)
+            if len(parts) < 2 or parts[0].upper() in ('RULE-SET', 'SCRIPT', 'MATCH'):
+                unsupported += 1
+                continue
+            rule_type, payload = parts[0].upper(), parts[1]
+            if rule_type in ('IP-CIDR', 'IP-CIDR6'):
+                try:
+                    network = ipaddress.ip_network(payload, strict=False)
+                except ValueError:
+                    unsupported += 1
+                    continue
+                rule_type, payload = 'IP-CIDR' if network.version == 4 else 'IP-CIDR6', str(network)
+            entries.append([rule_type, payload, parts[2:]])
+    if subdomains:
+        exact = {payload for rule_type, payload, _ in entries if rule_type in ('DOMAIN', 'DOMAIN-SUFFIX')}
+        for domain in subdomains:
+            if domain in exact:
+                entries.append(['DOMAIN-SUFFIX', domain, []])
+            else:
+                # 只匹配子域名（不含域名本身）没有等价的内联规则
+                unsupported += 1
+    return entries, unsupported
+
+def fetch_content(session, provider, validators, timeout=30):
+    """读取单个规则集原始内容，返回 (内容, 新的校验信息)；304时内容为None，失败时抛出异常"""
+    kind = provider.get('type', 'http')
+    if kind == 'inline':
+        return '\n'.join(str(item) for item in provider.get('payload') or []).encode(), {}
+    if kind == 'file':
+        with open(provider.get('path', ''), 'rb') as f:
+            return f.read(), {}
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    response = session.get(provider['url'], headers=headers, timeout=timeout)
+    if response.status_code == 304:
+        return None, validators
+    response.raise_for_status()
+    return response.content, {'etag': response.headers.get('ETag'),
+                              'last_modified': response.headers.get('Last-Modified')}
+
+def resolve_provider(provider, base_dir):
+    """本地规则集相对于源配置所在目录，返回记录绝对路径的规则集定义，供之后刷新"""
+    if provider.get('type') == 'file' and not os.path.isabs(provider.get('path', '')):
+        return dict(provider, path=os.path.abspath(os.path.join(base_dir, provider.get('path', ''))))
+    return provider
+
+def load_provider(session, name, provider, state):
+    """获取一个规则集，返回 (新的索引状态, 条目列表或None)
+
+    内容哈希与上次相同时直接读取已有的解析结果，不重新解析。
+    """
+    if state.get('sha256') and not os.path.exists(entries_path(state['sha256'])):
+        # 解析版本变化后没有可用的解析结果，不能依赖304，需要重新下载
+        state = dict(state, validators={})
+    try:
+        content, validators = fetch_content(session, provider, state.get('validators', {}))
+    except (OSError, requests.exceptions.RequestException, KeyError) as e:
+        print_status(f"规则集 {name} 获取失败，使用缓存: {e.__class__.__name__}", "WARNING")
+        content, validators = None, state.get('validators', {})
+
+    digest = hashlib.sha256(content).hexdigest() if content is not None else state.get('sha256')
+    if not digest:
+        return state, None
+    new_state = {'provider': provider, 'validators': validators, 'sha256': digest,
+                 'unsupported': state.get('unsupported', 0)}
+    path = entries_path(digest)
+    if content is None or os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return new_state, json.load(f)
+        except (OSError, ValueError):
+            if content is None:
+                return state, None
+
+    entries, new_state['unsupported'] = parse_payload(payload_lines(content), provider.get('behavior', 'classical'))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False)
+    return new_state, entries
+
+def fetch_providers(providers, base_dir='.', concurrency=8, fresh=None):
+    """并发获取所有规则集，返回 {名称: 条目列表}，获取失败且无缓存的规则集不在结果中
+
+    fresh 为本次运行中刚刷新过的结果 {名称: (规则集定义, 条目列表)}，定义未变化的规则集直接使用，
+    不再发起请求。索引只保留 providers 中的规则集，已删除规则集的解析结果随之清理。
+    """
+    os.makedirs(PROVIDER_DIR, exist_ok=True)
+    index = load_index()
+    previous = index.get('providers', {})
+    resolved = {name: resolve_provider(provider, base_dir)
+                for name, provider in providers.items() if isinstance(provider, dict)}
+    states = {name: previous[name] for name in resolved if name in previous}
+    loaded = {}
+    pending = []
+    for name, provider in resolved.items():
+        if fresh and name in fresh and fresh[name][0] == provider:
+            loaded[name] = fresh[name][1]
+        else:
+            pending.append(name)
+
+    if pending:
+        session = requests.Session()
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(pending)))) as executor:
+                results = list(executor.map(
+                    lambda name: load_provider(session, name, resolved[name], states.get(name, {})), pending))
+        finally:
+            session.close()
+        for name, (state, entries) in zip(pending, results):
+            if state:
+                states[name] = state
+            if entries is not None:
+                loaded[name] = entries
+    index['providers'] = states
+    save_index(index)
+    # 删除不再被引用的旧解析结果
+    referenced = {os.path.basename(entries_path(state['sha256'])) for state in states.values() if state.get('sha256')}
+    for file in os.listdir(PROVIDER_DIR):
+        if file.endswith('.json') and file != os.path.basename(PROVIDER_INDEX) and file not in referenced:
+            os.remove(os.path.join(PROVIDER_DIR, file))
+    return loaded
+
+def refresh_providers():
+    """用条件请求刷新上次使用过的规则集，用于在生成缓存判断前发现内容变化
+
+    返回 {名称: (规则集定义, 条目列表)}，传给 fetch_providers 后同一次生成中不会再次请求。
+    """
+    states = load_index().get('providers', {})
+    providers = {name: state['provider'] for name, state in states.items() if state.get('provider')}
+    if not providers:
+        return {}
+    loaded = fetch_providers(providers)
+    return {name: (providers[name], entries) for name, entries in loaded.items()}
+
+def providers_digest():
+    """所有规则集内容哈希的摘要，作为配置生成缓存键的一部分"""
+    states = load_index().get('providers', {})
+    digests = {name: state.get('sha256') for name, state in states.items()}
+    return hashlib.sha256(json.dumps(digests, sort_keys=True).encode()).hexdigest()
+
+def expand_rule_set(entries, target, options=()):
+    """把规则集条目展开为内联规则
+
+    同一规则集的规则目标相同，改变其内部顺序不影响匹配结果：
+    域名类规则排在前面并按从短到长排序，让后续编译能删除被覆盖的条目；IP网段合并为最少的CIDR。
+    """
+    buckets = {rule_type: set() for rule_type in EXPAND_ORDER}
+    others = []
+    for rule_type, payload, entry_options in entries:
+        if rule_type in buckets and not entry_options:
+            buckets[rule_type].add(payload)
+        else:
+            # RULE-SET 上的选项（no-resolve）只对IP类规则有意义
+            others.append(format_rule(rule_type, payload, target,
+                                      tuple(entry_options) or (options if rule_type in IP_TYPES else ())))
+
+    rules = []
+    for rule_type in ('DOMAIN-SUFFIX', 'DOMAIN', 'DOMAIN-KEYWORD'):
+        payloads = sorted(buckets[rule_type], key=lambda d: (d.count('.'), d))
+        rules += [format_rule(rule_type, payload, target) for payload in payloads]
+    for rule_type in ('IP-CIDR', 'IP-CIDR6'):
+        networks = ipaddress.collapse_addresses(ipaddress.ip_network(p, strict=False) for p in buckets[rule_type])
+        rules += [format_rule(rule_type, str(network), target, options) for network in networks]
+    return rules + others
+
+def inline_rule_sets(rules, providers):
+    """把 RULE-SET 规则替换为展开后的内联规则，返回 (新规则列表, 统计信息)
+
+    缺少规则集的 RULE-SET 和 SCRIPT 规则会被删除；unsupported 为展开的规则集中无法等价转换而被跳过的条目数。
+    """
+    inlined = []
+    expanded_sets = set()
+    stats = {'rule_sets': 0, 'expanded': 0, 'missing': 0}
+    for rule in rules:
+        rule_type, payload, target, options = parse_rule(rule)
+        if rule_type == 'SCRIPT':
+            continue
+        if rule_type != 'RULE-SET':
+            inlined.append(str(rule))
+            continue
+        if payload not in providers:
+            stats['missing'] += 1
+            continue
+        expanded = expand_rule_set(providers[payload], target, options)
+        stats['rule_sets'] += 1
+        stats['expanded'] += len(expanded)
+        expanded_sets.add(payload)
+        inlined.extend(expanded)
+    states = load_index().get('providers', {})
+    stats['unsupported'] = sum(states.get(name, {}).get('unsupported', 0) for name in expanded_sets)
+    return inlined, stats
+
+def main():
+    """命令行入口：展开配置文件中的规则集并输出内联规则"""
+    if len(sys.argv) != 2:
+        print("用法: python3 rule_providers.py config.yaml [> rules.txt]")
+        sys.exit(1)
+    if not os.path.exists(sys.argv[1]):
+        print(f"❌ 配置文件不存在: {sys.argv[1]}", file=sys.stderr)
+        sys.exit(1)
+
+    with open(sys.argv[1], 'r', encoding='utf-8') as f:
+        config = load_yaml(f) or {}
+    providers = fetch_providers(config.get('rule-providers') or {}, os.path.dirname(os.path.abspath(sys.argv[1])))
+    rules, stats = inline_rule_sets(config.get('rules') or [], providers)
+    for rule in rules:
+        print(rule)
+    print(f"✅ 展开 {stats['rule_sets']} 个规则集为 {stats['expanded']} 条规则，缺失 {stats['missing']} 个，"
+          f"无法转换的条目 {stats['unsupported']} 条", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
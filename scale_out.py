@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Clash 多实例部署工具
+把生成的配置拆分为N个实例的配置（各自的代理端口、控制器端口和配置目录），
+节点按策略复制到每个实例或分片到不同实例，并生成前置的HAProxy TCP负载均衡配置
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+from yaml_io import load_yaml, dump_yaml
+from clash_api import INSTANCES_FILE
+from proxy_normalizer import normalize_proxies
+from rule_compiler import parse_rule
+
+# 实例配置目录（每个实例挂载自己的子目录）
+INSTANCE_DIR = "config/instances"
+INSTANCE_INDEX = os.path.join(INSTANCE_DIR, "index.json")
+# 实例i的混合端口为 MIXED_PORT_BASE + i * PORT_STRIDE，SOCKS端口紧随其后
+MIXED_PORT_BASE = 17890
+PORT_STRIDE = 10
+# 实例i的控制器端口，实例0沿用9090，yacd和单实例工具无需修改
+CONTROLLER_PORT_BASE = 9090
+# host网络下实例i的DNS监听端口
+HOST_DNS_PORT_BASE = 1053
+# 负载均衡器
+LB_CONFIG = "config/haproxy.cfg"
+LB_IMAGE = "haproxy:lts-alpine"
+LB_CONTAINER = "clash-lb"
+# 负载均衡器对外的端口，与单实例部署相同
+LB_PORTS = {'mixed': 7890, 'socks': 7891}
+# 节点分配策略：replicate 每个实例都有全部节点；partition 节点轮流分到各实例
+SHARD_POLICIES = ('replicate', 'partition')
+# 规则或relay直接引用的节点，partition策略下仍复制到每个实例，保证匹配结果不变
+PINNED_GROUP_TYPES = ('relay',)
+
+def print_status(message, status="INFO"):
+    """打印状态信息"""
+    emoji_map = {
+        "INFO": "ℹ️",
+        "SUCCESS": "✅",
+        "ERROR": "❌",
+        "WARNING": "⚠️",
+        "PROCESSING": "🔄"
+    }
+    emoji = emoji_map.get(status, "ℹ️")
+    print(f"{emoji} {message}")
+
+def instance_layout(count):
+    """返回每个实例的名称、端口和配置目录"""
+    return [{
+        'name': f"clash-{i}",
+        'controller': f"http://127.0.0.1:{CONTROLLER_PORT_BASE + i}",
+        'controller_port': CONTROLLER_PORT_BASE + i,
+        'mixed_port': MIXED_PORT_BASE + i * PORT_STRIDE,
+        'socks_port': MIXED_PORT_BASE + i * PORT_STRIDE + 1,
+        'dns_port': HOST_DNS_PORT_BASE + i,
+        'config_dir': os.path.join(INSTANCE_DIR, f"clash-{i}")
+    } for i in range(count)]
+
+def parse_cpuset(cpuset):
+    """把 '1-3,6' 解析为 [1, 2, 3, 6]"""
+    cpus = []
+    for part in str(cpuset or '').split(','):
+        part = part.strip()
+        if '-' in part:
+            first, last = part.split('-', 1)
+            cpus.extend(range(int(first), int(last) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
+
+def split_cpuset(cpuset, count):
+    """把CPU集合尽量均匀地分成count份连续的CPU，CPU少于实例数时多个实例共用"""
+    cpus = parse_cpuset(cpuset)
+    if not cpus:
+        return [None] * count
+    if len(cpus) < count:
+        return [str(cpus[i % len(cpus)]) for i in range(count)]
+    size, extra = divmod(len(cpus), count)
+    parts = []
+    start = 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        parts.append(','.join(str(cpu) for cpu in cpus[start:end]))
+        start = end
+    return parts
+
+def pinned_nodes(config):
+    """规则目标和relay组成员中的节点名"""
+    names = {str(p.get('name')) for p in config.get('proxies') or [] if isinstance(p, dict)}
+    pinned = set()
+    for rule in config.get('rules') or []:
+        target = parse_rule(rule)[2]
+        if target in names:
+            pinned.add(target)
+    for group in config.get('proxy-groups') or []:
+        if isinstance(group, dict) and str(group.get('type', '')).lower() in PINNED_GROUP_TYPES:
+            pinned.update(str(m) for m in group.get('proxies') or [] if str(m) in names)
+    return pinned
+
+def group_nodes(config):
+    """每个代理组直接包含的节点名列表"""
+    names = {str(p.get('name')) for p in config.get('proxies') or [] if isinstance(p, dict)}
+    return [[str(m) for m in group.get('proxies') or [] if str(m) in names]
+            for group in config.get('proxy-groups') or [] if isinstance(group, dict)]
+
+def shard_proxies(proxies, count, policy='replicate', pinned=(), groups=()):
+    """按策略把节点分配到count个实例，返回每个实例的节点列表
+
+    partition: 节点轮流分到各实例，pinned 中的节点复制到每个实例；
+    某个实例分不到代理组内的任何节点时补上该组的第一个节点，代理组不会退化为REJECT。
+    """
+    if policy == 'replicate' or count == 1:
+        return [list(proxies) for _ in range(count)]
+    assigned = [set() for _ in range(count)]
+    position = 0
+    for proxy in proxies:
+        name = str(proxy.get('name'))
+        if name in pinned:
+            for names in assigned:
+                names.add(name)
+        else:
+            assigned[position % count].add(name)
+            position += 1
+    for members in groups:
+        for names in assigned:
+            if members and names.isdisjoint(members):
+                names.add(members[0])
+    return [[p for p in proxies if str(p.get('name')) in names] for names in assigned]
+
+def instance_config(config, instance, proxies, host_network=False):
+    """生成单个实例的配置：替换节点和端口，partition时清理代理组中不在本实例的成员"""
+    sliced = dict(config)
+    sliced['proxies'] = proxies
+    if len(proxies) != len(config.get('proxies') or []):
+        # 代理组会被改写，先复制一份
+        sliced['proxy-groups'] = [dict(g) if isinstance(g, dict) else g for g in config.get('proxy-groups') or []]
+        normalize_proxies(sliced)
+    sliced['port'] = instance['mixed_port']
+    sliced['mixed-port'] = instance['mixed_port']
+    sliced['socks-port'] = instance['socks_port']
+    sliced['external-controller'] = f"0.0.0.0:{instance['controller_port']}"
+    if host_network and isinstance(config.get('dns'), dict):
+        sliced['dns'] = dict(config['dns'], listen=f"127.0.0.1:{instance['dns_port']}")
+    return sliced
+
+def shard_key(config_path, layout, policy, host_network):
+    """实例配置的缓存键：生成的配置、实例布局、策略和本模块代码"""
+    digest = hashlib.sha256()
+    for path in (config_path, os.path.abspath(__file__)):
+        try:
+            with open(path, 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        except OSError:
+            return None
+    digest.update(json.dumps([layout, policy, host_network], sort_keys=True).encode())
+    return digest.hexdigest()
+
+def write_text(path, text):
+    """内容变化时原子地写入文件，返回是否变化"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == text:
+                return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + ".part", 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(path + ".part", path)
+    return True
+
+def write_instance_configs(config_path, layout, policy='replicate', host_network=False):
+    """从生成的配置写出每个实例的配置，返回是否有实例配置变化；生成的配置未变化时直接跳过
+
+    删除不再属于任何实例的旧配置目录。
+    """
+    key = shard_key(config_path, layout, policy, host_network)
+    try:
+        with open(INSTANCE_INDEX, 'r', encoding='utf-8') as f:
+            cached = json.load(f).get('key')
+    except (OSError, ValueError):
+        cached = None
+    names = {instance['name'] for instance in layout}
+    if key and key == cached and all(os.path.exists(os.path.join(i['config_dir'], 'config.yaml')) for i in layout):
+        print_status("生成的配置和实例布局未变化，跳过实例配置拆分", "SUCCESS")
+        return False
+
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = load_yaml(f) or {}
+    proxies = [p for p in config.get('proxies') or [] if isinstance(p, dict)]
+    shards = shard_proxies(proxies, len(layout), policy, pinned_nodes(config), group_nodes(config))
+    changed = False
+    for instance, shard in zip(layout, shards):
+        text = dump_yaml(instance_config(config, instance, shard, host_network))
+        changed = write_text(os.path.join(instance['config_dir'], 'config.yaml'), text) or changed
+    print_status(f"实例配置: {len(layout)} 个实例 ({policy}), 每个实例 "
+                 f"{'/'.join(str(len(s)) for s in shards)} 个节点", "SUCCESS")
+
+    for name in os.listdir(INSTANCE_DIR):
+        path = os.path.join(INSTANCE_DIR, name)
+        if os.path.isdir(path) and name.startswith('clash-') and name not in names:
+            shutil.rmtree(path, ignore_errors=True)
+    with open(INSTANCE_INDEX, 'w', encoding='utf-8') as f:
+        json.dump({'key': key}, f)
+    return changed
+
+def haproxy_config(layout, host_network=False):
+    """生成HAProxy配置：TCP模式，按最少连接分配到各实例，实例不可用时自动摘除"""
+    lines = [
+        "# 由 start_clash_docker.py 生成，手动修改会在下次启动时被覆盖",
+        "global",
+        "    maxconn 200000",
+        "",
+        "defaults",
+        "    mode tcp",
+        "    timeout connect 5s",
+        # 代理隧道是长连接，空闲超时与客户端保持一致
+        "    timeout client 1h",
+        "    timeout server 1h",
+        "    default-server check inter 2s fall 2 rise 1" + ("" if host_network else " init-addr last,libc,none"),
+        ""
+    ]
+    if not host_network:
+        # bridge网络中实例可能晚于负载均衡器启动，通过Docker内置DNS持续解析
+        lines += [
+            "resolvers docker",
+            "    nameserver dns 127.0.0.11:53",
+            "    hold valid 10s",
+            ""
+        ]
+    for kind, port in LB_PORTS.items():
+        bind = f"127.0.0.1:{port}" if host_network else f":{port}"
+        lines += [
+            f"frontend {kind}",
+            f"    bind {bind}",
+            f"    default_backend {kind}",
+            "",
+            f"backend {kind}",
+            "    balance leastconn"
+        ]
+        for instance in layout:
+            host = "127.0.0.1" if host_network else instance['name']
+            resolver = "" if host_network else " resolvers docker"
+            lines.append(f"    server {instance['name']} {host}:{instance[kind + '_port']}{resolver}")
+        lines.append("")
+    return "\n".join(lines)
+
+def save_instances(layout, path=INSTANCES_FILE):
+    """记录实例列表，状态、测速和指标工具据此访问所有实例；单实例部署时删除"""
+    if len(layout) <= 1:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    instances = [{key: instance[key] for key in ('name', 'controller', 'mixed_port', 'socks_port', 'config_dir')}
+                 for instance in layout]
+    write_text(path, json.dumps(instances, ensure_ascii=False, indent=2))
+
+def main():
+    """命令行入口：从已生成的配置拆分实例配置并生成负载均衡配置，不启动服务"""
+    parser = argparse.ArgumentParser(description="Clash 多实例配置拆分")
+    parser.add_argument("--instances", type=int, default=2, help="实例数")
+    parser.add_argument("--shard-policy", choices=SHARD_POLICIES, default="replicate", help="节点分配策略")
+    parser.add_argument("--host-network", action="store_true", help="实例和负载均衡器使用host网络")
+    parser.add_argument("--config", default="config/config.yaml", help="已生成的配置文件")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.config):
+        print_status(f"配置文件不存在: {args.config}", "ERROR")
+        sys.exit(1)
+    layout = instance_layout(max(1, args.instances))
+    write_instance_configs(args.config, layout, args.shard_policy, args.host_network)
+    write_text(LB_CONFIG, haproxy_config(layout, args.host_network))
+    print_status(f"负载均衡配置已保存到: {LB_CONFIG}", "SUCCESS")
+
+if __name__ == "__main__":
+    main()
@@ -7,13 +7,13 @@
 
 import yaml
 import os
+from clash_api import CLASH_API, SECRET_FILE, load_secret
 def show_ip_port():
     """显示clash的公网IP和端口"""
     import requests
     
     # 检查密钥文件是否存在
-    secret_path = "clash_secret.txt"
-    if not os.path.exists(secret_path):
+    if not os.path.exists(SECRET_FILE):
         print("❌ 密钥文件不存在，请先启动Clash")
         print("💡 运行: python3 start_clash_docker.py")
         return
@@ -31,10 +31,9 @@ def show_ip_port():
                 public_ip = "服务器IP"
         
         # 读取密钥
-        with open(secret_path, 'r') as f:
-            secret = f.read().strip()
+        secret = load_secret()
         
-        print(f"🌐 http://127.0.0.1:9090")
+        print(f"🌐 {CLASH_API}")
         print(f"🔑 {secret}")
         
     except Exception as e:
@@ -42,16 +41,13 @@ def show_ip_port():
 
 def show_secret():
     """显示API密钥"""
-    secret_path = "clash_secret.txt"
-    
-    if not os.path.exists(secret_path):
+    if not os.path.exists(SECRET_FILE):
         print("❌ 密钥文件不存在，请先启动Clash")
         print("💡 运行: python3 start_clash_docker.py")
         return
     
     try:
-        with open(secret_path, 'r') as f:
-            secret = f.read().strip()
+        secret = load_secret()
         
         print("🔑 Clash API 密钥")
         print("=" * 50)
@@ -14,10 +14,74 @@ import subprocess
 import time
 import requests
 import json
-import zipfile
 import tempfile
+import shutil
 import secrets
 import string
+import hashlib
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from clash_api import ClashAPI, get_client, load_secret, load_instances, DELAY_TEST_URL, SECRET_FILE, NON_NODE_TYPES
+from yaml_io import load_yaml, dump_yaml, load_yaml_streaming, LIBYAML
+from docker_api import container_running, container_status
+from readiness import wait_until_ready, timed_phase, print_phase_timings
+from clash_exporter import run_exporter
+from clash_top import run_top
+from conn_tracker import ConnectionTracker, OPENED
+from rule_compiler import (compile_rules, load_rule_files, reorder_rules, rename_target, parse_rule,
+                           CONNECTION_RULE_TYPES)
+from proxy_normalizer import normalize_proxies
+from preflight import probe_proxies, prune_unreachable
+from subscription import update_subscriptions
+from dns_bench import build_dns_config, fastest_dns_config
+from rule_providers import fetch_providers, inline_rule_sets, refresh_providers, providers_digest
+from compose_profiles import (build_compose, write_compose, write_yacd_env, config_overrides, apply_overrides,
+                              uses_host_network, default_cpuset, host_sysctl_hint, PROFILES, MEMORY_LIMIT,
+                              YACD_ENV_FILE)
+from scale_out import (instance_layout, write_instance_configs, haproxy_config, save_instances, write_text,
+                       LB_CONFIG, LB_CONTAINER, SHARD_POLICIES)
+from load_test import run_load_test
+
+# 部署状态文件，记录上次启动时的端口和compose定义指纹
+DEPLOY_STATE_FILE = "config/.deploy_state.json"
+# 部署设置的默认值，命令行未指定时沿用上次成功部署的设置
+DEPLOY_DEFAULTS = {'profile': 'default', 'bridge': False, 'cpuset': None, 'memory': MEMORY_LIMIT,
+                   'instances': 1, 'shard_policy': 'replicate'}
+# 容器内的配置文件路径
+CONTAINER_CONFIG_PATH = "/root/.config/clash/config.yaml"
+# 修改后需要重建容器的配置项（端口监听相关）
+RECREATE_KEYS = (
+    'port', 'socks-port', 'mixed-port', 'redir-port', 'tproxy-port',
+    'external-controller', 'allow-lan', 'bind-address'
+)
+# Country.mmdb下载镜像（同时请求，使用最先响应的）
+MMDB_MIRRORS = [
+    "https://gh-proxy.com/https://github.com/Dreamacro/maxmind-geoip/releases/latest/download/Country.mmdb",
+    "https://github.com/Dreamacro/maxmind-geoip/releases/latest/download/Country.mmdb",
+    "https://cdn.jsdelivr.net/gh/Dreamacro/maxmind-geoip@release/Country.mmdb"
+]
+MMDB_META_SUFFIX = ".meta.json"
+# Country.mmdb超过该时间（秒）才检查更新
+MMDB_MAX_AGE = 7 * 24 * 3600
+# MMDB元数据段标记及搜索范围
+MMDB_METADATA_MARKER = b"\xab\xcd\xefMaxMind.com"
+MMDB_METADATA_SEARCH = 128 * 1024
+# 超过该大小的源配置自动使用流式加载
+STREAM_THRESHOLD = 8 * 1024 * 1024
+# 配置生成缓存文件
+BUILD_CACHE_FILE = "config/.build_cache.json"
+# 生成的配置文件
+OUTPUT_CONFIG = "config/config.yaml"
+# 规则命中统计文件
+RULE_HITS_FILE = "config/rule_hits.json"
+# 本机和局域网地址直连，使用源配置自己的规则时放在其末尾的 GEOIP/MATCH 之前，不覆盖源规则
+PRIVATE_DIRECT_RULES = [
+    'IP-CIDR,127.0.0.0/8,DIRECT,no-resolve',
+    'IP-CIDR,10.0.0.0/8,DIRECT,no-resolve',
+    'IP-CIDR,172.16.0.0/12,DIRECT,no-resolve',
+    'IP-CIDR,192.168.0.0/16,DIRECT,no-resolve'
+]
 
 def print_status(message, status="INFO"):
     """打印状态信息"""
@@ -58,73 +122,332 @@ def get_server_ip():
         print_status(f"获取IP失败: {e}", "WARNING")
         return None
 
-def get_proxy_info():
+def get_proxy_info(timeout=20, controller=None, proxy_port=7890):
     """获取代理信息"""
-    # 等待API端口准备就绪
-    max_retries = 10
-    for i in range(max_retries):
-        try:
-            # 从本地文件读取密钥
-            secret = load_secret_from_file()
-            if not secret:
-                secret = 'dler'  # 如果读取失败，使用默认值
+    api = get_client(controller) if controller else get_client()
+    try:
+        # 以指数退避等待API端口准备就绪，就绪后立即请求
+        if wait_until_ready(api, timeout=timeout, proxy_port=proxy_port) is None:
+            print_status("API端口连接超时，Clash可能还在启动中", "WARNING")
+            return None
+        
+        # 获取代理组信息
+        proxy_groups = {}
+        for name, info in api.proxies().items():
+            if info.get('type') == 'Selector':
+                proxy_groups[name] = {
+                    'now': info.get('now'),
+                    'all': info.get('all', [])
+                }
+        
+        return proxy_groups
+    except requests.exceptions.HTTPError as e:
+        print_status(f"API响应错误: {e.response.status_code}", "WARNING")
+        return None
+    except Exception as e:
+        print_status(f"获取代理信息失败: {e}", "ERROR")
+        return None
+
+def summarize_delays(name, delays):
+    """汇总单个节点多轮测速结果"""
+    ok = [d for d in delays if d is not None]
+    return {
+        'name': name,
+        'rounds': len(delays),
+        'timeouts': len(delays) - len(ok),
+        'median': statistics.median(ok) if ok else None,
+        'min': min(ok) if ok else None,
+        'max': max(ok) if ok else None,
+        'jitter': round(statistics.pstdev(ok), 1) if len(ok) > 1 else 0.0 if ok else None
+    }
+
+def rank_nodes(results):
+    """按超时次数和中位延迟排序，全部超时的节点排在最后"""
+    return sorted(results, key=lambda r: (r['median'] is None, r['timeouts'], r['median'] or 0, r['jitter'] or 0))
+
+def run_delay_rounds(api, names, rounds=3, concurrency=16, url=DELAY_TEST_URL, timeout_ms=5000):
+    """并发测速，每轮对所有节点测一次，返回 {节点: [延迟...]}"""
+    delays = {name: [] for name in names}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(rounds):
+            futures = {name: executor.submit(api.delay, name, url, timeout_ms) for name in names}
+            for name, future in futures.items():
+                delays[name].append(future.result())
+    return delays
+
+def benchmark_nodes(rounds=3, concurrency=16, url=DELAY_TEST_URL, timeout_ms=5000, top=None, json_path=None):
+    """并发测试所有节点延迟并输出排名
+
+    多实例部署时每个实例测试自己的节点，同名节点（replicate策略）的样本合并后汇总。
+    """
+    apis = [ClashAPI(instance['controller'], pool_size=concurrency) for instance in load_instances()]
+    try:
+        names = [api.node_names() for api in apis]
+    except Exception as e:
+        print_status(f"获取节点列表失败: {e}", "ERROR")
+        for api in apis:
+            api.close()
+        return None
+    
+    total = len({name for instance_names in names for name in instance_names})
+    if not total:
+        print_status("没有找到可测速的节点", "WARNING")
+        for api in apis:
+            api.close()
+        return []
+    
+    instances = f", {len(apis)} 个实例" if len(apis) > 1 else ""
+    print_status(f"开始测速: {total} 个节点 x {rounds} 轮, 并发 {concurrency}{instances}", "PROCESSING")
+    start = time.perf_counter()
+    delays = {}
+    with ThreadPoolExecutor(max_workers=len(apis)) as executor:
+        futures = [executor.submit(run_delay_rounds, api, instance_names, rounds, concurrency, url, timeout_ms)
+                   for api, instance_names in zip(apis, names)]
+        for future in futures:
+            for name, values in future.result().items():
+                delays.setdefault(name, []).extend(values)
+    for api in apis:
+        api.close()
+    elapsed = time.perf_counter() - start
+    
+    results = rank_nodes([summarize_delays(name, d) for name, d in delays.items()])
+    alive = sum(1 for r in results if r['median'] is not None)
+    
+    print("\n📊 节点延迟排名 (ms):")
+    print("=" * 70)
+    print(f"{'#':>4}  {'中位':>6} {'最小':>6} {'最大':>6} {'抖动':>6} {'超时':>5}  节点")
+    for i, r in enumerate(results[:top] if top else results, 1):
+        cells = [('-' if r[k] is None else f"{r[k]:.0f}") for k in ('median', 'min', 'max', 'jitter')]
+        print(f"{i:>4}  {cells[0]:>6} {cells[1]:>6} {cells[2]:>6} {cells[3]:>6} {r['timeouts']:>2}/{r['rounds']:<2}  {r['name']}")
+    print("=" * 70)
+    print_status(f"测速完成: {alive}/{len(results)} 个节点可用, 耗时 {elapsed:.1f}s", "SUCCESS")
+    
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({'url': url, 'rounds': rounds, 'nodes': results}, f, ensure_ascii=False, indent=2)
+        print_status(f"测速结果已保存到: {json_path}", "SUCCESS")
+    
+    return results
+
+def get_selector_candidates(api):
+    """获取每个Selector组当前节点及其成员中的实际节点"""
+    proxies = api.proxies()
+    groups = {}
+    for name, info in proxies.items():
+        if info.get('type') != 'Selector':
+            continue
+        candidates = [
+            member for member in info.get('all', [])
+            if proxies.get(member, {}).get('type') not in NON_NODE_TYPES | {None}
+        ]
+        # 只管理至少有两个候选节点、且当前未手动指向其他代理组的组
+        if len(candidates) >= 2 and (info.get('now') in candidates or not info.get('now')):
+            groups[name] = {'now': info.get('now'), 'candidates': candidates}
+    return groups
+
+def auto_select(interval=60, tolerance=0.2, min_gain_ms=30, dwell=300, alpha=0.5,
+                concurrency=16, url=DELAY_TEST_URL, timeout_ms=5000, once=False):
+    """持续测速并为每个Selector组切换到明显更快的节点（替代被移除的Auto - UrlTest）
+
+    多实例部署时管理每个实例的Selector组：每个节点只通过一个拥有它的实例测速，
+    各实例在自己的候选节点中选择（replicate策略下所有实例切换到同一节点）。
+    """
+    apis = [(instance['name'], ClashAPI(instance['controller'], pool_size=concurrency))
+            for instance in load_instances()]
+    multi = len(apis) > 1
+    scores = {}        # 节点 -> 平滑后的延迟（EWMA）
+    last_switch = {}   # (实例, 组) -> 上次切换时间
+    print_status(f"自动选择已启动: 间隔 {interval}s, 滞后阈值 {tolerance:.0%}/{min_gain_ms}ms, 最短停留 {dwell}s"
+                 f"{f', {len(apis)} 个实例' if multi else ''}", "INFO")
+    
+    try:
+        while True:
+            groups = {}    # (实例, 组) -> {'now', 'candidates', 'api'}
+            owners = {}    # 实例API -> 由它测速的节点
+            measured = set()
+            for instance, api in apis:
+                try:
+                    instance_groups = get_selector_candidates(api)
+                except Exception as e:
+                    print_status(f"获取代理组失败{f' ({instance})' if multi else ''}: {e}", "WARNING")
+                    continue
+                for group, info in instance_groups.items():
+                    groups[(instance, group)] = dict(info, api=api)
+                    for name in info['candidates']:
+                        if name not in measured:
+                            measured.add(name)
+                            owners.setdefault(api, []).append(name)
             
-            # 测试API连接 - 使用本地地址
-            response = requests.get(
-                "http://127.0.0.1:9090/proxies",
-                headers={"Authorization": f"Bearer {secret}"},
-                timeout=3
-            )
+            delays = {}
+            for api, names in owners.items():
+                delays.update(run_delay_rounds(api, sorted(names), 1, concurrency, url, timeout_ms))
+            for name, values in delays.items():
+                # 超时按超时时间计分，避免偶发失败的节点被立即淘汰
+                sample = timeout_ms if values[0] is None else values[0]
+                scores[name] = sample if name not in scores else alpha * sample + (1 - alpha) * scores[name]
             
-            if response.status_code == 200:
-                data = response.json()
-                
-                # 获取代理组信息
-                proxy_groups = {}
-                for name, info in data.get('proxies', {}).items():
-                    if info.get('type') == 'Selector':
-                        proxy_groups[name] = {
-                            'now': info.get('now'),
-                            'all': info.get('all', [])
-                        }
+            now = time.monotonic()
+            for (instance, group), info in groups.items():
+                label = f"{instance}/{group}" if multi else group
+                current = info['now']
+                best = min(info['candidates'], key=lambda n: scores.get(n, timeout_ms))
+                best_score = scores.get(best, timeout_ms)
+                current_score = scores.get(current, timeout_ms)
+                if best == current or best_score >= timeout_ms:
+                    continue
                 
-                return proxy_groups
-            else:
-                print_status(f"API响应错误: {response.status_code}", "WARNING")
-                return None
-                
-        except requests.exceptions.ConnectionError:
-            if i < max_retries - 1:
-                print_status(f"等待API端口准备就绪... ({i+1}/{max_retries})", "PROCESSING")
-                time.sleep(2)
-            else:
-                print_status("API端口连接超时，Clash可能还在启动中", "WARNING")
-                return None
+                current_dead = delays.get(current, [None])[0] is None
+                faster = (best_score < current_score * (1 - tolerance)
+                          and current_score - best_score >= min_gain_ms)
+                settled = now - last_switch.get((instance, group), float('-inf')) >= dwell
+                if current_dead or (faster and settled):
+                    if info['api'].select(group, best):
+                        last_switch[(instance, group)] = now
+                        print_status(f"{label}: {current} ({current_score:.0f}ms) -> {best} ({best_score:.0f}ms)", "SUCCESS")
+                    else:
+                        print_status(f"{label}: 切换到 {best} 失败", "WARNING")
+            
+            if once:
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print_status("自动选择已停止", "INFO")
+    finally:
+        for _, api in apis:
+            api.close()
+
+def select_node(group, node):
+    """把Selector组切换到指定节点；多实例部署时切换每个实例（yacd只连接第一个实例）
+
+    返回是否所有实例都切换成功；partition策略下没有该节点的实例会切换失败。
+    """
+    failed = []
+    for instance in load_instances():
+        if not get_client(instance['controller']).select(group, node):
+            failed.append(instance['name'])
+    if failed:
+        print_status(f"{group} -> {node}: 以下实例切换失败: {', '.join(failed)}", "WARNING")
+        return False
+    print_status(f"{group} -> {node}", "SUCCESS")
+    return True
+
+def sample_rule_hits(api, window=300, interval=2):
+    """在采样窗口内轮询/connections，只统计新建连接命中的规则"""
+    hits = {}
+    total = 0
+    tracker = ConnectionTracker()
+    deadline = time.monotonic() + window
+    while True:
+        try:
+            for kind, record, _, _ in tracker.update(api.connections()['connections']):
+                if kind != OPENED:
+                    continue
+                total += 1
+                rule_type = CONNECTION_RULE_TYPES.get(record.rule)
+                if rule_type:
+                    key = f"{rule_type},{record.rule_payload}"
+                    hits[key] = hits.get(key, 0) + 1
         except Exception as e:
-            print_status(f"获取代理信息失败: {e}", "ERROR")
-            return None
+            print_status(f"采样连接失败: {e}", "WARNING")
+        if time.monotonic() + interval > deadline:
+            break
+        time.sleep(interval)
+    return hits, total
+
+def load_rule_hits():
+    """读取累计的规则命中统计"""
+    try:
+        with open(RULE_HITS_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_rule_hits(hits):
+    """保存规则命中统计"""
+    os.makedirs(os.path.dirname(RULE_HITS_FILE), exist_ok=True)
+    with open(RULE_HITS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(hits, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+def add_private_direct_rules(rules):
+    """在规则末尾的 GEOIP/MATCH 兜底规则之前插入本机和局域网直连规则"""
+    position = len(rules)
+    while position > 0 and parse_rule(rules[position - 1])[0] in ('GEOIP', 'MATCH', 'FINAL'):
+        position -= 1
+    return rules[:position] + PRIVATE_DIRECT_RULES + rules[position:]
+
+def apply_rule_hits(rules, hits):
+    """按命中统计重排规则"""
+    if not hits:
+        return rules, 0
+    keyed = {}
+    for key, count in hits.items():
+        rule_type, _, payload = key.partition(',')
+        rule_type = rule_type.upper()
+        if rule_type in ('DOMAIN', 'DOMAIN-SUFFIX', 'DOMAIN-KEYWORD'):
+            payload = payload.lower()
+        keyed[(rule_type, payload)] = count
+    return reorder_rules(rules, keyed)
+
+def reorder_config_rules(window=300, interval=2, config_path=OUTPUT_CONFIG):
+    """采样实际连接的规则命中情况，将热点规则前移并重新生成配置"""
+    config = load_config(config_path)
+    if not config:
+        return False
+    
+    print_status(f"正在采样连接数据 {window}s ...", "PROCESSING")
+    new_hits, total = sample_rule_hits(get_client(), window, interval)
+    if not new_hits:
+        print_status("采样期间没有新的连接，规则顺序保持不变", "WARNING")
+        return False
+    
+    # 与历史统计累加，避免短窗口的偶然流量影响顺序
+    hits = load_rule_hits()
+    for key, count in new_hits.items():
+        hits[key] = hits.get(key, 0) + count
+    save_rule_hits(hits)
     
-    return None
+    rules, moved = apply_rule_hits(config.get('rules', []), hits)
+    print_status(f"采样 {total} 个连接, 命中 {len(new_hits)} 条规则, 前移 {moved} 条", "SUCCESS")
+    for key, count in sorted(new_hits.items(), key=lambda kv: -kv[1])[:10]:
+        print(f"   • {count:>6}  {key}")
+    
+    config['rules'] = rules
+    if not save_config(config, config_path):
+        return False
+    print_status("热加载生效: python3 start_clash_docker.py apply，或重启: docker compose restart clash", "INFO")
+    return True
 
 def show_proxy_status():
     """显示代理状态"""
     print_status("检查容器状态...", "PROCESSING")
     
-    # 检查clash容器是否运行
-    success, output = run_command("docker ps --filter name=clash --format '{{.Status}}'")
-    if not success or "Up" not in output:
+    # 检查clash容器是否运行（多实例部署时检查每个实例和负载均衡器）
+    instances = load_instances()
+    names = [instance['name'] for instance in instances] + ([LB_CONTAINER] if len(instances) > 1 else [])
+    stopped = [name for name in names if not container_running(name)]
+    if len(stopped) == len(names) or LB_CONTAINER in stopped:
         print_status("❌ Clash容器未启动", "ERROR")
         print_status("请先运行: python3 start_clash_docker.py", "INFO")
         sys.exit(1)
-    
-    print_status("✅ Clash容器运行正常", "SUCCESS")
+    if stopped:
+        print_status(f"部分实例未运行: {', '.join(stopped)}", "WARNING")
+    else:
+        print_status("✅ Clash容器运行正常", "SUCCESS")
     print_status("获取代理状态...", "PROCESSING")
     
     # 获取服务器IP
     server_ip = get_server_ip()
     
-    # 获取代理信息
-    proxy_info = get_proxy_info()
+    # 获取代理信息，多实例时逐个实例汇总
+    proxy_info = None
+    for instance in instances:
+        if instance['name'] in stopped:
+            continue
+        info = get_proxy_info(controller=instance['controller'], proxy_port=instance['mixed_port'])
+        if info and len(instances) > 1:
+            total = len({name for group in info.values() for name in group.get('all', [])})
+            print_status(f"{instance['name']}: {len(info)} 个代理组, {total} 个成员", "INFO")
+        proxy_info = proxy_info or info
     
     if proxy_info:
         print("\n📊 代理统计:")
@@ -148,12 +471,10 @@ def show_proxy_status():
         print("  • 配置文件有问题")
         print("建议:")
         print("  • 等待几分钟后重试: python3 test_proxy.py")
-        print("  • 查看日志: docker compose logs clash")
+        print("  • 实时查看流量和日志: python3 start_clash_docker.py top")
     
     # 读取生成的密钥
-    secret = load_secret_from_file()
-    if not secret:
-        secret = 'dler'
+    secret = load_secret()
     
     if server_ip:
         print("🌐 访问信息:")
@@ -167,13 +488,21 @@ def show_proxy_status():
         print(f"export http_proxy=http://127.0.0.1:7890")
         print(f"export https_proxy=http://127.0.0.1:7890")
 
-def load_config(file_path):
-    """加载配置文件"""
+def load_config(file_path, streaming=None, keep_rules=False):
+    """加载配置文件，keep_rules 为True时流式加载也保留 rules 和 rule-providers"""
     print_status(f"正在读取配置文件: {file_path}", "PROCESSING")
     
     try:
+        if streaming is None:
+            streaming = os.path.getsize(file_path) >= STREAM_THRESHOLD
         with open(file_path, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
+            # 流式加载按事件逐个构建proxies/proxy-groups，跳过会被替换的rules等大段内容
+            if streaming:
+                config = load_yaml_streaming(f, ('script',)) if keep_rules else load_yaml_streaming(f)
+            else:
+                config = load_yaml(f)
+        if not LIBYAML:
+            print_status("未检测到libyaml，使用纯Python解析（较慢）", "WARNING")
         
         if not config:
             print_status("配置文件为空", "ERROR")
@@ -205,26 +534,20 @@ def generate_random_secret(length=64):
 def save_secret_to_file(secret):
     """保存密钥到本地文件"""
     try:
-        with open("clash_secret.txt", 'w') as f:
+        with open(SECRET_FILE, 'w') as f:
             f.write(secret)
-        print_status("API密钥已保存到: clash_secret.txt", "SUCCESS")
+        print_status(f"API密钥已保存到: {SECRET_FILE}", "SUCCESS")
         return True
     except Exception as e:
         print_status(f"保存密钥失败: {e}", "ERROR")
         return False
 
 def load_secret_from_file():
-    """从本地文件读取密钥"""
-    try:
-        if os.path.exists("clash_secret.txt"):
-            with open("clash_secret.txt", 'r') as f:
-                return f.read().strip()
-        return None
-    except:
-        return None
+    """从本地文件读取密钥，不存在时返回None"""
+    return load_secret(default=None)
 
-def create_docker_config(config):
-    """创建Docker环境配置"""
+def ensure_secret():
+    """返回本地文件中的密钥，不存在时生成并保存"""
     # 检查是否已有密钥文件
     secret = load_secret_from_file()
     if not secret:
@@ -234,6 +557,18 @@ def create_docker_config(config):
         save_secret_to_file(secret)
     else:
         print_status("使用已存在的API密钥", "INFO")
+    return secret
+
+def create_docker_config(config, extra_rules=None, rule_providers=False, source_dir='.', dns_config=None,
+                         overrides=None, fresh_providers=None):
+    """创建Docker环境配置
+
+    rule_providers 为True时使用源配置自己的规则，并把 RULE-SET 引用的规则集编译为内联规则；
+    否则使用内置的简化规则。dns_config 为测速选出的 dns 段，未指定时使用默认解析器。
+    overrides 为compose配置档要求的修改（如host网络下只监听本机）。
+    fresh_providers 为生成前刚刷新过的规则集，定义未变化时不再重复请求。
+    """
+    secret = ensure_secret()
     
     # 设置Docker环境需要的配置
     config['port'] = 7890
@@ -247,51 +582,24 @@ def create_docker_config(config):
     config['secret'] = secret
     
     # 添加DNS配置
-    config['dns'] = {
-        'enable': True,
-        'listen': '0.0.0.0:53',
-        'default-nameserver': [
-            '223.5.5.5',
-            '119.29.29.29'
-        ],
-        'nameserver': [
-            'https://doh.pub/dns-query',
-            'https://dns.alidns.com/dns-query'
-        ],
-        'fallback': [
-            'https://doh.pub/dns-query',
-            'https://dns.alidns.com/dns-query'
-        ],
-        'fallback-filter': {
-            'geoip': True,
-            'ipcidr': [
-                '240.0.0.0/4',
-                '0.0.0.0/32'
-            ]
-        }
-    }
+    config['dns'] = dns_config or build_dns_config()
+    apply_overrides(config, overrides or {})
     
-    # 过滤Auto - UrlTest
-    if 'proxy-groups' in config:
-        for group in config['proxy-groups']:
-            if isinstance(group, dict) and 'proxies' in group:
-                if isinstance(group['proxies'], list):
-                    group['proxies'] = [
-                        proxy for proxy in group['proxies'] 
-                        if 'Auto - UrlTest' not in str(proxy)
-                    ]
-                if 'all' in group and isinstance(group['all'], list):
-                    group['all'] = [
-                        proxy for proxy in group['all'] 
-                        if 'Auto - UrlTest' not in str(proxy)
-                    ]
-    
-    # 过滤proxies中的Auto - UrlTest
-    if 'proxies' in config:
-        config['proxies'] = [
-            proxy for proxy in config['proxies']
-            if isinstance(proxy, dict) and 'Auto - UrlTest' not in proxy.get('name', '')
-        ]
+    # 规范化节点：过滤Auto - UrlTest，合并重复节点，改写代理组成员并删除悬空引用
+    node_stats = normalize_proxies(config)
+    print_status(f"节点规范化: {node_stats['before']} -> {node_stats['after']} 个 "
+                 f"(重复 {node_stats['duplicate']}, 重名 {node_stats['duplicate_name']}, "
+                 f"悬空成员 {node_stats['dangling']})", "SUCCESS")
+    if node_stats['emptied']:
+        print_status(f"{node_stats['emptied']} 个代理组已没有可用成员，改为REJECT", "WARNING")
+    
+    # 编译rule-providers为内联规则（Clash核心不支持rule-providers和script）
+    source_rules = []
+    if rule_providers and config.get('rules'):
+        providers = fetch_providers(config.get('rule-providers') or {}, source_dir, fresh=fresh_providers)
+        source_rules, provider_stats = inline_rule_sets(config['rules'], providers)
+        print_status(f"规则集展开: {provider_stats['rule_sets']} 个规则集 -> {provider_stats['expanded']} 条规则 "
+                     f"(缺失 {provider_stats['missing']}, 无法转换的条目 {provider_stats['unsupported']})", "SUCCESS")
     
     # 移除不兼容的高级功能
     if 'script' in config:
@@ -299,8 +607,10 @@ def create_docker_config(config):
     if 'rule-providers' in config:
         del config['rule-providers']
     
-    # 创建简化的rules
-    config['rules'] = [
+    # 创建简化的rules，用户规则优先
+    if source_rules:
+        source_rules = add_private_direct_rules(source_rules)
+    rules = list(extra_rules or []) + (source_rules or [
         'DOMAIN-SUFFIX,google.com,Proxy',
         'DOMAIN-SUFFIX,facebook.com,Proxy',
         'DOMAIN-SUFFIX,youtube.com,Proxy',
@@ -357,58 +667,308 @@ def create_docker_config(config):
         'DOMAIN-SUFFIX,alipay.com,DIRECT',
         'DOMAIN-SUFFIX,alibaba.com,DIRECT',
         'DOMAIN-SUFFIX,aliyun.com,DIRECT',
+        *PRIVATE_DIRECT_RULES,
         'GEOIP,CN,DIRECT',
         'MATCH,Proxy'
-    ]
+    ])
+    
+    # 指向被合并节点的规则改为指向保留的节点
+    if node_stats['aliases']:
+        rules = [rename_target(rule, node_stats['aliases']) for rule in rules]
+    
+    # 编译规则：去除重复和被前面规则覆盖的条目，减少每个新连接的匹配次数
+    config['rules'], stats = compile_rules(rules)
+    print_status(f"规则编译: {stats['before']} -> {stats['after']} 条 "
+                 f"(重复 {stats['duplicate']}, 被覆盖 {stats['shadowed']}, MATCH后 {stats['unreachable']})", "SUCCESS")
+    
+    # 按历史命中统计把热点规则前移（保持匹配结果不变）
+    config['rules'], moved = apply_rule_hits(config['rules'], load_rule_hits())
+    if moved:
+        print_status(f"按命中统计前移 {moved} 条规则", "INFO")
     
     return config
 
-def download_country_mmdb():
-    """下载Country.mmdb文件"""
-    print_status("正在下载Country.mmdb文件...", "PROCESSING")
-    
-    # Country.mmdb下载地址 - 使用release版本
+def load_mmdb_meta(mmdb_file):
+    """读取Country.mmdb的下载元数据（各镜像的ETag/Last-Modified）"""
+    try:
+        with open(mmdb_file + MMDB_META_SUFFIX, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_mmdb_meta(mmdb_file, meta):
+    """保存Country.mmdb的下载元数据"""
+    try:
+        with open(mmdb_file + MMDB_META_SUFFIX, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+    except OSError as e:
+        print_status(f"保存下载元数据失败: {e}", "WARNING")
+
+def validate_mmdb(file_path):
+    """检查文件末尾的MaxMind元数据段，确认是有效的MMDB数据库"""
+    try:
+        size = os.path.getsize(file_path)
+        with open(file_path, 'rb') as f:
+            f.seek(max(0, size - MMDB_METADATA_SEARCH))
+            tail = f.read()
+    except OSError:
+        return False
+    index = tail.rfind(MMDB_METADATA_MARKER)
+    if index < 0:
+        return False
+    metadata = tail[index + len(MMDB_METADATA_MARKER):]
+    return all(key in metadata for key in (b'database_type', b'node_count', b'record_size'))
+
+def request_mmdb(session, url, headers):
+    """向一个镜像发起流式请求，只等待响应头"""
+    return url, session.get(url, headers=headers, stream=True, timeout=(5, 30))
+
+def race_mirrors(session, requests_by_url):
+    """同时请求所有镜像，返回最先给出可用响应（200/206/304）的 (url, response)"""
+    winner = None
+    executor = ThreadPoolExecutor(max_workers=len(requests_by_url))
+    pending = {executor.submit(request_mmdb, session, url, headers) for url, headers in requests_by_url.items()}
+    try:
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    url, response = future.result()
+                except requests.exceptions.RequestException as e:
+                    print_status(f"镜像不可用: {e.__class__.__name__}", "WARNING")
+                    continue
+                if winner is None and response.status_code in (200, 206, 304):
+                    winner = (url, response)
+                else:
+                    response.close()
+    finally:
+        # 落后的镜像在响应到达后立即关闭，不等待其完成
+        for future in pending:
+            future.add_done_callback(lambda f: f.exception() is None and f.result()[1].close())
+        executor.shutdown(wait=False)
+    return winner
+
+def download_country_mmdb(mmdb_file="Country.mmdb", mirrors=None):
+    """下载Country.mmdb文件
+
+    多个镜像同时请求并选用最快响应的一个；带条件请求头，文件未变化时不重复下载，
+    镜像不返回ETag/Last-Modified时按内容摘要判断是否变化；
+    流式写入临时文件并支持断点续传，校验MMDB元数据后原子替换。
+    """
+    print_status("正在检查Country.mmdb更新...", "PROCESSING")
+    mirrors = mirrors or MMDB_MIRRORS
+    part_file = mmdb_file + ".part"
+    meta = load_mmdb_meta(mmdb_file)
+    have_file = os.path.exists(mmdb_file)
+    partial = meta.get('partial', {})
     
-    mmdb_url = "https://github.com/Dreamacro/maxmind-geoip/releases/latest/download/Country.mmdb"
-    github_mirror_url = "https://gh-proxy.com/https://github.com/Dreamacro/maxmind-geoip/releases/latest/download/Country.mmdb"
-    mmdb_file = "Country.mmdb"
+    requests_by_url = {}
+    for url in mirrors:
+        headers = {}
+        validators = meta.get('validators', {}).get(url, {})
+        if have_file and validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if have_file and validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        # 同一镜像上次未完成的下载，从断点继续
+        if partial.get('url') == url and os.path.exists(part_file):
+            headers['Range'] = f"bytes={os.path.getsize(part_file)}-"
+            if partial.get('etag'):
+                headers['If-Range'] = partial['etag']
+        requests_by_url[url] = headers
     
+    session = requests.Session()
     try:
-        # 直接下载Country.mmdb文件
-        print_status(f"下载Country.mmdb文件:{github_mirror_url}", "PROCESSING")
-        response = requests.get(github_mirror_url, timeout=30)
-        response.raise_for_status()
+        winner = race_mirrors(session, requests_by_url)
+        if winner is None:
+            print_status("所有镜像均下载失败", "ERROR")
+            return False
+        url, response = winner
+        
+        if response.status_code == 304:
+            response.close()
+            print_status("Country.mmdb未变化，无需下载", "SUCCESS")
+            return True
         
-        # 保存文件到当前目录
-        target_path = mmdb_file
-        with open(target_path, 'wb') as f:
-            f.write(response.content)
+        print_status(f"下载Country.mmdb文件: {url}", "PROCESSING")
+        etag = response.headers.get('ETag')
+        resume = response.status_code == 206
+        meta['partial'] = {'url': url, 'etag': etag}
+        save_mmdb_meta(mmdb_file, meta)
         
-        print_status(f"Country.mmdb文件已下载到: {target_path}", "SUCCESS")
+        with open(part_file, 'ab' if resume else 'wb') as f:
+            for chunk in response.iter_content(chunk_size=1 << 16):
+                f.write(chunk)
+        response.close()
+        
+        if not validate_mmdb(part_file):
+            os.remove(part_file)
+            meta.pop('partial', None)
+            save_mmdb_meta(mmdb_file, meta)
+            print_status("下载的文件不是有效的MMDB数据库", "ERROR")
+            return False
+        
+        meta.pop('partial', None)
+        meta.setdefault('validators', {})[url] = {
+            'etag': etag,
+            'last_modified': response.headers.get('Last-Modified')
+        }
+        # 镜像不支持条件请求时按内容摘要判断，内容相同则保留现有文件，不触发重新放置和容器重建
+        if have_file and file_digest(part_file) == file_digest(mmdb_file):
+            os.remove(part_file)
+            save_mmdb_meta(mmdb_file, meta)
+            print_status("Country.mmdb内容未变化，保留现有文件", "SUCCESS")
+            return True
+        os.replace(part_file, mmdb_file)
+        save_mmdb_meta(mmdb_file, meta)
+        print_status(f"Country.mmdb文件已{'续传' if resume else '下载'}到: {mmdb_file}", "SUCCESS")
         return True
-                
+        
     except requests.exceptions.RequestException as e:
-        print_status(f"下载失败: {e}", "ERROR")
-        return False
-    except zipfile.BadZipFile:
-        print_status("下载的文件不是有效的zip格式", "ERROR")
+        print_status(f"下载失败（已保留进度，下次续传）: {e}", "ERROR")
         return False
     except Exception as e:
         print_status(f"处理文件失败: {e}", "ERROR")
         return False
+    finally:
+        session.close()
 
 def save_config(config, file_path):
     """保存配置到文件"""
     try:
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
         with open(file_path, 'w', encoding='utf-8') as f:
-            yaml.dump(config, f, default_flow_style=False, allow_unicode=True, sort_keys=False)
+            dump_yaml(config, f)
         print_status(f"配置已保存到: {file_path}", "SUCCESS")
         return True
     except Exception as e:
         print_status(f"保存配置失败: {e}", "ERROR")
         return False
 
+def file_digest(file_path):
+    """计算文件内容的sha256，文件不存在时返回None"""
+    try:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    except OSError:
+        return None
+
+def compute_build_key(config_file, rule_files=(), rule_providers=False, dns_config=None, overrides=None):
+    """根据源配置、生成器代码和设置、密钥计算配置生成的缓存键"""
+    generator_dir = os.path.dirname(os.path.abspath(__file__))
+    parts = {
+        'source': file_digest(config_file),
+        'generator': [file_digest(os.path.join(generator_dir, name))
+                      for name in ('start_clash_docker.py', 'rule_compiler.py', 'proxy_normalizer.py',
+                                   'rule_providers.py', 'dns_bench.py', 'compose_profiles.py', 'yaml_io.py',
+                                   'preflight.py', 'subscription.py', 'scale_out.py')],
+        'rules': [file_digest(path) for path in rule_files],
+        'rule_providers': providers_digest() if rule_providers else None,
+        'dns': dns_config,
+        'overrides': overrides,
+        'rule_hits': file_digest(RULE_HITS_FILE),
+        'secret': hashlib.sha256((load_secret_from_file() or '').encode()).hexdigest()
+    }
+    if parts['source'] is None or not load_secret_from_file():
+        return None
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+def load_build_cache():
+    """读取配置生成缓存"""
+    try:
+        with open(BUILD_CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_build_cache(key, settings):
+    """记录本次生成的缓存键、输出文件摘要和需要重建容器的配置项"""
+    if not key:
+        return
+    try:
+        with open(BUILD_CACHE_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'key': key, 'output': file_digest(OUTPUT_CONFIG), 'settings': settings}, f)
+    except OSError as e:
+        print_status(f"保存生成缓存失败: {e}", "WARNING")
+
+def preflight_config(config, policy, deadline):
+    """探测节点可达性，按策略删除或后移不可达节点"""
+    results, stats = probe_proxies(config.get('proxies') or [], deadline=deadline)
+    affected = prune_unreachable(config, results, policy)
+    print_status(f"节点预检: 可达 {stats['reachable']}, 不可达 {stats['unreachable']}, "
+                 f"未完成 {stats['timed_out']} (缓存 {stats['cached']}/{stats['targets']})", "SUCCESS")
+    if affected:
+        print_status(f"{'删除' if policy == 'drop' else '后移'} {affected} 个不可达节点", "INFO")
+
+def build_config(config_file, rule_files=(), use_cache=True, streaming=None,
+                 preflight=None, preflight_deadline=5.0, rule_providers=False,
+                 dns_bench=False, fake_ip=False, overrides=None):
+    """加载、转换并保存配置；输入未变化时直接复用上次结果
+
+    preflight 为 'drop' 或 'demote' 时在生成前探测节点可达性，
+    此时结果依赖网络状态，不使用生成缓存（探测结果本身有TTL缓存）。
+    rule_providers 为True时先用条件请求刷新已知规则集，内容哈希计入缓存键，生成时不再重复请求。
+    dns_bench 为True时用最快的健康解析器生成 dns 段（测速结果缓存一天），fake_ip 启用fake-ip模式。
+    overrides 为compose配置档对Clash配置的修改，计入缓存键。
+    返回部署指纹（每次按当前compose文件重新计算），失败时返回None
+    """
+    fresh_providers = refresh_providers() if rule_providers and use_cache else None
+    dns_config = None
+    if dns_bench:
+        with timed_phase("dns-bench"):
+            dns_config = fastest_dns_config(fake_ip=fake_ip)
+        print_status(f"DNS上游: {', '.join(dns_config['default-nameserver'])} | "
+                     f"{', '.join(dns_config['nameserver'])}", "SUCCESS")
+    elif fake_ip:
+        dns_config = build_dns_config(fake_ip=True)
+    key = compute_build_key(config_file, rule_files, rule_providers, dns_config, overrides)
+    cache = load_build_cache() if use_cache and not preflight else {}
+    if (key and cache.get('key') == key and cache.get('output') == file_digest(OUTPUT_CONFIG)
+            and 'settings' in cache):
+        print_status("源配置和生成设置未变化，跳过解析和生成", "SUCCESS")
+        return deploy_fingerprint(cache['settings'])
+    
+    # 加载配置文件
+    with timed_phase("parse"):
+        config = load_config(config_file, streaming, keep_rules=rule_providers)
+    if not config:
+        return None
+    
+    # 读取用户规则文件
+    try:
+        extra_rules = load_rule_files(rule_files)
+    except Exception as e:
+        print_status(f"读取规则文件失败: {e}", "ERROR")
+        return None
+    
+    # 节点预检
+    if preflight:
+        with timed_phase("preflight"):
+            preflight_config(config, preflight, preflight_deadline)
+    
+    # 创建Docker配置
+    with timed_phase("generate"):
+        config = create_docker_config(config, extra_rules, rule_providers,
+                                      os.path.dirname(os.path.abspath(config_file)), dns_config, overrides,
+                                      fresh_providers)
+    
+    # 保存配置
+    previous = file_digest(OUTPUT_CONFIG)
+    with timed_phase("write"):
+        saved = save_config(config, OUTPUT_CONFIG)
+    if not saved:
+        return None
+    if file_digest(OUTPUT_CONFIG) == previous:
+        print_status("生成结果与现有配置完全相同", "INFO")
+    
+    settings = recreate_settings(config)
+    # 密钥和规则集可能在生成过程中才创建或更新，需要重新计算缓存键
+    save_build_cache(compute_build_key(config_file, rule_files, rule_providers, dns_config, overrides), settings)
+    return deploy_fingerprint(settings)
+
 def run_command(command):
     """运行命令"""
     try:
@@ -417,63 +977,296 @@ def run_command(command):
     except subprocess.CalledProcessError as e:
         return False, e.stderr
 
+def prepare_country_mmdb(mmdb_path="Country.mmdb"):
+    """确保Country.mmdb存在且未过期，并放入挂载到容器的config目录"""
+    # 检查Country.mmdb文件是否存在，过期时用条件请求检查更新
+    if not os.path.exists(mmdb_path):
+        print_status("Country.mmdb文件不存在，尝试下载...", "WARNING")
+        if not download_country_mmdb(mmdb_path):
+            print_status("Country.mmdb下载失败，继续启动服务...", "WARNING")
+            return False
+    elif time.time() - os.path.getmtime(mmdb_path) > MMDB_MAX_AGE:
+        if not download_country_mmdb(mmdb_path):
+            print_status("Country.mmdb更新失败，继续使用现有文件", "WARNING")
+        else:
+            os.utime(mmdb_path)
+    # 多实例部署时放入每个实例的配置目录
+    return all([stage_country_mmdb(mmdb_path, instance['config_dir']) for instance in load_instances()])
+
+def stage_country_mmdb(mmdb_path="Country.mmdb", config_dir="config"):
+    """将Country.mmdb原子地放入config目录（即容器内的/root/.config/clash），Clash首次启动即可加载"""
+    target = os.path.join(config_dir, os.path.basename(mmdb_path))
+    if file_digest(target) == file_digest(mmdb_path):
+        return True
+    try:
+        os.makedirs(config_dir, exist_ok=True)
+        shutil.copyfile(mmdb_path, target + ".tmp")
+        os.replace(target + ".tmp", target)
+        print_status(f"Country.mmdb已放入挂载目录: {target}", "SUCCESS")
+        return True
+    except OSError as e:
+        print_status(f"放置Country.mmdb失败: {e}", "WARNING")
+        return False
+
 def start_services():
     """启动Docker服务"""
     print_status("正在启动Docker服务...", "PROCESSING")
     
-    # 停止现有服务
-    run_command("docker compose down")
+    # 停止现有服务（包括实例数变化后compose中已不存在的实例）
+    run_command("docker compose down --remove-orphans")
     
-    # 检查Country.mmdb文件是否存在
-    mmdb_path = "Country.mmdb"
-    if not os.path.exists(mmdb_path):
-        print_status("Country.mmdb文件不存在，尝试下载...", "WARNING")
-        if not download_country_mmdb():
-            print_status("Country.mmdb下载失败，继续启动服务...", "WARNING")
+    # Country.mmdb在启动前放入挂载目录，无需docker cp和额外重启
+    with timed_phase("mmdb"):
+        prepare_country_mmdb()
     
     # 启动服务
-    success, output = run_command("docker compose up -d")
+    with timed_phase("compose up"):
+        success, output = run_command("docker compose up -d")
     if not success:
         print_status(f"启动服务失败: {output}", "ERROR")
         return False
     
-    # 如果Country.mmdb文件存在，复制到容器中
-    if os.path.exists(mmdb_path):
-        print_status("正在将Country.mmdb文件复制到容器中...", "PROCESSING")
-        # 先确保容器内的目录存在
-        run_command("docker exec clash mkdir -p /root/.config/clash")
-        # 复制文件到容器
-        success, output = run_command(f"docker cp {mmdb_path} clash:/root/.config/clash/")
-        if success:
-            print_status("Country.mmdb文件已成功复制到容器", "SUCCESS")
-            # 重启clash容器以加载新的Country.mmdb文件
-            print_status("重启clash容器以加载Country.mmdb...", "PROCESSING")
-            run_command("docker restart clash")
-        else:
-            print_status(f"复制Country.mmdb到容器失败: {output}", "WARNING")
+    # 等待API和代理端口真正可用；多实例时等待每个实例，最后等待负载均衡器的7890端口
+    with timed_phase("ready"):
+        start = time.perf_counter()
+        instances = load_instances()
+        targets = [(instance['controller'], instance['mixed_port']) for instance in instances]
+        if len(instances) > 1:
+            targets.append((instances[0]['controller'], 7890))
+        ready = True
+        for controller, port in targets:
+            with ClashAPI(controller, retries=0) as api:
+                if wait_until_ready(api, proxy_port=port) is None:
+                    ready = False
+                    break
+        ready = time.perf_counter() - start if ready else None
+    if ready is not None:
+        print_status(f"Docker服务启动成功，就绪耗时 {ready:.1f}s", "SUCCESS")
+    else:
+        print_status("Docker服务已启动，但API或代理端口尚未就绪", "WARNING")
+    return True
+
+def recreate_settings(config):
+    """提取修改后需要重建容器的配置项（端口监听相关）"""
+    settings = {key: config.get(key) for key in RECREATE_KEYS}
+    settings['dns-listen'] = (config.get('dns') or {}).get('listen')
+    return settings
+
+def deploy_fingerprint(settings, compose_file="docker-compose.yml"):
+    """计算需要重建容器的部分（compose定义、yacd的env文件和端口配置）的指纹"""
+    digest = hashlib.sha256()
+    for path in (compose_file, YACD_ENV_FILE):
+        try:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        except OSError:
+            pass
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()
+
+def applied_config_digest():
+    """容器实际加载的配置文件（多实例时为每个实例的配置）的摘要"""
+    digest = hashlib.sha256()
+    for instance in load_instances():
+        digest.update(str(file_digest(os.path.join(instance['config_dir'], 'config.yaml'))).encode())
+    return digest.hexdigest()
+
+def load_deploy_state():
+    """读取上次部署状态"""
+    try:
+        with open(DEPLOY_STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_deploy_state(fingerprint, deployment=None):
+    """记录本次成功部署的指纹、已加载配置的摘要和部署设置（未指定时保留上次的设置）"""
+    if deployment is None:
+        deployment = load_deploy_state().get('deployment')
+    try:
+        os.makedirs(os.path.dirname(DEPLOY_STATE_FILE), exist_ok=True)
+        with open(DEPLOY_STATE_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': fingerprint, 'config': applied_config_digest(),
+                       'mmdb': file_digest("Country.mmdb"), 'deployment': deployment,
+                       'time': int(time.time())}, f)
+    except OSError as e:
+        print_status(f"保存部署状态失败: {e}", "WARNING")
+
+def resolve_deployment(args):
+    """合并命令行指定的部署设置和上次成功部署的设置，未指定的项沿用上次的值"""
+    saved = load_deploy_state().get('deployment') or {}
+    deployment = {}
+    reused = []
+    for key, default in DEPLOY_DEFAULTS.items():
+        value = getattr(args, key)
+        if value is None and key in saved:
+            value = saved[key]
+            if value != default:
+                reused.append(f"{key}={value}")
+        deployment[key] = default if value is None else value
+    if reused:
+        print_status(f"沿用上次部署的设置: {', '.join(reused)}", "INFO")
+    return deployment
+
+def is_clash_running():
+    """检查clash容器（多实例时所有实例和负载均衡器）是否在运行"""
+    instances = load_instances()
+    names = [instance['name'] for instance in instances] + ([LB_CONTAINER] if len(instances) > 1 else [])
+    return all(container_running(name) for name in names)
+
+def reload_config():
+    """通过API热加载配置（多实例时逐个实例），不重启容器"""
+    try:
+        for instance in load_instances():
+            get_client(instance['controller']).reload_config(CONTAINER_CONFIG_PATH)
+        return True
+    except requests.exceptions.HTTPError as e:
+        print_status(f"热加载失败: HTTP {e.response.status_code} {e.response.text.strip()}", "WARNING")
+    except requests.exceptions.RequestException as e:
+        print_status(f"热加载失败: {e}", "WARNING")
+    return False
+
+def apply_config(fingerprint, deployment=None):
+    """应用新配置：容器运行中且端口/compose未变化时热加载，否则重建容器
+
+    与上次成功应用的配置摘要比较，生成后应用失败的配置会在下次apply时重新应用。
+    Clash只在启动时加载Country.mmdb，热加载不会读取新文件，因此mmdb更新后同样重建容器。
+    """
+    state = load_deploy_state()
+    with timed_phase("mmdb"):
+        prepare_country_mmdb()
+    mmdb_changed = 'mmdb' in state and state['mmdb'] != file_digest("Country.mmdb")
+    if state.get('fingerprint') == fingerprint and not mmdb_changed and is_clash_running():
+        if state.get('config') == applied_config_digest():
+            print_status("配置和部署定义均未变化，无需任何操作", "SUCCESS")
+            return True
+        print_status("端口和compose定义未变化，通过API热加载配置...", "PROCESSING")
+        start = time.perf_counter()
+        with timed_phase("reload"):
+            reloaded = reload_config()
+        if reloaded:
+            print_status(f"配置已热加载 ({(time.perf_counter() - start) * 1000:.0f}ms)，现有连接未中断", "SUCCESS")
+            save_deploy_state(fingerprint, deployment)
+            return True
+        print_status("热加载失败，改为重建容器", "WARNING")
+    elif mmdb_changed:
+        print_status("Country.mmdb已更新，Clash只在启动时加载，需要重建容器", "INFO")
+    else:
+        print_status("首次部署或端口/compose定义已变化，需要重建容器", "INFO")
     
-    print_status("Docker服务启动成功", "SUCCESS")
+    if not start_services():
+        return False
+    save_deploy_state(fingerprint, deployment)
     return True
 
+def prepare_compose(profile='default', bridge=False, cpuset=None, memory=MEMORY_LIMIT, instances=1):
+    """按配置档生成docker-compose.yml，返回该配置档对Clash配置的修改
+
+    compose文件内容计入部署指纹，切换配置档或实例数后apply会重建容器而不是热加载。
+    yacd使用的API密钥写入不纳入版本控制的env文件，compose文件中不包含密钥。
+    instances 大于1时同时生成负载均衡配置，并记录实例列表供状态、测速和指标工具使用。
+    """
+    secret = load_secret_from_file() or ensure_secret()
+    write_yacd_env(secret)
+    compose = build_compose(profile, secret, bridge, default_cpuset() if cpuset is None else cpuset, memory,
+                            instances)
+    if write_compose(compose, profile):
+        print_status(f"已按配置档 {profile} 生成docker-compose.yml"
+                     f"{f' ({instances} 个实例)' if instances > 1 else ''}", "SUCCESS")
+    layout = instance_layout(instances)
+    if instances > 1:
+        write_text(LB_CONFIG, haproxy_config(layout, uses_host_network(profile, bridge)))
+    save_instances(layout)
+    hint = host_sysctl_hint(profile, bridge)
+    if hint:
+        print_status(f"host网络下net sysctl需在宿主机上调整: {hint}", "INFO")
+    return config_overrides(profile, bridge)
+
+def print_profile_comparison(results, baseline='default'):
+    """按场景对比各配置档的请求速率和p99延迟"""
+    profiles = [profile for profile in PROFILES if profile in results]
+    print(f"{'场景':<22}" + "".join(f" {profile + ' 请求/s':>24} {'p99':>7}" for profile in profiles))
+    for case in results.get(baseline) or []:
+        key = (case['mode'], case['scheme'], case['reuse'])
+        label = f"{case['mode']}/{case['scheme']}/{'复用' if case['reuse'] else '新建'}"
+        line = f"{label:<22}"
+        for profile in profiles:
+            match = next((r for r in results[profile] if (r['mode'], r['scheme'], r['reuse']) == key), None)
+            if match is None:
+                line += f" {'-':>24} {'-':>7}"
+                continue
+            gain = f" ({match['rps'] / case['rps']:.2f}x)" if profile != baseline and case['rps'] else ""
+            rps = f"{match['rps']:.0f}{gain}"
+            p99 = "-" if match['p99'] is None else f"{match['p99']:.1f}"
+            line += f" {rps:>24} {p99:>7}"
+        print(line)
+
+def prepare_deployment(config_file, build_options, profile='default', bridge=False, cpuset=None,
+                       memory=MEMORY_LIMIT, instances=1, shard_policy='replicate'):
+    """生成compose文件和配置，多实例时再拆分为每个实例的配置
+
+    返回部署指纹，失败时返回None
+    """
+    # compose文件需在计算部署指纹之前生成
+    overrides = prepare_compose(profile, bridge, cpuset, memory, instances)
+    fingerprint = build_config(config_file, overrides=overrides, **build_options)
+    if fingerprint and instances > 1:
+        with timed_phase("shard"):
+            write_instance_configs(OUTPUT_CONFIG, instance_layout(instances), shard_policy,
+                                   uses_host_network(profile, bridge))
+    return fingerprint
+
+def benchmark_profiles(config_file, build_options, final_profile='default', bridge=False, cpuset=None,
+                       memory=MEMORY_LIMIT, instances=1, shard_policy='replicate', json_path=None, **load_options):
+    """依次用每个配置档重建容器并运行压力测试，对比前后结果
+
+    final_profile 最后测试，测试结束后保持部署。返回 {配置档: 结果列表}，部署失败时返回None。
+    """
+    order = [profile for profile in PROFILES if profile != final_profile] + [final_profile]
+    results = {}
+    for profile in order:
+        print_status(f"配置档 {profile}: 部署并运行压力测试...", "PROCESSING")
+        fingerprint = prepare_deployment(config_file, build_options, profile, bridge, cpuset, memory,
+                                            instances, shard_policy)
+        if not fingerprint or not start_services():
+            return None
+        save_deploy_state(fingerprint, {'profile': profile, 'bridge': bridge, 'cpuset': cpuset, 'memory': memory,
+                                        'instances': instances, 'shard_policy': shard_policy})
+        results[profile] = run_load_test(**load_options)
+    print()
+    print_profile_comparison(results)
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print_status(f"结果已保存到: {json_path}", "SUCCESS")
+    return results
+
 def check_service_status():
     """检查服务状态"""
     print_status("检查服务状态...", "PROCESSING")
     
-    success, output = run_command("docker compose ps")
-    if not success:
-        print_status(f"检查服务状态失败: {output}", "ERROR")
-        return False
+    # 直接读取容器状态和健康检查结果，而不是在文本输出中查找"Up"
+    healthy = True
+    instances = load_instances()
+    names = [instance['name'] for instance in instances] + ([LB_CONTAINER] if len(instances) > 1 else [])
+    for name in names + ["yacd"]:
+        status = container_status(name)
+        if not status:
+            print(f"   ❌ {name}: 不存在")
+            healthy = False
+            continue
+        ok = status['state'] == 'running' and status['health'] in (None, 'healthy')
+        healthy = healthy and ok
+        health = f" ({status['health']})" if status['health'] else ""
+        print(f"   {'✅' if ok else '❌'} {name}: {status['state']}{health}")
     
-    if "Up" in output:
+    if healthy:
         print_status("服务运行正常", "SUCCESS")
-        print(output)
         return True
     else:
         print_status("服务未正常运行", "ERROR")
         return False
 
-
-
 def get_yaml_files():
     """获取当前目录下所有的.yaml文件"""
     yaml_files = []
@@ -515,51 +1308,175 @@ def select_config_file():
         except ValueError:
             print_status("请输入有效的数字", "WARNING")
 
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="Clash Docker 一键启动工具")
+    parser.add_argument("mode", nargs="?", default="start",
+                        choices=["start", "apply", "status", "benchmark-nodes", "auto-select", "reorder-rules", "exporter", "top",
+                                 "benchmark-profiles", "select"],
+                        help="运行模式 (默认: start)")
+    parser.add_argument("--rounds", type=int, default=3, help="测速轮数")
+    parser.add_argument("--concurrency", type=int, default=16, help="测速最大并发数")
+    parser.add_argument("--url", default=DELAY_TEST_URL, help="延迟测试地址")
+    parser.add_argument("--timeout", type=int, default=5000, help="单次测速超时（毫秒）")
+    parser.add_argument("--top", type=int, help="只显示前N个节点")
+    parser.add_argument("--json", dest="json_path", help="将结果写入JSON文件")
+    parser.add_argument("--interval", type=int, default=60, help="自动选择的测速间隔（秒）")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="切换所需的最小相对提升")
+    parser.add_argument("--min-gain", type=int, default=30, help="切换所需的最小延迟提升（毫秒）")
+    parser.add_argument("--dwell", type=int, default=300, help="两次切换之间的最短停留时间（秒）")
+    parser.add_argument("--once", action="store_true", help="自动选择只执行一轮")
+    parser.add_argument("--stream", action="store_true", help="流式加载源配置（超过8MB时自动启用）")
+    parser.add_argument("--rebuild", action="store_true", help="忽略生成缓存，强制重新生成配置")
+    parser.add_argument("--metrics-port", type=int, default=9877, help="指标导出监听端口")
+    parser.add_argument("--window", type=int, default=300, help="规则命中采样窗口（秒）")
+    parser.add_argument("--preflight", choices=["drop", "demote"], help="生成配置前探测节点可达性，删除或后移不可达节点")
+    parser.add_argument("--preflight-deadline", type=float, default=5.0, help="节点预检总时限（秒）")
+    parser.add_argument("--subscribe", action="append", default=[], help="订阅地址（可重复），代替本地配置文件")
+    parser.add_argument("--rule-providers", action="store_true",
+                        help="使用源配置自己的规则，并把rule-providers编译为内联规则")
+    parser.add_argument("--dns-bench", action="store_true", help="测速候选DNS解析器，用最快的健康解析器生成dns配置")
+    parser.add_argument("--fake-ip", action="store_true", help="DNS使用fake-ip模式")
+    parser.add_argument("--rules", action="append", default=[], help="用户规则文件（可重复），编译后置于内置规则之前")
+    parser.add_argument("--profile", choices=PROFILES,
+                        help="docker-compose.yml配置档（默认沿用上次部署，首次为default）；"
+                             "benchmark-profiles模式下为测试结束后保持部署的配置档")
+    parser.add_argument("--bridge", action=argparse.BooleanOptionalAction,
+                        help="high-throughput配置档也使用bridge网络（默认沿用上次部署）")
+    parser.add_argument("--cpuset", help="high-throughput配置档绑定的CPU（如 1-3），空字符串表示不绑定（默认沿用上次部署）")
+    parser.add_argument("--memory", help=f"high-throughput配置档的内存上限，空字符串表示不限制（默认沿用上次部署，首次为{MEMORY_LIMIT}）")
+    parser.add_argument("--duration", type=float, default=10, help="benchmark-profiles每个压测场景的持续时间（秒）")
+    parser.add_argument("--instances", type=int,
+                        help="clash实例数，大于1时前置HAProxy负载均衡器（默认沿用上次部署，首次为1）")
+    parser.add_argument("--shard-policy", choices=SHARD_POLICIES,
+                        help="多实例的节点分配：replicate 每个实例都有全部节点，partition 节点分片到各实例（默认沿用上次部署）")
+    parser.add_argument("--group", help="select模式: Selector代理组名称")
+    parser.add_argument("--node", help="select模式: 要切换到的节点")
+    return parser.parse_args()
+
 def main():
     """主函数"""
+    args = parse_args()
     print("🚀 Clash Docker 一键启动工具")
     print("============================")
     
     # 检查命令行参数
-    if len(sys.argv) > 1 and sys.argv[1] == "status":
+    if args.mode == "status":
         show_proxy_status()
         print("\n" + "="*50)
         # 调用独立的测试脚本
         os.system("python3 test_proxy.py")
         return
     
-    # 选择配置文件
-    config_file = select_config_file()
+    if args.mode == "benchmark-nodes":
+        results = benchmark_nodes(
+            rounds=max(1, args.rounds),
+            concurrency=max(1, args.concurrency),
+            url=args.url,
+            timeout_ms=args.timeout,
+            top=args.top,
+            json_path=args.json_path
+        )
+        if results is None:
+            sys.exit(1)
+        return
     
-    # 加载配置文件
-    config = load_config(config_file)
-    if not config:
-        sys.exit(1)
+    if args.mode == "auto-select":
+        auto_select(
+            interval=max(1, args.interval),
+            tolerance=args.tolerance,
+            min_gain_ms=args.min_gain,
+            dwell=args.dwell,
+            concurrency=max(1, args.concurrency),
+            url=args.url,
+            timeout_ms=args.timeout,
+            once=args.once
+        )
+        return
     
-    # 创建Docker配置
-    config = create_docker_config(config)
+    if args.mode == "exporter":
+        # 连接每5秒采样一次，节点延迟按 --interval 测试
+        run_exporter(port=args.metrics_port, delay_interval=max(1, args.interval),
+                     concurrency=max(1, args.concurrency), url=args.url, timeout_ms=args.timeout)
+        return
     
-    # 保存配置
-    if not save_config(config, "config/config.yaml"):
-        sys.exit(1)
+    if args.mode == "top":
+        run_top()
+        return
     
-    # 启动服务
-    if not start_services():
+    if args.mode == "select":
+        if not args.group or not args.node:
+            print_status("select模式需要 --group 和 --node", "ERROR")
+            sys.exit(1)
+        if not select_node(args.group, args.node):
+            sys.exit(1)
+        return
+    
+    if args.mode == "reorder-rules":
+        if not reorder_config_rules(window=max(1, args.window)):
+            sys.exit(1)
+        return
+    
+    # 选择配置文件：指定订阅时使用合并后的订阅配置
+    if args.subscribe:
+        config_file = update_subscriptions(args.subscribe)
+        if not config_file:
+            sys.exit(1)
+    else:
+        config_file = select_config_file()
+    
+    build_options = {
+        'rule_files': args.rules,
+        'use_cache': not args.rebuild,
+        'streaming': True if args.stream else None,
+        'preflight': args.preflight,
+        'preflight_deadline': args.preflight_deadline,
+        'rule_providers': args.rule_providers,
+        'dns_bench': args.dns_bench,
+        'fake_ip': args.fake_ip
+    }
+    
+    # 未指定的配置档、网络、CPU、内存和实例设置沿用上次成功部署的值，普通apply不会回退到默认配置档或单实例
+    deployment = resolve_deployment(args)
+    
+    if args.mode == "benchmark-profiles":
+        results = benchmark_profiles(config_file, build_options, final_profile=deployment['profile'],
+                                     bridge=deployment['bridge'], cpuset=deployment['cpuset'],
+                                     memory=deployment['memory'], instances=max(1, deployment['instances']),
+                                     shard_policy=deployment['shard_policy'], json_path=args.json_path,
+                                     concurrency=max(1, args.concurrency), duration=args.duration)
+        if results is None:
+            sys.exit(1)
+        return
+    
+    # 按配置档生成compose文件和配置（输入未变化时使用缓存），多实例时拆分实例配置
+    fingerprint = prepare_deployment(config_file, build_options, deployment['profile'], deployment['bridge'],
+                                     deployment['cpuset'], deployment['memory'], max(1, deployment['instances']),
+                                     deployment['shard_policy'])
+    if not fingerprint:
         sys.exit(1)
     
+    # 启动服务：apply模式优先热加载，start模式总是重建容器
+    if args.mode == "apply":
+        if not apply_config(fingerprint, deployment):
+            sys.exit(1)
+    else:
+        if not start_services():
+            sys.exit(1)
+        save_deploy_state(fingerprint, deployment)
+    
     # 检查服务状态
     if not check_service_status():
         sys.exit(1)
     
     print("\n🎉 启动完成！")
+    print_phase_timings()
     
     # 获取服务器IP用于显示访问信息
     server_ip = get_server_ip()
     
     # 读取生成的密钥
-    secret = load_secret_from_file()
-    if not secret:
-        secret = 'dler'
+    secret = load_secret()
     
     print("\n🌐 访问信息:")
     print("=" * 50)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Clash 订阅更新工具
+并发下载一个或多个订阅（带ETag/Last-Modified条件请求，结果缓存在本地），
+按节点身份增量合并为一份配置；合并结果未变化时不改写文件，后续生成和热加载会被跳过
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from yaml_io import load_yaml, dump_yaml
+from proxy_normalizer import node_identity
+
+# 订阅缓存目录、索引文件和合并结果
+SUBSCRIPTION_DIR = "config/subscriptions"
+SUBSCRIPTION_INDEX = os.path.join(SUBSCRIPTION_DIR, "index.json")
+MERGED_CONFIG = os.path.join(SUBSCRIPTION_DIR, "merged.yaml")
+# 大多数机场按User-Agent返回Clash格式的订阅
+USER_AGENT = "clash"
+
+def print_status(message, status="INFO"):
+    """打印状态信息"""
+    emoji_map = {
+        "INFO": "ℹ️",
+        "SUCCESS": "✅",
+        "ERROR": "❌",
+        "WARNING": "⚠️",
+        "PROCESSING": "🔄"
+    }
+    emoji = emoji_map.get(status, "ℹ️")
+    print(f"{emoji} {message}")
+
+def cache_path(url):
+    """订阅内容的本地缓存路径"""
+    return os.path.join(SUBSCRIPTION_DIR, hashlib.sha256(url.encode()).hexdigest()[:16] + ".yaml")
+
+def load_index():
+    try:
+        with open(SUBSCRIPTION_INDEX, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_index(index):
+    try:
+        with open(SUBSCRIPTION_INDEX, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print_status(f"保存订阅索引失败: {e}", "WARNING")
+
+def load_subscription(path):
+    """读取缓存的订阅内容，不是含proxies列表的Clash配置时返回None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            config = load_yaml(f)
+    except Exception:
+        return None
+    if not isinstance(config, dict) or not isinstance(config.get('proxies'), list):
+        return None
+    return config
+
+def file_digest(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+def fetch_subscription(session, url, validators, timeout=30):
+    """下载单个订阅，返回 (状态, 新的校验信息)，状态为 updated/unchanged/failed"""
+    path = cache_path(url)
+    headers = {}
+    if os.path.exists(path):
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+    try:
+        response = session.get(url, headers=headers, timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        print_status(f"订阅下载失败 {url}: {e.__class__.__name__}", "WARNING")
+        return 'failed', validators
+    if response.status_code == 304:
+        return 'unchanged', validators
+    if response.status_code != 200:
+        print_status(f"订阅下载失败 {url}: HTTP {response.status_code}", "WARNING")
+        return 'failed', validators
+
+    validators = {'etag': response.headers.get('ETag'),
+                  'last_modified': response.headers.get('Last-Modified'),
+                  'digest': hashlib.sha256(response.content).hexdigest()}
+    # 服务端不支持条件请求时，按内容摘要判断是否变化
+    if os.path.exists(path) and validators['digest'] == file_digest(path):
+        return 'unchanged', validators
+
+    part_file = path + ".part"
+    with open(part_file, 'wb') as f:
+        f.write(response.content)
+    if load_subscription(part_file) is None:
+        os.remove(part_file)
+        print_status(f"订阅内容不是有效的Clash配置: {url}", "WARNING")
+        return 'failed', {}
+    os.replace(part_file, path)
+    return 'updated', validators
+
+def fetch_subscriptions(urls, concurrency=8, timeout=30):
+    """并发下载所有订阅，返回 {url: 状态}"""
+    os.makedirs(SUBSCRIPTION_DIR, exist_ok=True)
+    index = load_index()
+    validators = index.get('validators', {})
+    session = requests.Session()
+    session.headers['User-Agent'] = USER_AGENT
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(urls)))) as executor:
+            results = list(executor.map(
+                lambda url: fetch_subscription(session, url, validators.get(url, {}), timeout), urls))
+    finally:
+        session.close()
+    for url, (_, new_validators) in zip(urls, results):
+        validators[url] = new_validators
+    index['validators'] = validators
+    save_index(index)
+    return {url: status for url, (status, _) in zip(urls, results)}
+
+def merge_subscriptions(urls):
+    """按节点身份合并订阅，返回合并后的配置；没有可用订阅时返回None
+
+    第一个可用订阅提供代理组和其他设置，其中身份重复的节点只保留第一个，
+    代理组中被删除节点的名称改为保留的节点；后续订阅中身份相同的节点被跳过，
+    新节点重名时加上订阅序号，并追加到引用了节点的代理组中。
+    """
+    base = None
+    names = set()
+    identities = {}  # 节点身份 -> 保留的节点名称
+    aliases = {}     # 被删除的重复节点名称 -> 保留的节点名称
+    extra = []
+    for number, url in enumerate(urls, 1):
+        config = load_subscription(cache_path(url))
+        if config is None:
+            continue
+        kept = []
+        for proxy in config['proxies']:
+            if not isinstance(proxy, dict) or not proxy.get('name'):
+                continue
+            identity = node_identity(proxy)
+            if identity in identities:
+                if base is None and str(proxy['name']) != identities[identity]:
+                    aliases[str(proxy['name'])] = identities[identity]
+                continue
+            if base is not None:
+                proxy = dict(proxy)
+                name = str(proxy['name'])
+                suffix = 1
+                while name in names:
+                    name = f"{proxy['name']} [{number}]" + (f" {suffix}" if suffix > 1 else "")
+                    suffix += 1
+                proxy['name'] = name
+                extra.append(name)
+            identities[identity] = str(proxy['name'])
+            names.add(str(proxy['name']))
+            kept.append(proxy)
+        if base is None:
+            base = config
+            base['proxies'] = kept
+            base_names = set(names)
+        else:
+            base['proxies'].extend(kept)
+
+    if base is None:
+        return None
+    for group in base.get('proxy-groups') or []:
+        members = group.get('proxies') if isinstance(group, dict) else None
+        if not isinstance(members, list):
+            continue
+        if aliases:
+            seen = set()
+            rewritten = []
+            for member in members:
+                member = aliases.get(str(member), member)
+                if member not in seen:
+                    seen.add(member)
+                    rewritten.append(member)
+            members[:] = rewritten
+        if extra and any(str(m) in base_names for m in members):
+            members.extend(extra)
+    return base
+
+def diff_nodes(old_proxies, new_proxies):
+    """按节点身份比较两份节点列表，返回 (新增数, 删除数)"""
+    old = {node_identity(p) for p in old_proxies if isinstance(p, dict)}
+    new = {node_identity(p) for p in new_proxies if isinstance(p, dict)}
+    return len(new - old), len(old - new)
+
+def update_subscriptions(urls, output=MERGED_CONFIG, concurrency=8):
+    """更新订阅并写出合并后的配置，返回配置文件路径，全部不可用时返回None
+
+    所有订阅都未变化时不重新合并；合并结果与现有文件相同时不改写，
+    配置生成缓存因此命中，后续生成和热加载都会被跳过。
+    """
+    print_status(f"正在更新 {len(urls)} 个订阅...", "PROCESSING")
+    statuses = fetch_subscriptions(urls, concurrency)
+    updated = [url for url, status in statuses.items() if status == 'updated']
+    failed = [url for url, status in statuses.items() if status == 'failed']
+    print_status(f"订阅: 更新 {len(updated)}, 未变化 {len(statuses) - len(updated) - len(failed)}, "
+                 f"失败 {len(failed)}", "SUCCESS" if not failed else "WARNING")
+
+    index = load_index()
+    if not updated and index.get('merged_urls') == list(urls) and os.path.exists(output):
+        print_status("订阅内容未变化，沿用现有合并结果", "SUCCESS")
+        return output
+
+    merged = merge_subscriptions(urls)
+    if merged is None:
+        print_status("没有可用的订阅内容", "ERROR")
+        return None
+
+    previous = load_subscription(output)
+    added, removed = diff_nodes(previous['proxies'] if previous else [], merged['proxies'])
+    text = dump_yaml(merged)
+    if file_digest(output) == hashlib.sha256(text.encode()).hexdigest():
+        print_status("合并结果未变化", "SUCCESS")
+    else:
+        with open(output + ".part", 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(output + ".part", output)
+        print_status(f"合并完成: {len(merged['proxies'])} 个节点 (新增 {added}, 删除 {removed})", "SUCCESS")
+    index['merged_urls'] = list(urls)
+    save_index(index)
+    return output
+
+def main():
+    """命令行入口：只更新订阅，不生成配置"""
+    parser = argparse.ArgumentParser(description="Clash 订阅更新")
+    parser.add_argument("urls", nargs="+", help="订阅地址")
+    parser.add_argument("--concurrency", type=int, default=8, help="最大并发下载数")
+    args = parser.parse_args()
+    if not update_subscriptions(args.urls, concurrency=max(1, args.concurrency)):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
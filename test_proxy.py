@@ -3,18 +3,39 @@
 
 """
 Clash Docker 代理连通性测试工具
+支持并发探测、连接复用和多次重复的延迟统计
 """
 
 import os
 import sys
-import subprocess
 import time
+import json
+import socket
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
+from readiness import wait_until_ready
+from latency_stats import percentile
+from clash_api import ClashAPI, load_instances
+from docker_api import container_running
+from scale_out import LB_CONTAINER
 
 # 禁用SSL警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+PROXY_HOST = "127.0.0.1"
+PROXY_PORT = 7890
+
+# 默认测试网站列表
+DEFAULT_TARGETS = [
+    {"name": "Google", "url": "https://www.google.com"},
+    {"name": "YouTube", "url": "https://www.youtube.com"},
+    {"name": "GitHub", "url": "https://github.com"}
+]
+
 def print_status(message, status="INFO"):
     """打印状态信息"""
     emoji_map = {
@@ -27,58 +48,171 @@ def print_status(message, status="INFO"):
     emoji = emoji_map.get(status, "ℹ️")
     print(f"{emoji} {message}")
 
-def run_command(command):
-    """运行命令"""
+def parse_targets(values):
+    """解析目标列表，支持 名称=URL 或直接URL"""
+    targets = []
+    for value in values:
+        for item in value.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            if '=' in item and not item.startswith('http'):
+                name, url = item.split('=', 1)
+            else:
+                name, url = urlsplit(item).hostname or item, item
+            targets.append({"name": name.strip(), "url": url.strip()})
+    return targets
+
+def create_session(pool_size):
+    """创建共享的连接池会话，所有探测复用同一组keep-alive连接"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    # 使用HTTP代理，Clash的7890端口支持HTTP代理
+    session.proxies = {
+        'http': f'http://{PROXY_HOST}:{PROXY_PORT}',
+        'https': f'http://{PROXY_HOST}:{PROXY_PORT}'
+    }
+    # 禁用SSL验证，避免SSL握手问题
+    session.verify = False
+    return session
+
+def measure_connect(url, timeout):
+    """测量经代理建立隧道的耗时（秒）
+
+    使用独立的连接，结果只作为参考指标，不影响探测是否成功。
+    """
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    start = time.perf_counter()
+    with socket.create_connection((PROXY_HOST, PROXY_PORT), timeout=timeout) as sock:
+        if parts.scheme != 'https':
+            return time.perf_counter() - start
+        request = f"CONNECT {parts.hostname}:{port} HTTP/1.1\r\nHost: {parts.hostname}:{port}\r\n\r\n"
+        sock.sendall(request.encode())
+        status_line = sock.makefile('rb').readline().decode('latin-1')
+        if ' 200' not in status_line:
+            raise ConnectionError(f"代理隧道建立失败: {status_line.strip()}")
+    return time.perf_counter() - start
+
+def probe_once(session, target, timeout, connect=False):
+    """探测一次目标，返回 ttfb/total 耗时；connect 为True时另外测量建立隧道的耗时"""
+    result = {"name": target['name'], "ok": False}
+    if connect:
+        try:
+            result['connect'] = measure_connect(target['url'], timeout)
+        except Exception as e:
+            result['connect_error'] = str(e)
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True, check=True)
-        return True, result.stdout
-    except subprocess.CalledProcessError as e:
-        return False, e.stderr
+        start = time.perf_counter()
+        response = session.get(target['url'], timeout=timeout, stream=True)
+        result['ttfb'] = time.perf_counter() - start
+        for _ in response.iter_content(chunk_size=65536):
+            pass
+        result['total'] = time.perf_counter() - start
+        result['status_code'] = response.status_code
+        result['ok'] = response.status_code == 200
+        response.close()
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+def probe_direct(timeout):
+    """测试直连（应该失败）"""
+    try:
+        requests.get('https://www.google.com', timeout=timeout, proxies={'http': None, 'https': None})
+        return True
+    except Exception:
+        return False
+
+def summarize(target, samples):
+    """汇总单个目标的多次探测结果"""
+    ok_samples = [s for s in samples if s['ok']]
+    summary = {
+        "name": target['name'],
+        "url": target['url'],
+        "runs": len(samples),
+        "success": len(ok_samples),
+        "errors": sorted({s['error'] for s in samples if 'error' in s}),
+        "connect_errors": sorted({s['connect_error'] for s in samples if 'connect_error' in s}),
+        "status_codes": sorted({s['status_code'] for s in samples if 'status_code' in s})
+    }
+    for metric in ("connect", "ttfb", "total"):
+        # connect 是独立测量的，隧道建立成功即计入
+        values = [s[metric] * 1000 for s in (samples if metric == "connect" else ok_samples) if metric in s]
+        summary[metric] = {f"p{p}": percentile(values, p) for p in (50, 95, 99)}
+    return summary
+
+def format_ms(value):
+    """格式化毫秒值"""
+    return "-" if value is None else f"{value:.0f}"
 
-def test_proxy(wait_time=5):
+def print_report(summaries):
+    """打印延迟统计表"""
+    print(f"{'目标':<12} {'成功':>7}  {'connect p50/p95/p99':>22}  {'ttfb p50/p95/p99':>22}  {'total p50/p95/p99':>22}")
+    for s in summaries:
+        cells = []
+        for metric in ("connect", "ttfb", "total"):
+            m = s[metric]
+            cells.append("/".join(format_ms(m[k]) for k in ("p50", "p95", "p99")))
+        print(f"{s['name']:<12} {s['success']:>3}/{s['runs']:<3}  {cells[0]:>22}  {cells[1]:>22}  {cells[2]:>22}")
+
+def test_proxy(wait_time=0, targets=None, repeat=1, concurrency=8, timeout=10, json_path=None, connect=False):
     """测试代理连通性"""
     print_status("开始连通性测试...", "PROCESSING")
-    time.sleep(wait_time)  # 等待服务完全启动
+    if wait_time:
+        # 等待服务完全启动：就绪即开始，最多等待 wait_time 秒
+        with ClashAPI(retries=0) as api:
+            ready = wait_until_ready(api, timeout=wait_time, proxy_host=PROXY_HOST, proxy_port=PROXY_PORT)
+        if ready is None:
+            print_status(f"等待 {wait_time}s 后服务仍未就绪", "WARNING")
+    
+    targets = targets or DEFAULT_TARGETS
+    total_count = len(targets)
+    session = create_session(concurrency)
+    
+    print_status(f"通过代理并发测试网站连通性 ({total_count}个目标 x {repeat}次, 并发{concurrency}):", "INFO")
     
-    # 测试网站列表
-    test_sites = [
-        {"name": "Google", "url": "https://www.google.com"},
-        {"name": "YouTube", "url": "https://www.youtube.com"},
-        {"name": "GitHub", "url": "https://github.com"}
-    ]
+    with ThreadPoolExecutor(max_workers=concurrency + 1) as executor:
+        # 直连测试与代理探测同时进行
+        direct_future = executor.submit(probe_direct, min(timeout, 5))
+        # 按目标顺序保存结果，名称相同的目标不会互相覆盖
+        futures = [
+            [executor.submit(probe_once, session, target, timeout, connect) for _ in range(repeat)]
+            for target in targets
+        ]
+        summaries = [summarize(t, [f.result() for f in target_futures])
+                     for t, target_futures in zip(targets, futures)]
+        direct_ok = direct_future.result()
+    session.close()
     
     success_count = 0
-    total_count = len(test_sites)
+    for s in summaries:
+        if s['success'] == s['runs']:
+            print_status(f"✅ {s['name']}: 连接成功 ({s['success']}/{s['runs']})", "SUCCESS")
+        elif s['success'] > 0:
+            print_status(f"⚠️ {s['name']}: 部分成功 ({s['success']}/{s['runs']})", "WARNING")
+        else:
+            reason = s['errors'][0] if s['errors'] else f"HTTP {s['status_codes']}"
+            print_status(f"❌ {s['name']}: 连接失败 - {reason}", "ERROR")
+        if s['connect_errors']:
+            print_status(f"{s['name']}: connect 测量失败 - {s['connect_errors'][0]}", "WARNING")
+        if s['success'] > 0:
+            success_count += 1
     
-    print_status("通过代理测试网站连通性:", "INFO")
+    print("\n📊 延迟统计 (ms):")
+    print_report(summaries)
+    print()
     
-    for site in test_sites:
-        try:
-            # 使用session来避免影响全局设置
-            session = requests.Session()
-            # 使用HTTP代理，Clash的7890端口支持HTTP代理
-            session.proxies = {
-                'http': 'http://127.0.0.1:7890', 
-                'https': 'http://127.0.0.1:7890'
-            }
-            # 禁用SSL验证，避免SSL握手问题
-            session.verify = False
-            
-            response = session.get(site['url'], timeout=10)
-            if response.status_code == 200:
-                print_status(f"✅ {site['name']}: 连接成功 (HTTP {response.status_code})", "SUCCESS")
-                success_count += 1
-            else:
-                print_status(f"⚠️ {site['name']}: 连接异常 (HTTP {response.status_code})", "WARNING")
-        except Exception as e:
-            print_status(f"❌ {site['name']}: 连接失败 - {str(e)}", "ERROR")
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({"targets": summaries, "direct_reachable": direct_ok}, f, ensure_ascii=False, indent=2)
+        print_status(f"探测结果已保存到: {json_path}", "SUCCESS")
     
-    # 测试直连（应该失败）
-    print_status("测试直连（应该失败）:", "INFO")
-    try:
-        response = requests.get('https://www.google.com', timeout=5)
+    if direct_ok:
         print_status("⚠️ 直连Google成功，可能代理未生效", "WARNING")
-    except Exception as e:
+    else:
         print_status("✅ 直连Google失败（正常，证明代理生效）", "SUCCESS")
     
     # 总结
@@ -92,23 +226,47 @@ def test_proxy(wait_time=5):
         print_status("❌ 连通性测试失败！所有网站均无法访问", "ERROR")
         return False
 
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="Clash Docker 代理连通性测试")
+    parser.add_argument("--target", action="append", default=[],
+                        help="测试目标，格式 名称=URL 或 URL，可重复或用逗号分隔")
+    parser.add_argument("--repeat", type=int, default=1, help="每个目标的探测次数")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发数")
+    parser.add_argument("--timeout", type=float, default=10, help="单次请求超时（秒）")
+    parser.add_argument("--wait", type=float, default=0, help="开始前最多等待服务就绪的时间（秒）")
+    parser.add_argument("--json", dest="json_path", help="将结果写入JSON文件")
+    parser.add_argument("--connect", action="store_true",
+                        help="另外用独立连接测量经代理建立隧道的耗时（不影响探测结果）")
+    return parser.parse_args()
+
 def main():
     """主函数"""
+    args = parse_args()
     print("🔍 Clash Docker 代理连通性测试")
     print("=" * 40)
     
-    # 检查clash容器是否运行
+    # 检查clash容器是否运行（多实例部署时代理端口由负载均衡器提供）
     print_status("检查容器状态...", "PROCESSING")
-    success, output = run_command("docker ps --filter name=clash --format '{{.Status}}'")
-    if not success or "Up" not in output:
+    instances = load_instances()
+    if not container_running(instances[0]['name'] if len(instances) == 1 else LB_CONTAINER):
         print_status("❌ Clash容器未启动", "ERROR")
         print_status("请先运行: python3 start_clash_docker.py", "INFO")
         sys.exit(1)
     
     print_status("✅ Clash容器运行正常", "SUCCESS")
     
-    # 执行连通性测试
-    test_proxy()
+    # 执行连通性测试，退出码可作为部署脚本的健康检查
+    ok = test_proxy(
+        wait_time=args.wait,
+        targets=parse_targets(args.target),
+        repeat=max(1, args.repeat),
+        concurrency=max(1, args.concurrency),
+        timeout=args.timeout,
+        json_path=args.json_path,
+        connect=args.connect
+    )
+    sys.exit(0 if ok else 1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main() 
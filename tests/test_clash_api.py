@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+"""clash_api 测试：共享客户端按控制器复用"""
+
+import unittest
+from unittest import mock
+
+import clash_api
+
+
+class GetClientTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(clash_api, "_clients", {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_client_is_shared_per_controller(self):
+        with mock.patch.object(clash_api, "load_secret", return_value="s") as load_secret:
+            default = clash_api.get_client()
+            self.assertIs(clash_api.get_client(clash_api.CLASH_API), default)
+            other = clash_api.get_client("http://127.0.0.1:9091")
+            self.assertIsNot(other, default)
+            self.assertIs(clash_api.get_client("http://127.0.0.1:9091"), other)
+        self.assertEqual(load_secret.call_count, 2)
+        self.assertEqual(default.session.headers["Authorization"], "Bearer s")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""conn_tracker 测试：用替身API代替Clash控制器"""
+
+import contextlib
+import io
+import unittest
+from unittest import mock
+
+import requests
+
+import conn_tracker
+
+
+def snapshot(*conns):
+    return {'connections': [{'id': conn_id, 'metadata': {'host': host}, 'chains': ['node'],
+                             'upload': up, 'download': down} for conn_id, host, up, down in conns]}
+
+
+class FakeAPI:
+    """按顺序返回快照，元素为异常时抛出"""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def connections(self):
+        reply = self.replies.pop(0) if self.replies else snapshot()
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+class TrackConnectionsTest(unittest.TestCase):
+
+    def test_request_errors_keep_accumulated_state(self):
+        api = FakeAPI([snapshot((1, 'a.example', 100, 200)),
+                       requests.exceptions.ConnectionError("controller restarting"),
+                       requests.exceptions.ReadTimeout("slow"),
+                       snapshot((2, 'b.example', 10, 20))])
+        output = io.StringIO()
+        with mock.patch.object(conn_tracker, "ClashAPI", return_value=api), \
+                mock.patch.object(conn_tracker.time, "sleep"), contextlib.redirect_stdout(output):
+            tracker = conn_tracker.track_connections(interval=0, duration=0.2)
+        hosts = {name: (up, down) for name, up, down, _ in tracker.top('host')}
+        self.assertEqual(hosts['a.example'], (100, 200))
+        self.assertEqual(hosts['b.example'], (10, 20))
+        self.assertEqual(output.getvalue().count("⚠️"), 1)
+        self.assertIn("已重新连接控制器", output.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""dns_bench 测试：用本机UDP替身解析器代替公共DNS"""
+
+import os
+import socket
+import struct
+import tempfile
+import threading
+import unittest
+
+import dns_bench
+from latency_stats import percentile
+
+
+class StubResolver:
+    """本机UDP解析器替身，rcode 为0时返回一条A记录，否则返回对应的错误码"""
+
+    def __init__(self, rcode=0):
+        self.rcode = rcode
+        self.queries = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.address = "127.0.0.1:%d" % self.sock.getsockname()[1]
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                data, peer = self.sock.recvfrom(512)
+            except OSError:
+                return
+            self.queries += 1
+            query_id = struct.unpack(">H", data[:2])[0]
+            question = data[12:]
+            answers = 0 if self.rcode else 1
+            response = struct.pack(">HHHHHH", query_id, 0x8180 | self.rcode, 1, answers, 0, 0) + question
+            if answers:
+                # 压缩指针指向问题中的域名，TTL 60，A记录 192.0.2.1
+                response += struct.pack(">HHHIH", 0xC00C, 1, 1, 60, 4) + socket.inet_aton("192.0.2.1")
+            self.sock.sendto(response, peer)
+
+    def close(self):
+        self.sock.close()
+
+
+class DnsBenchTest(unittest.TestCase):
+
+    def stub(self, rcode=0):
+        resolver = StubResolver(rcode)
+        self.addCleanup(resolver.close)
+        return resolver
+
+    def test_query_udp_against_stub(self):
+        resolver = self.stub()
+        latency = dns_bench.query_udp(resolver.address, "www.example.com", timeout=1.0)
+        self.assertIsNotNone(latency)
+        self.assertGreaterEqual(latency, 0)
+        self.assertEqual(resolver.queries, 1)
+
+    def test_error_rcode_counts_as_failure(self):
+        resolver = self.stub(rcode=2)
+        self.assertIsNone(dns_bench.query_udp(resolver.address, "www.example.com", timeout=1.0))
+
+    def test_benchmark_selects_healthy_resolver(self):
+        good, bad = self.stub(), self.stub(rcode=2)
+        results = dns_bench.benchmark_resolvers(udp=[bad.address, good.address], doh=[],
+                                                domains=["a.example", "b.example"], rounds=2,
+                                                concurrency=4, timeout=1.0)
+        by_resolver = {r['resolver']: r for r in results}
+        self.assertEqual(by_resolver[good.address]['failures'], 0)
+        self.assertEqual(by_resolver[bad.address]['failure_rate'], 1.0)
+        self.assertEqual(dns_bench.select_resolvers(results, 'udp'), [good.address])
+
+    def test_fastest_config_uses_cached_results(self):
+        good, other = self.stub(), self.stub()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.json")
+            options = dict(udp=[good.address], doh=[], domains=["a.example"], rounds=1, timeout=1.0)
+            first = dns_bench.fastest_dns_config(path=path, **options)
+            queries = good.queries
+            second = dns_bench.fastest_dns_config(path=path, **options)
+            self.assertEqual(good.queries, queries)
+            # 候选解析器变化后不能沿用旧候选集的结果
+            changed = dns_bench.fastest_dns_config(path=path, **dict(options, udp=[other.address]))
+            self.assertEqual(other.queries, 1)
+            # 测试域名变化同样重新测速
+            dns_bench.fastest_dns_config(path=path, **dict(options, udp=[other.address], domains=["b.example"]))
+            self.assertEqual(other.queries, 2)
+        self.assertEqual(first['default-nameserver'], [good.address])
+        self.assertEqual(second, first)
+        self.assertEqual(changed['default-nameserver'], [other.address])
+
+    def test_percentile_nearest_rank(self):
+        self.assertIsNone(percentile([], 50))
+        self.assertEqual(percentile([4, 1, 3, 2], 50), 2)
+        self.assertEqual(percentile(list(range(1, 101)), 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""docker_api 客户端测试：用unix socket上的替身服务端代替Docker守护进程"""
+
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import docker_api
+
+
+class FakeDaemon:
+    """按顺序执行脚本动作的替身Docker守护进程，每个动作处理一个请求"""
+
+    def __init__(self, actions):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "docker.sock")
+        self.actions = list(actions)
+        self.requests = []
+        self.connections = 0
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        self.server.listen(4)
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while self.actions:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections += 1
+            with conn:
+                while self.actions:
+                    head = b""
+                    while b"\r\n\r\n" not in head:
+                        chunk = conn.recv(4096)
+                        if not chunk:
+                            break
+                        head += chunk
+                    if not head:
+                        break
+                    self.requests.append(head.split(b"\r\n", 1)[0].decode())
+                    action = self.actions.pop(0)
+                    if action == "close":
+                        break
+                    conn.sendall(action)
+
+    def close(self):
+        self.server.close()
+        self.dir.cleanup()
+
+
+def reply(status, body):
+    return (f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+
+
+class DockerClientTest(unittest.TestCase):
+
+    def start(self, actions):
+        daemon = FakeDaemon(actions)
+        self.addCleanup(daemon.close)
+        client = docker_api.DockerClient(daemon.path, timeout=2)
+        self.addCleanup(client.close)
+        return daemon, client
+
+    def test_requests_reuse_one_connection(self):
+        daemon, client = self.start([reply("200 OK", b"OK"), reply("200 OK", b'{"State": {"Status": "running"}}')])
+        self.assertTrue(client.ping())
+        self.assertEqual(client.inspect("clash")["State"]["Status"], "running")
+        self.assertEqual(daemon.connections, 1)
+        self.assertEqual(daemon.requests[1], f"GET /{docker_api.API_VERSION}/containers/clash/json HTTP/1.1")
+
+    def test_reconnects_after_idle_close(self):
+        daemon, client = self.start([reply("200 OK", b"OK"), "close", reply("200 OK", b"OK")])
+        self.assertTrue(client.ping())
+        self.assertTrue(client.ping())
+        self.assertEqual(daemon.connections, 2)
+
+    def test_error_status_raises_docker_error(self):
+        _, client = self.start([reply("404 Not Found", b'{"message": "No such container: x"}')])
+        with self.assertRaises(docker_api.DockerError) as ctx:
+            client.inspect("x")
+        self.assertEqual(ctx.exception.status, 404)
+        self.assertEqual(ctx.exception.message, "No such container: x")
+
+    def test_malformed_response_drops_connection(self):
+        daemon, client = self.start([b"garbage\r\n\r\n", reply("200 OK", b"OK")])
+        with self.assertRaises(OSError):
+            client.ping()
+        # 异常后连接被丢弃，下一次请求重新连接
+        self.assertTrue(client.ping())
+        self.assertEqual(daemon.connections, 2)
+
+    def test_status_falls_back_to_cli_on_protocol_error(self):
+        _, client = self.start([b"garbage\r\n\r\n"])
+        with mock.patch.object(docker_api, "get_client", return_value=client), \
+                mock.patch.object(docker_api, "_run", return_value=(True, "running healthy\n")) as run:
+            status = docker_api.container_status("clash")
+        self.assertEqual(status, {"name": "clash", "state": "running", "health": "healthy"})
+        run.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""Country.mmdb 下载测试：用本机HTTP替身镜像代替公共镜像"""
+
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import start_clash_docker as scd
+
+MMDB = b"\x00" * 64 + scd.MMDB_METADATA_MARKER + b"database_type node_count record_size"
+
+
+class Mirror:
+    """只返回完整内容的镜像，不带ETag/Last-Modified"""
+
+    def __init__(self, body):
+        self.body = body
+        self.hits = 0
+        mirror = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                mirror.hits += 1
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(mirror.body)))
+                self.end_headers()
+                self.wfile.write(mirror.body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:%d/Country.mmdb" % self.httpd.server_address[1]
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class DownloadMmdbTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mirror = Mirror(MMDB)
+        self.addCleanup(self.mirror.close)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "Country.mmdb")
+
+    def download(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return scd.download_country_mmdb(self.path, [self.mirror.url])
+
+    def test_unchanged_content_keeps_existing_file(self):
+        self.assertTrue(self.download())
+        inode = os.stat(self.path).st_ino
+        self.assertTrue(self.download())
+        self.assertEqual(os.stat(self.path).st_ino, inode)
+        self.assertFalse(os.path.exists(self.path + ".part"))
+        self.assertEqual(self.mirror.hits, 2)
+
+    def test_changed_content_replaces_file(self):
+        self.assertTrue(self.download())
+        self.mirror.body = b"\x01" + MMDB
+        self.assertTrue(self.download())
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), self.mirror.body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""preflight 测试：用本机监听端口和已关闭的端口代替真实节点"""
+
+import json
+import os
+import socket
+import ssl
+import tempfile
+import threading
+import time
+import unittest
+
+import preflight
+from load_test import generate_certificate
+from proxy_normalizer import normalize_proxies, BUILTIN_OUTBOUNDS
+
+
+def closed_port():
+    """返回一个当前没有监听的本机端口"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Listener:
+    """本机TCP监听端口；tls_files 给出时完成TLS握手，silent 为True时只排队不接受连接"""
+
+    def __init__(self, tls_files=None, silent=False):
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+        self.context = None
+        if tls_files:
+            self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self.context.load_cert_chain(*tls_files)
+        if not silent:
+            threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            try:
+                if self.context:
+                    conn = self.context.wrap_socket(conn, server_side=True)
+            except (OSError, ssl.SSLError):
+                pass
+            finally:
+                conn.close()
+
+    def close(self):
+        # 先shutdown唤醒阻塞在accept中的线程，否则监听会持续到下一个连接到达
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+def node(name, port, **fields):
+    return dict({'name': name, 'type': 'ss', 'server': '127.0.0.1', 'port': port}, **fields)
+
+
+class PreflightTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.cache = os.path.join(self.dir, "probe.json")
+
+    def listener(self, **kwargs):
+        listener = Listener(**kwargs)
+        self.addCleanup(listener.close)
+        return listener
+
+    def test_tcp_probe_open_and_closed_port(self):
+        open_port = self.listener().port
+        results, stats = preflight.probe_proxies([node("up", open_port), node("down", closed_port())],
+                                                 deadline=3, cache_path=self.cache)
+        self.assertEqual(results, {"up": True, "down": False})
+        self.assertEqual((stats['reachable'], stats['unreachable'], stats['timed_out']), (1, 1, 0))
+
+    def test_tls_probe_requires_handshake(self):
+        tls_files = generate_certificate(self.dir)
+        if not tls_files:
+            self.skipTest("openssl不可用")
+        tls_port = self.listener(tls_files=tls_files).port
+        plain_port = self.listener().port
+        proxies = [node("tls", tls_port, type='trojan', password='x'),
+                   node("plain", plain_port, tls=True, sni='example.com')]
+        results, _ = preflight.probe_proxies(proxies, deadline=3, cache_path=self.cache)
+        self.assertEqual(results, {"tls": True, "plain": False})
+
+    def test_global_deadline_bounds_the_stage(self):
+        silent = self.listener(silent=True)
+        # 不同的SNI是不同的探测目标；监听端只排队不握手，每个探测都会等到超时
+        proxies = [node(f"n{i}", silent.port, tls=True, sni=f"{i}.example") for i in range(4)]
+        started = time.monotonic()
+        results, stats = preflight.probe_proxies(proxies, deadline=0.5, concurrency=1, timeout=5,
+                                                 cache_path=self.cache)
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertGreaterEqual(stats['timed_out'], 3)
+        self.assertTrue(all(results[f"n{i}"] is not True for i in range(4)))
+
+    def test_cache_is_used_within_ttl(self):
+        listener = self.listener()
+        proxies = [node("up", listener.port)]
+        preflight.probe_proxies(proxies, deadline=3, cache_path=self.cache)
+        listener.close()
+        results, stats = preflight.probe_proxies(proxies, deadline=3, cache_path=self.cache)
+        self.assertEqual(results, {"up": True})
+        self.assertEqual((stats['cached'], stats['probed']), (1, 0))
+
+        # 缓存过期后重新探测
+        with open(self.cache, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        for entry in cache.values():
+            entry['time'] -= preflight.PROBE_TTL + 1
+        with open(self.cache, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        results, stats = preflight.probe_proxies(proxies, deadline=3, cache_path=self.cache)
+        self.assertEqual(results, {"up": False})
+        self.assertEqual(stats['probed'], 1)
+
+    def test_udp_protocols_are_not_probed(self):
+        results, stats = preflight.probe_proxies([node("hy", closed_port(), type='hysteria2')],
+                                                 cache_path=self.cache)
+        self.assertEqual(results, {"hy": None})
+        self.assertEqual(stats['targets'], 0)
+
+
+class PruneTest(unittest.TestCase):
+
+    def config(self):
+        return {
+            'proxies': [node("a", 1), node("b", 2), node("c", 3)],
+            'proxy-groups': [
+                {'name': 'Proxy', 'type': 'select', 'proxies': ['b', 'a', 'Only-C', 'DIRECT']},
+                {'name': 'Only-C', 'type': 'url-test', 'proxies': ['c']},
+            ],
+        }
+
+    def test_demote_moves_dead_nodes_last(self):
+        config = self.config()
+        affected = preflight.prune_unreachable(config, {"a": True, "b": False, "c": True}, 'demote')
+        self.assertEqual(affected, 1)
+        self.assertEqual([p['name'] for p in config['proxies']], ["a", "c", "b"])
+        self.assertEqual(config['proxy-groups'][0]['proxies'], ['a', 'Only-C', 'DIRECT', 'b'])
+
+    def test_drop_keeps_config_valid_when_groups_are_emptied(self):
+        config = self.config()
+        affected = preflight.prune_unreachable(config, {"a": True, "b": False, "c": False}, 'drop')
+        self.assertEqual(affected, 2)
+        stats = normalize_proxies(config)
+        self.assertEqual(stats['emptied'], 1)
+        names = {p['name'] for p in config['proxies']}
+        groups = {g['name']: g['proxies'] for g in config['proxy-groups']}
+        self.assertEqual(groups['Only-C'], ['REJECT'])
+        for members in groups.values():
+            self.assertTrue(members)
+            for member in members:
+                self.assertTrue(member in names or member in groups or member in BUILTIN_OUTBOUNDS, member)
+
+
+if __name__ == "__main__":
+    unittest.main()
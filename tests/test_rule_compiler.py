@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+"""rule_compiler 测试：编译与重排不能改变任何连接命中的目标"""
+
+import unittest
+
+import rule_compiler
+
+
+class CompileRulesTest(unittest.TestCase):
+
+    def test_dotted_keyword_does_not_shadow_suffix(self):
+        rules = ["DOMAIN-KEYWORD,.cn,DIRECT", "DOMAIN-SUFFIX,cnn.com,Proxy", "MATCH,Proxy"]
+        compiled, stats = rule_compiler.compile_rules(rules)
+        self.assertIn("DOMAIN-SUFFIX,cnn.com,Proxy", compiled)
+        self.assertEqual(stats['shadowed'], 0)
+
+    def test_keyword_payload_keeps_dots(self):
+        compiled, _ = rule_compiler.compile_rules(["DOMAIN-KEYWORD,.CN.,DIRECT"])
+        self.assertEqual(compiled, ["DOMAIN-KEYWORD,.cn.,DIRECT"])
+
+    def test_leading_dot_of_suffix_is_dropped(self):
+        rules = ["DOMAIN-SUFFIX,.Example.com,Proxy", "DOMAIN,www.example.com,DIRECT"]
+        compiled, stats = rule_compiler.compile_rules(rules)
+        self.assertEqual(compiled, ["DOMAIN-SUFFIX,example.com,Proxy"])
+        self.assertEqual(stats['shadowed'], 1)
+
+
+class ReorderRulesTest(unittest.TestCase):
+
+    def test_domain_rule_stays_behind_no_resolve_rule_after_resolution(self):
+        rules = ["GEOIP,CN,DIRECT", "IP-CIDR,10.0.0.0/8,Office,no-resolve",
+                 "DOMAIN-SUFFIX,example.com,Proxy", "MATCH,Proxy"]
+        hits = {('DOMAIN-SUFFIX', 'example.com'): 50}
+        ordered, moved = rule_compiler.reorder_rules(rules, hits)
+        self.assertEqual(moved, 0)
+        self.assertEqual(ordered, rules)
+
+    def test_domain_rule_crosses_no_resolve_rule_before_resolution(self):
+        rules = ["IP-CIDR,10.0.0.0/8,Office,no-resolve", "DOMAIN-SUFFIX,example.com,Proxy",
+                 "GEOIP,CN,DIRECT", "MATCH,Proxy"]
+        hits = {('DOMAIN-SUFFIX', 'example.com'): 50}
+        ordered, moved = rule_compiler.reorder_rules(rules, hits)
+        self.assertEqual(ordered[0], "DOMAIN-SUFFIX,example.com,Proxy")
+        self.assertEqual(moved, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+"""rule_providers 测试：用本机HTTP替身服务端代替规则集地址"""
+
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import rule_providers
+
+
+class ProviderServer:
+    """按路径返回规则集内容的替身服务端，带ETag，记录每个请求"""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(self.path)
+                body = server.routes[self.path]
+                etag = '"%d"' % hash(body)
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        return "http://127.0.0.1:%d%s" % (self.httpd.server_address[1], path)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FetchProvidersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ProviderServer({'/ads': b"payload:\n  - '+.ads.example'\n",
+                                      '/cn': b"payload:\n  - '10.0.0.0/8'\n"})
+        self.addCleanup(self.server.close)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        for name, value in (('PROVIDER_DIR', self.dir),
+                            ('PROVIDER_INDEX', os.path.join(self.dir, "index.json"))):
+            patcher = mock.patch.object(rule_providers, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.providers = {
+            'ads': {'type': 'http', 'behavior': 'domain', 'url': self.server.url('/ads')},
+            'cn': {'type': 'http', 'behavior': 'ipcidr', 'url': self.server.url('/cn')},
+        }
+
+    def test_refresh_then_fetch_makes_one_request_per_provider(self):
+        rule_providers.fetch_providers(self.providers)
+        self.server.requests.clear()
+        fresh = rule_providers.refresh_providers()
+        loaded = rule_providers.fetch_providers(self.providers, fresh=fresh)
+        self.assertEqual(sorted(self.server.requests), ['/ads', '/cn'])
+        self.assertEqual(loaded['ads'], [['DOMAIN-SUFFIX', 'ads.example', []]])
+        self.assertEqual(loaded['cn'], [['IP-CIDR', '10.0.0.0/8', []]])
+
+    def test_changed_definition_is_fetched_again(self):
+        rule_providers.fetch_providers(self.providers)
+        fresh = rule_providers.refresh_providers()
+        self.server.requests.clear()
+        changed = dict(self.providers, cn=dict(self.providers['cn'], behavior='classical'))
+        rule_providers.fetch_providers(changed, fresh=fresh)
+        self.assertEqual(self.server.requests, ['/cn'])
+
+    def test_removed_providers_are_pruned(self):
+        rule_providers.fetch_providers(self.providers)
+        rule_providers.fetch_providers({'ads': self.providers['ads']})
+        self.assertEqual(list(rule_providers.load_index()['providers']), ['ads'])
+        cached = [f for f in os.listdir(self.dir) if f != 'index.json']
+        self.assertEqual(len(cached), 1)
+        self.assertEqual(set(rule_providers.refresh_providers()), {'ads'})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+"""subscription 测试：用本机HTTP替身服务端代替订阅地址"""
+
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import subscription
+from yaml_io import dump_yaml
+
+
+def clash_config(proxies, groups=None):
+    return dump_yaml({'proxies': proxies, 'proxy-groups': groups or [], 'rules': ['MATCH,DIRECT']}).encode()
+
+
+def node(name, server, port=443):
+    return {'name': name, 'type': 'ss', 'server': server, 'port': port, 'cipher': 'aes-128-gcm', 'password': 'x'}
+
+
+class SubscriptionServer:
+    """按路径返回订阅内容的替身服务端，支持 ETag/Last-Modified 条件请求"""
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append((self.path, dict(self.headers)))
+                body, etag, last_modified = server.routes[self.path]
+                if (etag and self.headers.get('If-None-Match') == etag) or \
+                        (last_modified and self.headers.get('If-Modified-Since') == last_modified):
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                if etag:
+                    self.send_header('ETag', etag)
+                if last_modified:
+                    self.send_header('Last-Modified', last_modified)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, path, body, etag=None, last_modified=None):
+        self.routes[path] = (body, etag, last_modified)
+        return "http://127.0.0.1:%d%s" % (self.httpd.server_address[1], path)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class SubscriptionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SubscriptionServer()
+        self.addCleanup(self.server.close)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        for name, value in (('SUBSCRIPTION_DIR', self.dir),
+                            ('SUBSCRIPTION_INDEX', os.path.join(self.dir, "index.json"))):
+            patcher = mock.patch.object(subscription, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fetch(self, url):
+        return subscription.fetch_subscriptions([url])[url]
+
+    def test_etag_round_trip_and_304(self):
+        url = self.server.url("/a", clash_config([node("A", "a.example")]), etag='"v1"')
+        self.assertEqual(self.fetch(url), 'updated')
+        self.assertEqual(self.fetch(url), 'unchanged')
+        self.assertEqual(self.server.requests[1][1].get('If-None-Match'), '"v1"')
+        self.assertEqual(subscription.load_index()['validators'][url]['etag'], '"v1"')
+
+    def test_last_modified_round_trip(self):
+        stamp = "Wed, 01 Jan 2025 00:00:00 GMT"
+        url = self.server.url("/lm", clash_config([node("A", "a.example")]), last_modified=stamp)
+        self.assertEqual(self.fetch(url), 'updated')
+        self.assertEqual(self.fetch(url), 'unchanged')
+        self.assertEqual(self.server.requests[1][1].get('If-Modified-Since'), stamp)
+
+    def test_digest_fallback_without_validators(self):
+        url = self.server.url("/plain", clash_config([node("A", "a.example")]))
+        self.assertEqual(self.fetch(url), 'updated')
+        path = subscription.cache_path(url)
+        mtime = os.stat(path).st_mtime_ns
+        self.assertEqual(self.fetch(url), 'unchanged')
+        self.assertEqual(os.stat(path).st_mtime_ns, mtime)
+        self.server.url("/plain", clash_config([node("B", "b.example")]))
+        self.assertEqual(self.fetch(url), 'updated')
+
+    def test_invalid_content_keeps_cache(self):
+        url = self.server.url("/bad", b"not: [a clash config")
+        self.assertEqual(self.fetch(url), 'failed')
+        self.assertFalse(os.path.exists(subscription.cache_path(url)))
+
+    def test_merge_dedups_nodes_and_rewrites_groups(self):
+        first = self.server.url("/1", clash_config(
+            [node("HK", "hk.example"), node("HK copy", "HK.example"), node("JP", "jp.example")],
+            [{'name': 'Proxy', 'type': 'select', 'proxies': ['HK copy', 'HK', 'JP']}]))
+        second = self.server.url("/2", clash_config([node("HK", "hk.example"), node("JP", "sg.example")]))
+        subscription.fetch_subscriptions([first, second])
+        merged = subscription.merge_subscriptions([first, second])
+        self.assertEqual([p['name'] for p in merged['proxies']], ['HK', 'JP', 'JP [2]'])
+        self.assertEqual(merged['proxy-groups'][0]['proxies'], ['HK', 'JP', 'JP [2]'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+"""yaml_io 测试：流式加载与完整加载的结果必须一致"""
+
+import io
+import unittest
+
+import yaml_io
+
+CONFIG = """\
+base: &base
+  type: ss
+  cipher: aes-128-gcm
+  udp: true
+tls: &tls
+  tls: true
+  udp: false
+proxies:
+  - <<: *base
+    name: a
+    server: a.example
+  - name: b
+    <<: [*tls, *base]
+    server: b.example
+  - <<: [*base, *tls]
+    name: c
+    udp: false
+proxy-groups:
+  - name: Proxy
+    type: select
+    proxies: [a, b, c]
+rules:
+  - MATCH,Proxy
+"""
+
+
+class StreamingLoadTest(unittest.TestCase):
+
+    def test_streaming_matches_full_load(self):
+        full = yaml_io.load_yaml(CONFIG)
+        streamed = yaml_io.load_yaml_streaming(io.StringIO(CONFIG), skip_keys=())
+        self.assertEqual(streamed, full)
+        self.assertEqual([list(p) for p in streamed['proxies']], [list(p) for p in full['proxies']])
+
+    def test_list_merge_prefers_earlier_mappings(self):
+        proxies = yaml_io.load_yaml_streaming(io.StringIO(CONFIG))['proxies']
+        self.assertNotIn('<<', proxies[1])
+        self.assertEqual(proxies[1]['udp'], False)
+        self.assertEqual(proxies[1]['cipher'], 'aes-128-gcm')
+        self.assertEqual(proxies[2]['udp'], False)
+        self.assertTrue(proxies[2]['tls'])
+
+    def test_skipped_keys_are_not_built(self):
+        config = yaml_io.load_yaml_streaming(io.StringIO(CONFIG))
+        self.assertNotIn('rules', config)
+        self.assertEqual(config['proxy-groups'][0]['proxies'], ['a', 'b', 'c'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,6 +10,9 @@ import sys
 import subprocess
 import shutil
 import glob
+from docker_api import remove_container, remove_image, prune
+from clash_api import load_instances
+from scale_out import LB_CONTAINER, LB_IMAGE
 
 def run(cmd):
     """运行命令"""
@@ -29,8 +32,10 @@ def main():
     
     # 确认卸载
     print_status("即将删除以下内容:", "WARNING")
-    print("  📦 Docker容器: clash, yacd")
-    print("  🖼️  Docker镜像: dreamacro/clash, haishanh/yacd")
+    # 多实例部署时还有各实例和负载均衡器
+    containers = ["clash", "yacd", LB_CONTAINER] + [i['name'] for i in load_instances() if i['name'] != "clash"]
+    print(f"  📦 Docker容器: {', '.join(containers)}")
+    print("  🖼️  Docker镜像: dreamacro/clash, haishanh/yacd, haproxy")
     print("  📁 配置文件: config/ 目录")
     print("  🌍 地理数据库: Country.mmdb")
     print("  🌐 Docker网络和存储卷")
@@ -44,18 +49,18 @@ def main():
     
     # 停止服务
     print_status("正在停止Docker服务...", "PROCESSING")
-    run("docker compose down")
+    run("docker compose down --remove-orphans")
     
     # 删除容器
     print_status("正在删除Docker容器...", "PROCESSING")
-    for container in ["clash", "yacd"]:
-        if run(f"docker rm -f {container}"):
+    for container in containers:
+        if remove_container(container):
             print_status(f"✅ 已删除容器: {container}", "SUCCESS")
     
     # 删除镜像
     print_status("正在删除Docker镜像...", "PROCESSING")
-    for image in ["dreamacro/clash:latest", "haishanh/yacd:latest"]:
-        if run(f"docker rmi {image}"):
+    for image in ["dreamacro/clash:latest", "haishanh/yacd:latest", LB_IMAGE]:
+        if remove_image(image):
             print_status(f"✅ 已删除镜像: {image}", "SUCCESS")
     
     # 删除文件
@@ -63,6 +68,8 @@ def main():
     files_to_remove = [
         "config",
         "Country.mmdb", 
+        "Country.mmdb.meta.json",
+        "Country.mmdb.part",
         "clash-linux-amd64-v1.18.0",
         "clash_secret.txt"
     ]
@@ -89,9 +96,8 @@ def main():
     
     # 清理Docker
     print_status("正在清理Docker系统...", "PROCESSING")
-    run("docker system prune -f")
-    run("docker volume prune -f")
-    run("docker network prune -f")
+    for kind in ("containers", "images", "volumes", "networks"):
+        prune(kind)
     
     print("\n🎉 卸载完成!")
     print("=" * 50)
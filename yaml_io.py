@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+YAML读写工具
+libyaml可用时自动使用C实现的加载器/输出器，并提供基于事件的流式读取
+"""
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as YamlLoader, CSafeDumper as YamlDumper
+    LIBYAML = True
+except ImportError:
+    from yaml import SafeLoader as YamlLoader, SafeDumper as YamlDumper
+    LIBYAML = False
+
+# 流式加载时不构建的顶层键（生成Docker配置时会被替换或删除）
+STREAM_SKIP_KEYS = ('rules', 'rule-providers', 'script')
+
+def load_yaml(stream):
+    """解析YAML文档"""
+    return yaml.load(stream, Loader=YamlLoader)
+
+def dump_yaml(data, stream=None):
+    """输出YAML文档，保持键顺序并允许Unicode"""
+    return yaml.dump(data, stream, Dumper=YamlDumper, default_flow_style=False,
+                     allow_unicode=True, sort_keys=False)
+
+def _construct_scalar(loader, event):
+    """按隐式类型解析标量（int/bool/null等）"""
+    tag = event.tag
+    if not tag or tag == '!':
+        tag = loader.resolve(yaml.ScalarNode, event.value, event.implicit)
+    constructor = loader.yaml_constructors.get(tag)
+    if constructor is None:
+        return event.value
+    return constructor(loader, yaml.ScalarNode(tag, event.value, style=event.style))
+
+def _build(events, event, loader, anchors):
+    """从事件流构建一个Python对象，不经过节点树"""
+    if isinstance(event, yaml.AliasEvent):
+        return anchors[event.anchor]
+    if isinstance(event, yaml.ScalarEvent):
+        value = _construct_scalar(loader, event)
+    elif isinstance(event, yaml.SequenceStartEvent):
+        value = []
+        for item in events:
+            if isinstance(item, yaml.SequenceEndEvent):
+                break
+            value.append(_build(events, item, loader, anchors))
+    elif isinstance(event, yaml.MappingStartEvent):
+        merged, explicit = {}, {}
+        for key_event in events:
+            if isinstance(key_event, yaml.MappingEndEvent):
+                break
+            key = _build(events, key_event, loader, anchors)
+            item = _build(events, next(events), loader, anchors)
+            if key == '<<' and isinstance(item, (dict, list)):
+                # 与 SafeLoader 一致：<<: [*a, *b] 中靠前的映射优先，显式键优先于合并键
+                for mapping in reversed(item if isinstance(item, list) else [item]):
+                    if not isinstance(mapping, dict):
+                        raise yaml.YAMLError(f"合并键只能引用映射: {mapping!r}")
+                    merged.update(mapping)
+            else:
+                explicit[key] = item
+        value = {**merged, **explicit}
+    else:
+        raise yaml.YAMLError(f"意外的YAML事件: {event}")
+    if getattr(event, 'anchor', None):
+        anchors[event.anchor] = value
+    return value
+
+def _skip(events, event):
+    """跳过一个值对应的全部事件"""
+    if isinstance(event, (yaml.SequenceStartEvent, yaml.MappingStartEvent)):
+        depth = 1
+        for item in events:
+            if isinstance(item, (yaml.SequenceStartEvent, yaml.MappingStartEvent)):
+                depth += 1
+            elif isinstance(item, (yaml.SequenceEndEvent, yaml.MappingEndEvent)):
+                depth -= 1
+                if depth == 0:
+                    return
+
+def iter_top_level(stream, skip_keys=(), stream_keys=()):
+    """逐个产出顶层键值 (键, 值, 是否为序列元素)
+
+    stream_keys 中的序列按元素逐个产出，skip_keys 中的值直接跳过不构建。
+    """
+    loader = YamlLoader('')
+    anchors = {}
+    events = yaml.parse(stream, Loader=YamlLoader)
+    try:
+        for event in events:
+            if isinstance(event, yaml.MappingStartEvent):
+                break
+        else:
+            return
+        for key_event in events:
+            if isinstance(key_event, yaml.MappingEndEvent):
+                return
+            key = _build(events, key_event, loader, anchors)
+            value_event = next(events)
+            if key in skip_keys:
+                _skip(events, value_event)
+            elif key in stream_keys and isinstance(value_event, yaml.SequenceStartEvent):
+                count = 0
+                for item_event in events:
+                    if isinstance(item_event, yaml.SequenceEndEvent):
+                        break
+                    count += 1
+                    yield key, _build(events, item_event, loader, anchors), True
+                if not count:
+                    yield key, [], False
+            else:
+                yield key, _build(events, value_event, loader, anchors), False
+    finally:
+        loader.dispose()
+
+def iter_sequence(stream, key):
+    """逐个产出顶层序列 key 的元素，例如 iter_sequence(f, 'proxies')"""
+    for name, value, is_item in iter_top_level(stream, stream_keys=(key,)):
+        if name == key and is_item:
+            yield value
+
+def load_yaml_streaming(stream, skip_keys=STREAM_SKIP_KEYS):
+    """基于事件流加载配置，跳过不需要的大段内容，避免构建完整节点树"""
+    config = {}
+    for key, value, is_item in iter_top_level(stream, skip_keys, ('proxies', 'proxy-groups')):
+        if is_item:
+            config.setdefault(key, []).append(value)
+        else:
+            config[key] = value
+    return config